@@ -19,8 +19,10 @@ fileConfig(config.config_file_name)
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from honey.core.database import ModelBase
-from honey.models.skus import ProductSku
-from honey.models.inventory import InventoryLocation
+from honey.models.skus import ContainerClosure, ProductSku, SkuPackCapacity
+from honey.models.inventory import InventoryLocation, StockTotal
+from honey.models.journal import ScanJournalCheckpoint
+from honey.models.movements import InventoryMovement, StockSnapshot
 target_metadata = ModelBase.metadata
 
 # other values from the config, defined by the needs of env.py,
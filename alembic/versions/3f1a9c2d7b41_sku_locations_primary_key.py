@@ -0,0 +1,44 @@
+"""sku_locations primary key is (location_id, sku_id)
+
+Revision ID: 3f1a9c2d7b41
+Revises:
+Create Date: 2026-10-18 09:12:40.118253
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a9c2d7b41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    # merge any duplicate location/sku records into the oldest record first
+    duplicates = conn.execute(sa.text(
+        "SELECT location_id, sku_id, SUM(quantity), MIN(id) FROM sku_locations "
+        "GROUP BY location_id, sku_id HAVING COUNT(*) > 1")).fetchall()
+    for location_id, sku_id, quantity, keep_id in duplicates:
+        params = {'location_id': location_id, 'sku_id': sku_id,
+                  'quantity': quantity, 'keep_id': keep_id}
+        conn.execute(sa.text(
+            "DELETE FROM sku_locations WHERE location_id = :location_id "
+            "AND sku_id = :sku_id AND id <> :keep_id"), params)
+        conn.execute(sa.text(
+            "UPDATE sku_locations SET quantity = :quantity WHERE id = :keep_id"),
+            params)
+    with op.batch_alter_table('sku_locations') as batch_op:
+        batch_op.drop_constraint('pk_sku_locations', type_='primary')
+        batch_op.drop_column('id')
+        batch_op.create_primary_key('pk_sku_locations', ['location_id', 'sku_id'])
+
+
+def downgrade():
+    op.drop_constraint('pk_sku_locations', 'sku_locations', type_='primary')
+    op.execute('ALTER TABLE sku_locations ADD COLUMN id SERIAL NOT NULL')
+    op.create_primary_key('pk_sku_locations', 'sku_locations',
+                          ['id', 'location_id', 'sku_id'])
@@ -0,0 +1,52 @@
+"""sku pack capacities
+
+Revision ID: 5b7d2e9a4c68
+Revises: 8c4e0b6f5a13
+Create Date: 2026-10-18 13:05:44.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from honey.core.database import UTCDateTime
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7d2e9a4c68'
+down_revision = '8c4e0b6f5a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('product_skus') as batch_op:
+        batch_op.add_column(sa.Column('unit_sku_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            op.f('fk_product_skus_unit_sku_id_product_skus'),
+            'product_skus', ['unit_sku_id'], ['id'])
+    op.create_table(
+        'sku_pack_capacities',
+        sa.Column('pack_sku_id', sa.Integer(), nullable=False),
+        sa.Column('unit_sku_id', sa.Integer(), nullable=False),
+        sa.Column('multiple', sa.Integer(), nullable=False),
+        sa.Column('created_at', UTCDateTime(timezone=True), nullable=True),
+        sa.Column('updated_on', UTCDateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['pack_sku_id'], ['product_skus.id'], ondelete='CASCADE',
+            name=op.f('fk_sku_pack_capacities_pack_sku_id_product_skus')),
+        sa.ForeignKeyConstraint(
+            ['unit_sku_id'], ['product_skus.id'], ondelete='CASCADE',
+            name=op.f('fk_sku_pack_capacities_unit_sku_id_product_skus')),
+        sa.PrimaryKeyConstraint('pack_sku_id', name=op.f('pk_sku_pack_capacities'))
+    )
+    op.create_index(op.f('ix_sku_pack_capacities_created_at'),
+                    'sku_pack_capacities', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_sku_pack_capacities_created_at'),
+                  table_name='sku_pack_capacities')
+    op.drop_table('sku_pack_capacities')
+    with op.batch_alter_table('product_skus') as batch_op:
+        batch_op.drop_constraint(
+            op.f('fk_product_skus_unit_sku_id_product_skus'), type_='foreignkey')
+        batch_op.drop_column('unit_sku_id')
@@ -0,0 +1,54 @@
+"""inventory movements
+
+Revision ID: 6e9b3c1f0d27
+Revises: d41f7a3b8e22
+Create Date: 2026-10-18 19:12:45.318760
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from honey.core.database import UTCDateTime
+
+
+# revision identifiers, used by Alembic.
+revision = '6e9b3c1f0d27'
+down_revision = 'd41f7a3b8e22'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'inventory_movements',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+                  autoincrement=True, nullable=False),
+        sa.Column('occurred_on', UTCDateTime(timezone=True), nullable=False),
+        sa.Column('location_id', sa.Integer(), nullable=False),
+        sa.Column('sku_id', sa.Integer(), nullable=False),
+        sa.Column('delta', sa.Integer(), nullable=False),
+        sa.Column('reason', sa.Unicode(), nullable=False),
+        sa.Column('actor', sa.Unicode(), nullable=True),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_inventory_movements'))
+    )
+    op.create_index(op.f('ix_inventory_movements_occurred_on'),
+                    'inventory_movements', ['occurred_on'], unique=False)
+    op.create_index('ix_inventory_movements_sku_id_occurred_on',
+                    'inventory_movements', ['sku_id', 'occurred_on'], unique=False)
+    op.create_index('ix_inventory_movements_location_id_occurred_on',
+                    'inventory_movements', ['location_id', 'occurred_on'], unique=False)
+    # the current quantities open the ledger
+    op.execute(
+        "INSERT INTO inventory_movements "
+        "(occurred_on, location_id, sku_id, delta, reason) "
+        "SELECT CURRENT_TIMESTAMP, location_id, sku_id, quantity, 'opening' "
+        "FROM sku_locations WHERE quantity > 0")
+
+
+def downgrade():
+    op.drop_index('ix_inventory_movements_location_id_occurred_on',
+                  table_name='inventory_movements')
+    op.drop_index('ix_inventory_movements_sku_id_occurred_on',
+                  table_name='inventory_movements')
+    op.drop_index(op.f('ix_inventory_movements_occurred_on'),
+                  table_name='inventory_movements')
+    op.drop_table('inventory_movements')
@@ -0,0 +1,37 @@
+"""scan journal checkpoints
+
+Revision ID: 8c4e0b6f5a13
+Revises: 3f1a9c2d7b41
+Create Date: 2026-10-18 10:41:07.502916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from honey.core.database import UTCDateTime
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4e0b6f5a13'
+down_revision = '3f1a9c2d7b41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'scan_journal_checkpoints',
+        sa.Column('station', sa.Unicode(), nullable=False),
+        sa.Column('segment', sa.Integer(), nullable=False),
+        sa.Column('offset', sa.Integer(), nullable=False),
+        sa.Column('created_at', UTCDateTime(timezone=True), nullable=True),
+        sa.Column('updated_on', UTCDateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('station', name=op.f('pk_scan_journal_checkpoints'))
+    )
+    op.create_index(op.f('ix_scan_journal_checkpoints_created_at'),
+                    'scan_journal_checkpoints', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_scan_journal_checkpoints_created_at'),
+                  table_name='scan_journal_checkpoints')
+    op.drop_table('scan_journal_checkpoints')
@@ -0,0 +1,45 @@
+"""stock snapshots
+
+Revision ID: 9a4d7e2b6c15
+Revises: 6e9b3c1f0d27
+Create Date: 2026-10-18 21:03:18.640275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from honey.core.database import UTCDateTime
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4d7e2b6c15'
+down_revision = '6e9b3c1f0d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'stock_snapshots',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('taken_at', UTCDateTime(timezone=True), nullable=False),
+        sa.Column('records', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_stock_snapshots')),
+        sa.UniqueConstraint('taken_at', name=op.f('uq_stock_snapshots_taken_at'))
+    )
+    op.create_table(
+        'stock_snapshot_rows',
+        sa.Column('snapshot_id', sa.Integer(), nullable=False),
+        sa.Column('location_id', sa.Integer(), nullable=False),
+        sa.Column('sku_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['snapshot_id'], ['stock_snapshots.id'], ondelete='CASCADE',
+            name=op.f('fk_stock_snapshot_rows_snapshot_id_stock_snapshots')),
+        sa.PrimaryKeyConstraint('snapshot_id', 'location_id', 'sku_id',
+                                name=op.f('pk_stock_snapshot_rows'))
+    )
+
+
+def downgrade():
+    op.drop_table('stock_snapshot_rows')
+    op.drop_table('stock_snapshots')
@@ -0,0 +1,53 @@
+"""product skus gtin
+
+Revision ID: a2c6f18e9d05
+Revises: 5b7d2e9a4c68
+Create Date: 2026-10-18 14:22:09.731554
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from honey.core.barcode import to_gtin14, InvalidBarcode
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2c6f18e9d05'
+down_revision = '5b7d2e9a4c68'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('product_skus', sa.Column('gtin', sa.Unicode(length=14), nullable=True))
+    product_skus = sa.table('product_skus', sa.column('id', sa.Integer),
+                            sa.column('upc', sa.Unicode), sa.column('gtin', sa.Unicode))
+    bind = op.get_bind()
+    gtins, invalid, duplicates = {}, [], []
+    for id, upc in bind.execute(sa.select([product_skus.c.id, product_skus.c.upc])):
+        try:
+            gtin = to_gtin14(upc)
+        except InvalidBarcode:
+            invalid.append(upc)
+            continue
+        if gtin is None:
+            continue
+        if gtin in gtins:
+            duplicates.append(upc)
+            continue
+        gtins[gtin] = id
+    if invalid or duplicates:
+        raise InvalidBarcode(
+            f'Fix these product_skus upcs before migrating, bad check digits: '
+            f'{invalid}, the same GTIN as another sku: {duplicates}')
+    if gtins:
+        bind.execute(
+            product_skus.update().where(product_skus.c.id == sa.bindparam('sku_id')
+                                        ).values(gtin=sa.bindparam('new_gtin')),
+            [{'sku_id': id, 'new_gtin': gtin} for gtin, id in gtins.items()])
+    op.create_index(op.f('ix_product_skus_gtin'), 'product_skus', ['gtin'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_product_skus_gtin'), table_name='product_skus')
+    with op.batch_alter_table('product_skus') as batch_op:
+        batch_op.drop_column('gtin')
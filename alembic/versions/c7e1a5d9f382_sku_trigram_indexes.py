@@ -0,0 +1,35 @@
+"""sku trigram indexes
+
+Revision ID: c7e1a5d9f382
+Revises: 9a4d7e2b6c15
+Create Date: 2026-10-18 23:26:51.907143
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e1a5d9f382'
+down_revision = '9a4d7e2b6c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # honey sku find falls back to an in-memory index without pg_trgm
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or not bind.exec_driver_sql(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'").scalar():
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_product_skus_sku_trgm '
+               'ON product_skus USING gin (lower(sku) gin_trgm_ops)')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_product_skus_description_trgm '
+               'ON product_skus USING gin (lower(description) gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP INDEX IF EXISTS ix_product_skus_description_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_product_skus_sku_trgm')
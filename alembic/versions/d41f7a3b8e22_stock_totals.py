@@ -0,0 +1,50 @@
+"""stock totals
+
+Revision ID: d41f7a3b8e22
+Revises: a2c6f18e9d05
+Create Date: 2026-10-18 15:47:31.084412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from honey.core.database import UTCDateTime
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f7a3b8e22'
+down_revision = 'a2c6f18e9d05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'stock_totals',
+        sa.Column('sku_id', sa.Integer(), nullable=False),
+        sa.Column('warehouse_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('created_at', UTCDateTime(timezone=True), nullable=True),
+        sa.Column('updated_on', UTCDateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['sku_id'], ['product_skus.id'], ondelete='CASCADE',
+            name=op.f('fk_stock_totals_sku_id_product_skus')),
+        sa.ForeignKeyConstraint(
+            ['warehouse_id'], ['warehouses.id'], ondelete='CASCADE',
+            name=op.f('fk_stock_totals_warehouse_id_warehouses')),
+        sa.PrimaryKeyConstraint('sku_id', 'warehouse_id', name=op.f('pk_stock_totals'))
+    )
+    op.create_index(op.f('ix_stock_totals_created_at'),
+                    'stock_totals', ['created_at'], unique=False)
+    op.execute(
+        'INSERT INTO stock_totals (sku_id, warehouse_id, quantity, created_at, updated_on) '
+        'SELECT sku_locations.sku_id, inventory_locations.warehouse_id, '
+        'SUM(sku_locations.quantity), CURRENT_TIMESTAMP, CURRENT_TIMESTAMP '
+        'FROM sku_locations JOIN inventory_locations '
+        'ON inventory_locations.id = sku_locations.location_id '
+        'GROUP BY sku_locations.sku_id, inventory_locations.warehouse_id '
+        'HAVING SUM(sku_locations.quantity) > 0')
+
+
+def downgrade():
+    op.drop_index(op.f('ix_stock_totals_created_at'), table_name='stock_totals')
+    op.drop_table('stock_totals')
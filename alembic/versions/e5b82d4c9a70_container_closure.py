@@ -0,0 +1,63 @@
+"""container closure
+
+Revision ID: e5b82d4c9a70
+Revises: c7e1a5d9f382
+Create Date: 2026-10-18 23:58:12.604391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b82d4c9a70'
+down_revision = 'c7e1a5d9f382'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('containers') as batch_op:
+        batch_op.add_column(sa.Column('units_per_parent', sa.Integer(), nullable=True))
+    op.create_table(
+        'container_closure',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.Column('multiple', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['ancestor_id'], ['containers.id'], ondelete='CASCADE',
+            name=op.f('fk_container_closure_ancestor_id_containers')),
+        sa.ForeignKeyConstraint(
+            ['descendant_id'], ['containers.id'], ondelete='CASCADE',
+            name=op.f('fk_container_closure_descendant_id_containers')),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id',
+                                name=op.f('pk_container_closure'))
+    )
+    op.create_index(op.f('ix_container_closure_descendant_id'),
+                    'container_closure', ['descendant_id'], unique=False)
+    # every container up to its top level container, which is its own parent. the
+    # existing containers have no units_per_parent yet, so multiples above depth 0
+    # are null. the path of visited ids stops the walk at an ancestor it already
+    # passed, so a cycle in the existing rows can't repeat a pair
+    op.execute(
+        "INSERT INTO container_closure (ancestor_id, descendant_id, depth, multiple) "
+        "WITH RECURSIVE walk (ancestor_id, descendant_id, depth, multiple, path) AS ("
+        "  SELECT id, id, 0, 1, '/' || CAST(id AS VARCHAR) || '/' FROM containers"
+        "  UNION ALL"
+        "  SELECT c.parent_id, walk.descendant_id, walk.depth + 1,"
+        "         walk.multiple * c.units_per_parent,"
+        "         walk.path || CAST(c.parent_id AS VARCHAR) || '/'"
+        "  FROM walk JOIN containers c ON c.id = walk.ancestor_id"
+        "  WHERE c.parent_id IS NOT NULL AND c.parent_id <> c.id"
+        "    AND c.parent_id <> walk.descendant_id"
+        "    AND walk.path NOT LIKE '%/' || CAST(c.parent_id AS VARCHAR) || '/%'"
+        ") SELECT ancestor_id, descendant_id, depth, multiple FROM walk")
+
+
+def downgrade():
+    op.drop_index(op.f('ix_container_closure_descendant_id'),
+                  table_name='container_closure')
+    op.drop_table('container_closure')
+    with op.batch_alter_table('containers') as batch_op:
+        batch_op.drop_column('units_per_parent')
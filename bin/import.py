@@ -1,3 +1,12 @@
 """
 Import the required initial data into the database from a spreadsheet template.
+
+This is a shortcut for `honey import <path> ...`, see honey.core.importer for the
+template layout.
 """
+import sys
+from honey.honey import main
+
+if __name__ == '__main__':
+    sys.argv = [sys.argv[0], 'import'] + sys.argv[1:]
+    main()
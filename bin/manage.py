@@ -5,6 +5,15 @@ from honey.models import (Warehouse, InventoryLocation, LocationSkuAssoc, Entity
                         Container, ProductSku, SkuAttribute)
 
 from honey.core.database import session
+from honey.core.skusearch import SkuSearch
+
+
+def suggest_skus(target_sku):
+    """Print the skus closest to a code which doesn't exist."""
+    matches = SkuSearch(session).find(target_sku, limit=5)
+    if matches:
+        print(f"Did you mean: {', '.join(match.sku for match in matches)}?")
+
 
 @click.group()
 def inv():
@@ -101,8 +110,9 @@ def delete_location(label, warehouse):
                     InventoryLocation.warehouse_id == transfer_warehouse_obj.id).first()
                 if transfer_location:
                     # transfer the inventory from original location to the new location
-                    for inst in original_location.skus:
-                        inst.update(location_id=transfer_location.id)
+                    LocationSkuAssoc.transfer(
+                        session, [original_location.id], transfer_location.id)
+                    session.commit()
                     print(f'Transferred inventory to {transfer_location} and deleted {original_location}')
                     return original_location.delete()
                 else:
@@ -117,8 +127,9 @@ def delete_location(label, warehouse):
                             InventoryLocation.label == transfer_label,
                             InventoryLocation.warehouse_id == transfer_warehouse_obj.id).first()
                         # transfer from original location to the new location
-                        for inst in original_location.skus:
-                            inst.update(location_id=transfer_location.id)
+                        LocationSkuAssoc.transfer(
+                            session, [original_location.id], transfer_location.id)
+                        session.commit()
                         print(
                             f'Transferred inventory to {transfer_location} and deleted {original_location}')
                         return original_location.delete()
@@ -177,8 +188,9 @@ def transfer_location(original_warehouse, original_label):
                     InventoryLocation.warehouse_id == transfer_warehouse_obj.id).first()
                 if transfer_location:
                     # transfer the inventory from original location to the new location
-                    for inst in original_location.skus:
-                        inst.update(location_id=transfer_location.id)
+                    LocationSkuAssoc.transfer(
+                        session, [original_location.id], transfer_location.id)
+                    session.commit()
                     return print(f'Transferred inventory to {transfer_location}')
                 else:
                     create_new_label = input(
@@ -192,8 +204,9 @@ def transfer_location(original_warehouse, original_label):
                             InventoryLocation.label == transfer_label,
                             InventoryLocation.warehouse_id == transfer_warehouse_obj.id).first()
                         # transfer from original location to the new location
-                        for inst in original_location.skus:
-                            inst.update(location_id=transfer_location.id)
+                        LocationSkuAssoc.transfer(
+                            session, [original_location.id], transfer_location.id)
+                        session.commit()
                         return print(
                             f'Transferred inventory to {transfer_location} and deleted {original_location}')
             return print('Transfer cancelled due to bad transfer label.')
@@ -231,6 +244,7 @@ def transfer_sku(original_warehouse, original_label):
             target_sku = input("Enter the SKU to transfer [Required]: ") or 'Required'
             target_sku_obj = session.query(ProductSku).filter_by(sku=target_sku).first()
             if not target_sku_obj:
+                suggest_skus(target_sku)
                 return print('Invalid target SKU. Transfer cancelled.')
             if target_sku_obj.id not in original_loc_sku_id_list:
                 return print('Target SKU not in location. Transfer cancelled.')
@@ -258,9 +272,10 @@ def transfer_sku(original_warehouse, original_label):
                     InventoryLocation.warehouse_id == transfer_warehouse_obj.id).first()
                 if transfer_location:
                     # transfer the target SKU from original location to the new location
-                    for inst in original_location.skus:
-                        if inst.sku.id == target_sku_obj.id:
-                            inst.update(location_id=transfer_location.id)
+                    LocationSkuAssoc.transfer(
+                        session, [original_location.id], transfer_location.id,
+                        sku_ids=[target_sku_obj.id])
+                    session.commit()
                     return print(f'Transferred {target_sku_obj.sku} to {transfer_location}')
                 else:
                     create_new_label = input(
@@ -275,9 +290,10 @@ def transfer_sku(original_warehouse, original_label):
                             InventoryLocation.label == transfer_label,
                             InventoryLocation.warehouse_id == transfer_warehouse_obj.id).first()
                         # transfer the target SKU from original location to the new location
-                        for inst in original_location.skus:
-                            if inst.sku.id == target_sku_obj.id:
-                                inst.update(location_id=transfer_location.id)
+                        LocationSkuAssoc.transfer(
+                            session, [original_location.id], transfer_location.id,
+                            sku_ids=[target_sku_obj.id])
+                        session.commit()
                         return print(
                             f'Transferred {target_sku_obj.sku} to {transfer_location}')
             return print('Transfer cancelled due to bad transfer label.')
@@ -317,6 +333,7 @@ def adjust_sku_qty(warehouse, label):
         target_sku = input(f"Enter the SKU targeted for quantity change [{[inst.sku.sku for inst in original_location.skus][0]}]: ") or f'{[inst.sku.sku for inst in original_location.skus][0]}'
         target_sku_obj = session.query(ProductSku).filter_by(sku=target_sku).first()
         if not target_sku_obj:
+            suggest_skus(target_sku)
             return print('Invalid target SKU. Transaction cancelled.')
         if target_sku_obj.id not in original_loc_sku_id_list:
             return print('Target SKU not in location. Transaction cancelled.')
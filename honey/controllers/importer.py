@@ -0,0 +1,66 @@
+from cement import Controller, ex
+from honey.core.importer import Importer, find_templates, TABLES, IMPORT_CHUNK_SIZE
+from tabulate import tabulate
+import sys
+import time
+
+
+class ImportController(Controller):
+    class Meta:
+        label = 'importer'
+        stacked_type = 'embedded'
+        stacked_on = 'base'
+
+    @ex(
+        label='import',
+        help='Import the initial data from csv or xlsx templates',
+        arguments=[
+            (['paths'],
+             {'help': f'honey import <path> [<path> ...], csv files named like a '
+                      f'table ({", ".join(TABLES)}), xlsx workbooks with sheets named '
+                      f'like a table, or directories of them',
+              'action': 'store',
+              'nargs': '+'}),
+            (['-b', '--chunk-size'],
+             {'default': IMPORT_CHUNK_SIZE,
+              'help': f'rows per bulk insert (default {IMPORT_CHUNK_SIZE})',
+              'action': 'store',
+              'dest': 'chunk_size'}),
+            (['--dry-run'],
+             {'help': 'validate the templates and roll back',
+              'action': 'store_true',
+              'dest': 'dry_run'}),
+        ],
+    )
+    def import_templates(self):
+        """
+        Import the templates in one transaction, see honey.core.importer for the
+        template columns. Existing records are skipped and any invalid row rolls
+        back the whole import.
+        """
+        templates = find_templates(self.app.pargs.paths)
+        if not templates:
+            return self.app.log.info('No templates were found.')
+        started = time.perf_counter()
+        importer = Importer(self.app.session, chunk_size=int(self.app.pargs.chunk_size))
+        try:
+            summaries = importer.run(templates)
+        except Exception:
+            self.app.session.rollback()
+            raise
+        if self.app.pargs.dry_run:
+            self.app.session.rollback()
+        else:
+            self.app.session.commit()
+        headers = ['table', 'inserted', 'skipped']
+        data = [list(summary) for summary in summaries]
+        try:
+            if self.app.__test__:
+                self.app.render(data, headers=headers, tablefmt="grid")
+        except AttributeError:
+            sys.stdout.write(tabulate(data, headers=headers, tablefmt="grid") + '\n')
+        elapsed = time.perf_counter() - started
+        if self.app.pargs.dry_run:
+            return self.app.log.info(f'The templates are valid, nothing was imported '
+                                     f'({elapsed:.1f} s).')
+        return self.app.log.info(f'Imported the templates in {elapsed:.1f} s.')
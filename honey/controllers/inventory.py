@@ -1,11 +1,20 @@
 from cement import Controller, ex
-from honey.core.database import session
-from honey.models.inventory import Warehouse, InventoryLocation, LocationSkuAssoc
-from honey.models.skus import ProductSku
-from honey.models.entities import Entity
+from honey.models.inventory import InventoryLocation
+from honey.models.skus import ContainerClosure, ProductSku, SkuPackCapacity
 from honey.core.exc import HoneyError
+from honey.core.resolver import IdentifierResolver
+from honey.core.context import get_active_context
+from honey.core.upcindex import UpcIndex
+from honey.core.scanbuffer import ScanBuffer
+from honey.core.journal import ScanJournal, replay
+from honey.core.ingest import ingest, normalize_code, switch_label
+from honey.core.stats import ScanStats
+from honey.core.barcode import InvalidBarcode
+from sqlalchemy.exc import OperationalError, InterfaceError
+from sqlalchemy.orm import aliased
 from tabulate import tabulate
 import sys
+import time
 
 
 class InventoryActionController(Controller):
@@ -18,8 +27,10 @@ class InventoryActionController(Controller):
         help='Scan inventory at an inventory location at a warehouse',
         arguments=[
             (['label'],
-             {'help': 'honey invloc scan <name> -a <action> -wh <warehouse> -e <entity>',
-              'action': 'store'}),
+             {'help': 'honey invloc scan <name> -a <action> -wh <warehouse> -e <entity>. '
+                      'optional, scan a location label like LOC:HG-1 to switch location',
+              'action': 'store',
+              'nargs': '?'}),
             (['-a', '--action'],
              {'help': 'action to take (increase, decrease)',
               'action': 'store',
@@ -37,104 +48,322 @@ class InventoryActionController(Controller):
              {'help': 'warehouse owner entity (a name or id)',
               'action': 'store',
               'dest': 'entity_id'}),
+            (['--shared-index'],
+             {'help': 'share the upc lookup index with other stations via redis',
+              'action': 'store_true',
+              'dest': 'shared_index'}),
+            (['-b', '--flush-every'],
+             {'default': 1,
+              'help': 'commit buffered scans every N scans (default 1, every scan)',
+              'action': 'store',
+              'dest': 'flush_every'}),
+            (['-t', '--flush-ms'],
+             {'help': 'commit buffered scans at least every T milliseconds',
+              'action': 'store',
+              'dest': 'flush_ms'}),
+            (['-j', '--journal'],
+             {'help': 'record every scan in the local scan journal before saving it',
+              'action': 'store_true',
+              'dest': 'journal'}),
+            (['--offline'],
+             {'help': 'only record scans in the local journal, replay them later',
+              'action': 'store_true',
+              'dest': 'offline'}),
+            (['-f', '--from-file'],
+             {'help': 'ingest a scan dump with one barcode per line, use - for stdin. '
+                      'commits every 10000 scans unless --flush-every is given',
+              'action': 'store',
+              'dest': 'from_file'}),
+            (['--stats-json'],
+             {'help': 'write the session latency percentiles to this json file',
+              'action': 'store',
+              'dest': 'stats_json'}),
         ],
     )
     def scan(self):
         """
         Scan inventory in a specific location, where location is a labeled container
-        holding inventory at a named unique Warehouse/Entity combination
+        holding inventory at a named unique Warehouse/Entity combination. Scanning a
+        location label of the warehouse, with or without a `LOC:` prefix, switches
+        the location for the following scans in the same session.
         """
         label = self.app.pargs.label
-        action = self.app.pargs.action
+        action = (self.app.pargs.action or '').lower()
         count = int(self.app.pargs.count)
+        flush_every = int(self.app.pargs.flush_every)
+        flush_ms = self.app.pargs.flush_ms and int(self.app.pargs.flush_ms)
+        from_file = self.app.pargs.from_file
+        if from_file and flush_every == 1:
+            flush_every = 10000
         ent_identifier = self.app.pargs.entity_id
-        if not label:
-            raise HoneyError('you must provide an inventory location label')
+        if action not in ('increase', 'decrease'):
+            raise HoneyError(f'The action {action} does not exist.')
         wh_identifier = self.app.pargs.wh_id
-        if wh_identifier and wh_identifier.isnumeric():
-            wh_obj = self.app.session.query(Warehouse).filter(
-                Warehouse.id == wh_identifier).first()
-        else:
-            wh_obj = self.app.session.query(Warehouse).filter(
-                Warehouse.name == wh_identifier).all()
-            # check if more than one wh_obj with the same name, must include entity
-            ent_obj = None
-            if all((wh_obj, len(wh_obj) > 1)):
-                # find the entity if it exists
-                if ent_identifier and ent_identifier.isnumeric():
-                    ent_obj = self.app.session.query(Entity).filter_by(
-                        id=ent_identifier).first()
-                elif ent_identifier:
-                    ent_obj = self.app.session.query(Entity).filter_by(
-                        name=ent_identifier).first()
-                if not ent_obj:
-                    raise HoneyError(
-                        'No Entity exists with the provided identifier')
-                wh_obj = self.app.session.query(Warehouse).filter(
-                    Warehouse.name == wh_identifier,
-                    Warehouse.entity_id == ent_obj.id
-                ).first()
-            # because you queried Warehouse with `all()` the wh_obj is probably a list
-            elif all((type(wh_obj) == list, len(wh_obj) == 1)):
-                wh_obj = wh_obj[0]
+        # a WarehouseRef(id, name, entity_id), usually without a query
+        resolver = IdentifierResolver(self.app)
+        wh_obj = resolver.warehouse(wh_identifier, ent_identifier)
+        context = None
+        if not wh_obj or not label:
+            context = get_active_context(self.app)
         if not wh_obj:
             message = f'The warehouse identifier does not exist. ' \
                       f'Using the active warehouse from cache.'
             # check the cache for an active warehouse
-            wh_obj = Warehouse.get_active_warehouse(self.app)
+            wh_obj = context and context.warehouse_ref
             if not wh_obj:
                 raise HoneyError(
                     'The warehouse does not exist. Please set an active '
                     'warehouse or use the flags to designate an existing warehouse')
             self.app.log.info(message)
-        location_obj = session.query(InventoryLocation).filter(
-            InventoryLocation.label == label,
-            InventoryLocation.warehouse_id == wh_obj.id).first()
-        if not location_obj:
-            raise HoneyError(
-                f"The label {label} does not exist in the {wh_obj.name} warehouse.")
-        self.app.log.info(f'{action} inventory at location: label={label}, '
-                          f'warehouse={wh_obj.name}')
-        while True:
-            ucc = input('Scan a UCC: ')
-            ucc = ucc.lower().strip().replace('\t', '').replace('\n', '')
-            if ucc.lower == 'exit':
-                break
-            # lookup the UCC to get the sku
-            sku_obj = self.app.session.query(ProductSku).filter(
-                ProductSku.upc == ucc).first()
-            if not sku_obj:
-                self.app.log.info(f'command {ucc} not recognized.')
-                break
-            loc_assoc_obj = self.app.session.query(LocationSkuAssoc).filter(
-                LocationSkuAssoc.sku_id == sku_obj.id,
-                LocationSkuAssoc.location_id == location_obj.id).first()
-
-            for _ in range(count):
-                if action.lower() == 'increase':
-                    self.app.log.info(f'You scanned {ucc} with + action {action}. This is a {sku_obj.description}')
-                    # does the association table object exist? If not then create it.
-                    if loc_assoc_obj:
-                        last_qty = loc_assoc_obj.quantity
-                        loc_assoc_obj.quantity = last_qty+1
-                    else:
-                        new_record = LocationSkuAssoc(sku_obj.id, location_obj.id, quantity=1)
-                        self.app.session.add(new_record)
-                elif action.lower() == 'decrease':
-                    self.app.log.info(f'You scanned {ucc} with - action {action}. This is a {sku_obj.description}')
-                    if loc_assoc_obj:
-                        last_qty = loc_assoc_obj.quantity
-                        if last_qty-1 == 0:
-                            self.app.session.delete(loc_assoc_obj)
-                        else:
-                            loc_assoc_obj.quantity = last_qty-1
-                    else:
-                        self.app.log.warning(f'No quantity of {sku_obj.sku} exists in {location_obj.label}.')
-                else:
-                    raise HoneyError(f'The action {action} does not exist.')
-            self.app.session.commit()
+        # start at the default location of the active context
+        if not label and context and context.location \
+                and context.warehouse_id == wh_obj.id:
+            label = context.location
+        if not label and from_file:
+            raise HoneyError('you must provide an inventory location label')
+        # every label of the warehouse, to switch locations without a query
+        locations = InventoryLocation.label_map(self.app.session, wh_obj.id)
+        labels = dict(locations.values())
+        location_id = None
+        if label:
+            if label.lower().strip() not in locations:
+                raise HoneyError(
+                    f"The label {label} does not exist in the {wh_obj.name} warehouse.")
+            location_id, label = locations[label.lower().strip()]
+            self.app.log.info(f'{action} inventory at location: label={label}, '
+                              f'warehouse={wh_obj.name}')
+        else:
+            self.app.log.info(f'{action} inventory at warehouse={wh_obj.name}, '
+                              f'scan a location label to start')
+        # resolve barcodes from memory instead of a query per scan
+        upc_index = UpcIndex(self.app, shared=self.app.pargs.shared_index).load()
+        scanned_skus = {}
+        journal = None
+        offline = self.app.pargs.offline
+        if self.app.pargs.journal or offline:
+            journal = ScanJournal.for_app(self.app)
+            if not offline:
+                # apply scans left in the journal by an earlier offline session,
+                # else the new checkpoint would skip over them
+                try:
+                    replayed = replay(self.app.session, journal)
+                    if replayed.scans:
+                        self.app.log.info(f'Replayed {replayed.scans} journaled scans.')
+                except (OperationalError, InterfaceError):
+                    self.app.session.rollback()
+                    offline = True
+            if offline:
+                self.app.log.warning(
+                    f'Scanning offline to the journal at {journal.directory}. '
+                    f'Run `honey invact replay` when the database is reachable.')
+
+        # per-phase latency histograms, reported when the session ends
+        stats = ScanStats()
+
+        def log_flush(summary):
+            stats.record('commit', summary.elapsed_ms / 1000)
+            if summary.offline:
+                self.app.log.warning(
+                    f'The database is unreachable, continuing offline. Scans are '
+                    f'saved in the journal at {journal.directory}. Run '
+                    f'`honey invact replay` when the database is reachable.')
+                return
+            for location_id, sku_id in summary.missing:
+                self.app.log.warning(f'No quantity of {scanned_skus[sku_id]} '
+                                     f'exists in {labels[location_id]}.')
+            if scan_buffer.buffered:
+                self.app.log.info(
+                    f'Saved {summary.scans} scans of {summary.skus} skus '
+                    f'(+{summary.units_in}/-{summary.units_out}) '
+                    f'in {summary.elapsed_ms:.1f} ms.')
+
+        scan_buffer = ScanBuffer(self.app.session, flush_every=flush_every,
+                                 flush_ms=flush_ms, on_flush=log_flush,
+                                 journal=journal, offline=offline)
+        if from_file:
+            return self._ingest_file(from_file, location_id, action, count,
+                                     upc_index, scan_buffer, stats, locations)
+        try:
+            while True:
+                try:
+                    ucc = input('Scan a UCC: ')
+                except EOFError:
+                    break
+                started = time.perf_counter()
+                ucc = normalize_code(ucc)
+                if ucc == 'exit':
+                    break
+                # a LOC: code or a location label switches the location, before
+                # the lookup so a label is never read as a barcode
+                switch_to = switch_label(ucc, locations)
+                if switch_to is not None:
+                    if switch_to not in locations:
+                        self.app.log.warning(f'The label {switch_to} does not exist '
+                                             f'in the {wh_obj.name} warehouse.')
+                        continue
+                    location_id, label = locations[switch_to]
+                    self.app.log.info(f'{action} inventory at location: '
+                                      f'label={label}, warehouse={wh_obj.name}')
+                    continue
+                # lookup the UCC to get the sku
+                try:
+                    with stats.timer('lookup'):
+                        sku_obj = upc_index.get(ucc)
+                except InvalidBarcode as e:
+                    # a bad read, rejected without a query, scan it again
+                    self.app.log.warning(f'{e.args[0]} Please scan it again.')
+                    continue
+                if not sku_obj:
+                    self.app.log.info(f'command {ucc} not recognized.')
+                    break
+                if location_id is None:
+                    self.app.log.warning(f'Scan a location label before {ucc}.')
+                    continue
+                scanned_skus[sku_obj.id] = sku_obj.sku
+                # a carton barcode counts all of its retail units
+                units = count * sku_obj.multiple
+                with stats.timer('log'):
+                    if sku_obj.multiple > 1:
+                        self.app.log.info(f'{ucc} is a carton of {sku_obj.multiple} '
+                                          f'{sku_obj.sku}')
+                    sign = '+' if action == 'increase' else '-'
+                    self.app.log.info(f'You scanned {ucc} with {sign} action {action}. '
+                                      f'This is a {sku_obj.description}')
+                # the write includes the flush when the flush policy is met
+                with stats.timer('write'):
+                    scan_buffer.add(location_id, sku_obj.id,
+                                    units if action == 'increase' else -units)
+                stats.record('scan', time.perf_counter() - started)
+                stats.scanned()
+        finally:
+            # write anything still buffered, including on ctrl-c
+            scan_buffer.close()
+            self._report_stats(stats)
         return self.app.log.info(f'Scan completed.')
 
+    def _ingest_file(self, from_file, location_id, action, count, upc_index,
+                     scan_buffer, stats, locations):
+        """
+        Stream a scan dump file, or stdin for '-', into the location. Location
+        labels in the dump switch the location.
+        """
+        delta = count if action == 'increase' else -count
+        reported = set()
+
+        def log_unknown(code):
+            # report each bad code once, a dump may repeat it many times
+            if code not in reported and len(reported) < 100:
+                reported.add(code)
+                self.app.log.warning(f'command {code} not recognized.')
+
+        stream = sys.stdin if from_file == '-' else open(from_file, encoding='utf-8')
+        try:
+            summary = ingest(stream, location_id, delta, upc_index, scan_buffer,
+                             on_unknown=log_unknown, locations=locations)
+        finally:
+            scan_buffer.close()
+            if stream is not sys.stdin:
+                stream.close()
+        stats.scanned(summary.scans)
+        self._report_stats(stats)
+        return self.app.log.info(
+            f'Ingested {summary.scans} scans from {summary.codes} codes '
+            f'({summary.unknown} not recognized) in {summary.elapsed:.2f} s, '
+            f'{summary.scans_per_sec:.0f} scans/sec.')
+
+    def _report_stats(self, stats):
+        """
+        Log the scan session throughput and latency percentiles, and write them to
+        the --stats-json file if given.
+        """
+        report = stats.report()
+        self.app.log.info(f"{report['scans']} scans in {report['elapsed_s']} s, "
+                          f"{report['scans_per_sec']} scans/sec.")
+        for name, phase in report['phases'].items():
+            self.app.log.info(f"{name}: n={phase['count']} p50={phase['p50_ms']} ms "
+                              f"p95={phase['p95_ms']} ms p99={phase['p99_ms']} ms")
+        if self.app.pargs.stats_json:
+            stats.write_json(self.app.pargs.stats_json)
+
+    @ex(
+        help='apply the scans recorded in the local scan journal to the database',
+        arguments=[
+            (['-s', '--station'],
+             {'help': 'scanner station name, defaults to the configured STATION_ID',
+              'action': 'store',
+              'dest': 'station'}),
+            (['-d', '--journal-dir'],
+             {'help': 'journal directory, defaults to the configured JOURNAL_DIR',
+              'action': 'store',
+              'dest': 'journal_dir'}),
+            (['-b', '--batch-size'],
+             {'default': 10000,
+              'help': 'scans applied per transaction',
+              'action': 'store',
+              'dest': 'batch_size'}),
+            (['--prune'],
+             {'help': 'delete journal segments which are fully applied',
+              'action': 'store_true',
+              'dest': 'prune'}),
+        ],
+    )
+    def replay(self):
+        """
+        Replay the scan journal from the station checkpoint. Every batch is saved
+        with the checkpoint in one transaction, so it is safe to run repeatedly.
+        usage: honey invact replay --station <station> --prune
+        """
+        journal = ScanJournal.for_app(self.app, station=self.app.pargs.station,
+                                      directory=self.app.pargs.journal_dir)
+
+        def log_batch(summary):
+            self.app.log.info(f'Applied {summary.scans} scans of {summary.skus} skus '
+                              f'up to journal position {tuple(summary.position)}.')
+
+        result = replay(self.app.session, journal,
+                        batch_size=int(self.app.pargs.batch_size), on_batch=log_batch)
+        if self.app.pargs.prune:
+            deleted = journal.prune(result.position)
+            self.app.log.info(f'Deleted {deleted} applied journal segments.')
+        return self.app.log.info(
+            f'Replay completed, {result.scans} scans applied for station '
+            f'{journal.station}.')
+
+    @ex(
+        help='list the unit multiples of carton level skus',
+        arguments=[
+            (['--rebuild'],
+             {'help': 'recompute the carton capacity table from the sku attributes '
+                      'and containers',
+              'action': 'store_true',
+              'dest': 'rebuild'}),
+        ],
+    )
+    def packs(self):
+        """
+        List every carton sku with the retail unit sku and quantity a scan of it
+        counts. Run with --rebuild after changing carton skus, their
+        retail-capacity/child-capacity attributes or the container units_per_parent.
+        usage: honey invact packs --rebuild
+        """
+        if self.app.pargs.rebuild:
+            ContainerClosure.rebuild(self.app.session)
+            cartons = SkuPackCapacity.rebuild(self.app.session)
+            self.app.session.commit()
+            self.app.log.info(f'Rebuilt the capacity table for {cartons} carton skus.')
+        unit = aliased(ProductSku)
+        data = [list(row) for row in self.app.session.query(
+            ProductSku.sku, ProductSku.upc, unit.sku, SkuPackCapacity.multiple
+        ).join(SkuPackCapacity, SkuPackCapacity.pack_sku_id == ProductSku.id
+               ).join(unit, unit.id == SkuPackCapacity.unit_sku_id
+                      ).order_by(ProductSku.sku)]
+        headers = ['carton sku', 'upc', 'unit sku', 'multiple']
+        try:
+            if self.app.__test__:
+                self.app.render(data, headers=headers, tablefmt="grid")
+        except AttributeError:
+            sys.stdout.write(tabulate(data, headers=headers, tablefmt="grid"))
+
     @ex(help='just run a query -> honey invact testquery')
     def testquery(self):
 
@@ -3,10 +3,18 @@ from honey.core.database import session
 from honey.models.inventory import Warehouse, InventoryLocation, LocationSkuAssoc
 from honey.models.skus import ProductSku
 from honey.models.entities import Entity
+from honey.models.movements import StockSnapshot
 from honey.core.exc import HoneyError
+from honey.models.profiles import profile
+from honey.core.resolver import IdentifierResolver
+from honey.core.context import active_warehouse
+from honey.utils import parse_time
 from tabulate import tabulate
 import sys
 
+# rows fetched per round trip by `invloc list`
+LIST_BATCH_SIZE = 1000
+
 
 class InventoryLocationController(Controller):
     class Meta:
@@ -14,11 +22,20 @@ class InventoryLocationController(Controller):
         stacked_type = 'nested'
         stacked_on = 'base'
 
-    # todo: optionally add a warehouse_identifier to filter locations by warehouse
-    @ex(help='invloc list')
+    @ex(
+        help='invloc list',
+        arguments=[
+            (['-w', '--warehouse'],
+             {'help': 'only list the locations at this warehouse (a name or id)',
+              'action': 'store',
+              'dest': 'wh_id'}),
+        ],
+    )
     def list(self):
         """
-        Render the inventory_locations table id's and names.
+        Render the inventory_locations table id's and names. The rows come from one
+        SELECT joining the warehouse and owner names, streamed in batches, so the
+        location objects and their sku records are never loaded.
 
         For jinja2 template output, this works:
         # wh = {}
@@ -31,15 +48,21 @@ class InventoryLocationController(Controller):
         [<Warehouse Garage>, <Warehouse Office>, <Warehouse Kitchen>, <Warehouse Bathroom>]
         {'result': {'1': 'Garage', '2': 'Office', '6': 'Kitchen', '7': 'Bathroom'}}
         """
-        inventory_locations = self.app.session.query(InventoryLocation).all()
+        rows = self.app.session.query(
+            InventoryLocation.id, InventoryLocation.label, Warehouse.name, Entity.name
+        ).join(Warehouse, Warehouse.id == InventoryLocation.warehouse_id).join(
+            Entity, Entity.id == Warehouse.entity_id).order_by(InventoryLocation.id)
+        wh_identifier = self.app.pargs.wh_id
+        if wh_identifier and wh_identifier.isnumeric():
+            rows = rows.filter(Warehouse.id == int(wh_identifier))
+        elif wh_identifier:
+            rows = rows.filter(Warehouse.name == wh_identifier)
         # for tabulate
         headers = ['#', 'id', 'label', 'warehouse', 'owner']
         data = []
-        count = 0
-        for record in inventory_locations:
-            count += 1
-            data.append([count, record.id, record.label, record.warehouse.name,
-                         record.warehouse.entity.name])
+        for count, (id, label, warehouse, owner) in enumerate(
+                rows.yield_per(LIST_BATCH_SIZE), start=1):
+            data.append([count, id, label, warehouse, owner])
         # it appears we need this try block for easiest testing of tabulate data
         # this is mainly because the output_handler = 'jinja2' in the main Honey app
         # while, we want to use tabulate as the output handler in many cases
@@ -81,37 +104,13 @@ class InventoryLocationController(Controller):
         if not label:
             raise HoneyError('you must provide an inventory location label')
         wh_identifier = self.app.pargs.wh_id
-        if wh_identifier and wh_identifier.isnumeric():
-            wh_obj = self.app.session.query(Warehouse).filter(
-                Warehouse.id == wh_identifier).first()
-        else:
-            wh_obj = self.app.session.query(Warehouse).filter(
-                Warehouse.name == wh_identifier).all()
-            # check if more than one wh_obj with the same name, must include entity
-            ent_obj = None
-            if all((wh_obj, len(wh_obj) > 1)):
-                # find the entity if it exists
-                if ent_identifier and ent_identifier.isnumeric():
-                    ent_obj = self.app.session.query(Entity).filter_by(
-                        id=ent_identifier).first()
-                elif ent_identifier:
-                    ent_obj = self.app.session.query(Entity).filter_by(
-                        name=ent_identifier).first()
-                if not ent_obj:
-                    raise HoneyError(
-                        'No Entity exists with the provided identifier')
-                wh_obj = self.app.session.query(Warehouse).filter(
-                    Warehouse.name == wh_identifier,
-                    Warehouse.entity_id == ent_obj.id
-                ).first()
-            # because you queried Warehouse with `all()` the wh_obj is probably a list
-            elif all((type(wh_obj) == list, len(wh_obj) == 1)):
-                wh_obj = wh_obj[0]
+        resolver = IdentifierResolver(self.app)
+        wh_obj = resolver.warehouse(wh_identifier, ent_identifier)
         if not wh_obj:
             message = f'The warehouse identifier does not exist. ' \
                       f'Using the active warehouse from cache.'
             # check the cache for an active warehouse
-            wh_obj = Warehouse.get_active_warehouse(self.app)
+            wh_obj = active_warehouse(self.app)
             if not wh_obj:
                 raise HoneyError(
                     'The warehouse does not exist. Please set an active '
@@ -192,21 +191,15 @@ class InventoryLocationController(Controller):
         wh_identifier = self.app.pargs.warehouse
         if len(loc_obj) > 1:
             wh_obj = None
+            resolver = IdentifierResolver(self.app)
             if wh_identifier:
-                if wh_identifier.isnumeric():
-                    wh_id = int(wh_identifier)
-                    wh_obj = self.app.session.query(Warehouse).filter(
-                        Warehouse.id == wh_id).first()
-                else:
-                    wh_obj = self.app.session.query(
-                        Warehouse).filter_by(name=wh_identifier).first()
+                wh_obj = resolver.warehouse(wh_identifier, ent_identifier)
                 if not wh_obj:
                     raise HoneyError('No warehouse exists with that identifier')
-                # todo: if two warehouse have the same name then this is bad
 
             # only go to this next block if the wh_identifier does not exist
             elif not wh_identifier:
-                wh_obj = Warehouse.get_active_warehouse(self.app)
+                wh_obj = active_warehouse(self.app)
                 # we assume label_identifier is a label name because if it is a
                 # database record ID then we would only have one record result.
                 # we only get to this block if there is more than one record result.
@@ -251,7 +244,7 @@ class InventoryLocationController(Controller):
     )
     def delete(self):
         identifier = self.app.pargs.identifier
-        wh_obj = Warehouse.get_active_warehouse(self.app)
+        wh_obj = active_warehouse(self.app)
         if not wh_obj:
             raise HoneyError("Set an active warehouse before deleting a location label")
         if identifier.isnumeric():
@@ -278,27 +271,156 @@ class InventoryLocationController(Controller):
         arguments=[
             (['identifier'],
              {'help': 'inventory location label or id',
-              'action': 'store'})
+              'action': 'store'}),
+            (['--as-of'],
+             {'help': 'show the contents at this past date or time, like 2026-09-30',
+              'action': 'store',
+              'dest': 'as_of'}),
         ],
     )
     def contents(self):
         identifier = self.app.pargs.identifier
-        wh_obj = Warehouse.get_active_warehouse(self.app)
+        wh_obj = active_warehouse(self.app)
         if not wh_obj:
             raise HoneyError("Set an active warehouse before retrieving contents of a location label")
+        query = self.app.session.query(InventoryLocation).options(*profile('contents'))
         if identifier.isnumeric():
             id = int(identifier)
-            invloc_obj = self.app.session.query(InventoryLocation).filter_by(id=id).first()
+            invloc_obj = query.filter_by(id=id).first()
         else:
-            invloc_obj = self.app.session.query(InventoryLocation).filter_by(
-                label=identifier, warehouse_id=wh_obj.id).first()
+            invloc_obj = query.filter_by(label=identifier, warehouse_id=wh_obj.id).first()
+        if invloc_obj and self.app.pargs.as_of:
+            quantities = StockSnapshot.as_of(
+                self.app.session, parse_time(self.app.pargs.as_of),
+                location_ids=[invloc_obj.id]).alias('quantities')
+            rows = self.app.session.query(
+                ProductSku.sku, ProductSku.description, quantities.c.quantity
+            ).join(quantities, quantities.c.sku_id == ProductSku.id).order_by(
+                ProductSku.sku)
+            for sku, description, quantity in rows:
+                self.app.log.info(f'{sku}, {description}, {quantity}')
+            return self.app.log.info(
+                f'Content output as of {self.app.pargs.as_of} complete.')
         if invloc_obj:
             # check to ensure there is no inventory in the location.
             if invloc_obj.skus:
                 for loc_sku_assoc in invloc_obj.skus:
                     # todo: give a summary output here instead of line-by-line
-                    self.app.log.info(f'{loc_sku_assoc.sku}, {loc_sku_assoc.quantity}')
+                    sku_obj = loc_sku_assoc.sku
+                    self.app.log.info(f'{sku_obj.sku}, {sku_obj.description}, '
+                                      f'{loc_sku_assoc.quantity}')
             return self.app.log.info('Content output complete.')
         else:
             return self.app.log.info(
                 f"An inventory location with identifier='{identifier}' does not exist.")
+
+    @ex(
+        help='move the skus of one or more locations into another location',
+        arguments=[
+            (['labels'],
+             {'help': 'honey invloc transfer <label> [<label> ...] -t <target label>',
+              'action': 'store',
+              'nargs': '+'}),
+            (['-t', '--to'],
+             {'help': 'the target location label',
+              'action': 'store',
+              'dest': 'target'}),
+            (['-w', '--warehouse'],
+             {'help': 'warehouse of the source locations (a name or id), '
+                      'default the active warehouse',
+              'action': 'store',
+              'dest': 'wh_id'}),
+            (['-e', '--entity'],
+             {'help': 'warehouse owner entity (a name or id)',
+              'action': 'store',
+              'dest': 'entity_id'}),
+            (['--to-warehouse'],
+             {'help': 'warehouse of the target location, default the source warehouse',
+              'action': 'store',
+              'dest': 'target_wh_id'}),
+            (['-k', '--sku'],
+             {'help': 'only move this sku, repeat for several skus',
+              'action': 'append',
+              'dest': 'skus'}),
+            (['--create'],
+             {'help': 'create the target location if it does not exist',
+              'action': 'store_true',
+              'dest': 'create'}),
+            (['--delete'],
+             {'help': 'delete the source locations after the transfer',
+              'action': 'store_true',
+              'dest': 'delete'}),
+        ],
+    )
+    def transfer(self):
+        """
+        Move all or the selected skus of the source locations into the target
+        location in one transaction, adding to the quantities the target already
+        holds. The records are moved with one merge and one delete statement.
+        """
+        target = self.app.pargs.target
+        if not target:
+            raise HoneyError('Provide the target location label with -t or --to')
+        resolver = IdentifierResolver(self.app)
+        wh_obj = resolver.warehouse(self.app.pargs.wh_id, self.app.pargs.entity_id) \
+            if self.app.pargs.wh_id else active_warehouse(self.app)
+        if not wh_obj:
+            raise HoneyError(
+                'The warehouse does not exist. Please set an active '
+                'warehouse or use the flags to designate an existing warehouse')
+        target_wh = wh_obj
+        if self.app.pargs.target_wh_id:
+            target_wh = resolver.warehouse(
+                self.app.pargs.target_wh_id, self.app.pargs.entity_id)
+            if not target_wh:
+                raise HoneyError('No warehouse exists with the target identifier')
+        labels = InventoryLocation.label_map(self.app.session, wh_obj.id)
+        source_ids = []
+        for label in self.app.pargs.labels:
+            if label.lower().strip() not in labels:
+                raise HoneyError(
+                    f"The label {label} does not exist in the {wh_obj.name} warehouse.")
+            source_ids.append(labels[label.lower().strip()][0])
+        created = False
+        target_labels = labels if target_wh.id == wh_obj.id else \
+            InventoryLocation.label_map(self.app.session, target_wh.id)
+        if target.lower().strip() in target_labels:
+            target_id = target_labels[target.lower().strip()][0]
+        elif self.app.pargs.create:
+            new_invloc = InventoryLocation(label=target, warehouse_id=target_wh.id)
+            self.app.session.add(new_invloc)
+            self.app.session.flush()
+            target_id = new_invloc.id
+            created = True
+        else:
+            raise HoneyError(
+                f"The label {target} does not exist in the {target_wh.name} "
+                f"warehouse, use --create to create it.")
+        sku_ids = None
+        if self.app.pargs.skus:
+            rows = self.app.session.query(ProductSku.id, ProductSku.sku).filter(
+                ProductSku.sku.in_(self.app.pargs.skus)).all()
+            unknown = set(self.app.pargs.skus) - {sku for _, sku in rows}
+            if unknown:
+                raise HoneyError(f"The skus {', '.join(sorted(unknown))} do not exist.")
+            sku_ids = [sku_id for sku_id, _ in rows]
+        summary = LocationSkuAssoc.transfer(
+            self.app.session, source_ids, target_id, sku_ids=sku_ids)
+        if self.app.pargs.delete:
+            sources = set(source_ids) - {target_id}
+            if self.app.session.query(LocationSkuAssoc.location_id).filter(
+                    LocationSkuAssoc.location_id.in_(sources)).first():
+                self.app.session.rollback()
+                raise HoneyError('refusing to delete the source locations because '
+                                 'they still have skus, nothing was transferred')
+            for location_id in sources:
+                self.app.session.delete(
+                    self.app.session.get(InventoryLocation, location_id))
+        self.app.session.commit()
+        if created:
+            self.app.log.info(f'Created the location {target} in the '
+                              f'{target_wh.name} warehouse.')
+        self.app.log.info(
+            f'Transferred {summary.units} units of {summary.skus} skus '
+            f'from {summary.records} records to {target} in the {target_wh.name} '
+            f'warehouse.')
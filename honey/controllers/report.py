@@ -0,0 +1,243 @@
+"""
+Stock on hand reports.
+
+Every report is one aggregated SELECT over the stock_totals table, grouped in the
+database, and the rows are streamed in batches straight to the output. No ORM
+objects are loaded, so a csv or jsonl report of any catalog size uses the same
+memory. The table format buffers the rows for tabulate and is meant for the
+terminal. With `--as-of` the totals at that time are computed from the nearest
+stock snapshot and the movements since, see honey.models.movements.
+"""
+import csv
+import json
+import sys
+from cement import Controller, ex
+from sqlalchemy import func, or_
+from sqlalchemy.orm import aliased
+from tabulate import tabulate
+from honey.core.exc import HoneyError
+from honey.utils import parse_time
+from honey.models.inventory import Warehouse, StockTotal
+from honey.models.skus import (Container, ContainerClosure, ProductSku, SkuAttribute,
+                               productsku_skuattr_assoc)
+from honey.models.entities import Entity
+
+# rows fetched per round trip while streaming a report
+REPORT_BATCH_SIZE = 1000
+
+REPORT_FORMATS = ('table', 'csv', 'jsonl')
+
+REPORT_ARGUMENTS = [
+    (['-f', '--format'],
+     {'help': 'the output format: table, csv or jsonl',
+      'action': 'store',
+      'choices': REPORT_FORMATS,
+      'default': 'table',
+      'dest': 'format'}),
+    (['-o', '--output'],
+     {'help': 'write the report to this file instead of stdout',
+      'action': 'store',
+      'dest': 'output'}),
+    (['--as-of'],
+     {'help': 'report the stock at this past date or time, like 2026-09-30T23:59',
+      'action': 'store',
+      'dest': 'as_of'}),
+]
+
+
+def stock_totals(session, at=None):
+    """
+    :param: at: a past time, default now
+    :return: the stock_totals table, or a subquery of the totals at the time with
+    the same sku_id, warehouse_id and quantity columns
+    """
+    if at is None:
+        return StockTotal.__table__
+    return StockTotal.as_of(session, at).alias('stock_totals_as_of')
+
+
+def stock_by_sku(session, at=None):
+    """:return: (query, headers) of the stock of every sku over all warehouses"""
+    totals = stock_totals(session, at)
+    query = session.query(
+        ProductSku.sku, ProductSku.description, Entity.name,
+        func.count(totals.c.warehouse_id), func.sum(totals.c.quantity)
+    ).join(totals, totals.c.sku_id == ProductSku.id).join(
+        Entity, Entity.id == ProductSku.entity_id).group_by(
+        ProductSku.id, ProductSku.sku, ProductSku.description, Entity.name
+    ).order_by(ProductSku.sku, ProductSku.id)
+    return query, ['sku', 'description', 'owner', 'warehouses', 'quantity']
+
+
+def stock_by_warehouse(session, at=None):
+    """:return: (query, headers) of the sku count and stock of every warehouse"""
+    totals = stock_totals(session, at)
+    query = session.query(
+        Warehouse.id, Warehouse.name, Entity.name,
+        func.count(totals.c.sku_id), func.sum(totals.c.quantity)
+    ).join(totals, totals.c.warehouse_id == Warehouse.id).join(
+        Entity, Entity.id == Warehouse.entity_id).group_by(
+        Warehouse.id, Warehouse.name, Entity.name).order_by(Warehouse.id)
+    return query, ['id', 'warehouse', 'owner', 'skus', 'quantity']
+
+
+def stock_by_entity(session, at=None):
+    """:return: (query, headers) of the stock of the skus owned by every entity"""
+    totals = stock_totals(session, at)
+    query = session.query(
+        Entity.id, Entity.name,
+        func.count(func.distinct(totals.c.sku_id)), func.sum(totals.c.quantity)
+    ).join(ProductSku, ProductSku.entity_id == Entity.id).join(
+        totals, totals.c.sku_id == ProductSku.id).group_by(
+        Entity.id, Entity.name).order_by(Entity.id)
+    return query, ['id', 'owner', 'skus', 'quantity']
+
+
+def stock_by_attribute(session, key, at=None):
+    """
+    :param: key: the SkuAttribute key, like 'family', 'class' or 'color'
+    :param: at: a past time, default now
+    :return: (query, headers) of the stock per value of the key, the skus without
+    a value for the key are grouped under an empty value
+    """
+    values = session.query(
+        productsku_skuattr_assoc.c.sku_id, SkuAttribute.value
+    ).join(SkuAttribute, SkuAttribute.id == productsku_skuattr_assoc.c.skuattr_id
+           ).filter(SkuAttribute.key == key).distinct().subquery()
+    totals = stock_totals(session, at)
+    query = session.query(
+        values.c.value,
+        func.count(func.distinct(totals.c.sku_id)), func.sum(totals.c.quantity)
+    ).select_from(totals).outerjoin(
+        values, values.c.sku_id == totals.c.sku_id).group_by(
+        values.c.value).order_by(values.c.value)
+    return query, [key, 'skus', 'quantity']
+
+
+def stock_in_cartons(session, container=None, at=None):
+    """
+    Roll the stock of every sku up to carton counts with one join on the
+    ContainerClosure.
+    :param: container: the name of the carton container, default the top level
+    container above the container of each sku
+    :param: at: a past time, default now
+    :return: (query, headers) of the full cartons and loose units of every sku,
+    the skus not packed in the carton or with an unknown multiple are left out
+    """
+    totals = stock_totals(session, at)
+    carton = aliased(Container)
+    quantity = func.sum(totals.c.quantity)
+    query = session.query(
+        ProductSku.sku, Entity.name, carton.name, ContainerClosure.multiple,
+        quantity, quantity / ContainerClosure.multiple,
+        quantity % ContainerClosure.multiple
+    ).join(totals, totals.c.sku_id == ProductSku.id).join(
+        Entity, Entity.id == ProductSku.entity_id).join(
+        ContainerClosure, ContainerClosure.descendant_id == ProductSku.container_id
+    ).join(carton, carton.id == ContainerClosure.ancestor_id).filter(
+        ContainerClosure.multiple.isnot(None))
+    if container:
+        query = query.filter(carton.name == container)
+    else:
+        query = query.filter(or_(carton.parent_id.is_(None),
+                                 carton.parent_id == carton.id))
+    query = query.group_by(
+        ProductSku.id, ProductSku.sku, Entity.name, carton.name, ContainerClosure.multiple
+    ).order_by(ProductSku.sku, ProductSku.id)
+    return query, ['sku', 'owner', 'carton', 'units per carton', 'quantity', 'cartons',
+                   'loose units']
+
+
+class ReportController(Controller):
+    class Meta:
+        label = 'report'
+        stacked_type = 'nested'
+        stacked_on = 'base'
+
+    @ex(help='stock on hand of every sku', arguments=REPORT_ARGUMENTS)
+    def sku(self):
+        self._write(*stock_by_sku(self.app.session, self._as_of()))
+
+    @ex(help='sku count and stock on hand of every warehouse',
+        arguments=REPORT_ARGUMENTS)
+    def warehouse(self):
+        self._write(*stock_by_warehouse(self.app.session, self._as_of()))
+
+    @ex(help='stock on hand of the skus of every owner entity',
+        arguments=REPORT_ARGUMENTS)
+    def entity(self):
+        self._write(*stock_by_entity(self.app.session, self._as_of()))
+
+    @ex(
+        help='stock on hand per value of a sku attribute',
+        arguments=[
+            (['key'],
+             {'help': 'honey report attr <key>, like family, class or color',
+              'action': 'store'}),
+        ] + REPORT_ARGUMENTS,
+    )
+    def attr(self):
+        self._write(*stock_by_attribute(self.app.session, self.app.pargs.key,
+                                        self._as_of()))
+
+    @ex(
+        help='stock on hand of every sku in full cartons and loose units',
+        arguments=[
+            (['-c', '--container'],
+             {'help': 'the carton container name, default the top level container',
+              'action': 'store',
+              'dest': 'container'}),
+        ] + REPORT_ARGUMENTS,
+    )
+    def cartons(self):
+        self._write(*stock_in_cartons(self.app.session, self.app.pargs.container,
+                                      self._as_of()))
+
+    def _as_of(self):
+        """:return: the parsed --as-of time or None"""
+        return self.app.pargs.as_of and parse_time(self.app.pargs.as_of)
+
+    def _write(self, query, headers):
+        """
+        Stream the report rows to the output file or stdout.
+        :param: query: the aggregated report query
+        :param: headers: the column names
+        """
+        rows = query.yield_per(REPORT_BATCH_SIZE)
+        fmt = self.app.pargs.format
+        path = self.app.pargs.output
+        if fmt == 'table':
+            data = [list(row) for row in rows]
+            try:
+                if self.app.__test__ and not path:
+                    return self.app.render(data, headers=headers, tablefmt="grid")
+            except AttributeError:
+                pass
+            return self._emit(path, tabulate(data, headers=headers, tablefmt="grid"))
+        try:
+            stream = open(path, 'w', encoding='utf-8', newline='') if path \
+                else sys.stdout
+        except OSError as e:
+            raise HoneyError(f'Cannot write the report to {path}: {e}')
+        try:
+            if fmt == 'csv':
+                writer = csv.writer(stream)
+                writer.writerow(headers)
+                for row in rows:
+                    writer.writerow(row)
+            else:
+                for row in rows:
+                    stream.write(json.dumps(dict(zip(headers, row)), default=str))
+                    stream.write('\n')
+        finally:
+            if path:
+                stream.close()
+        if path:
+            self.app.log.info(f'Wrote the report to {path}.')
+
+    def _emit(self, path, text):
+        if not path:
+            return sys.stdout.write(text)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(text)
+        self.app.log.info(f'Wrote the report to {path}.')
@@ -0,0 +1,79 @@
+from cement import Controller, ex
+from honey.core.exc import HoneyError
+from honey.core.upcindex import UpcIndex
+from honey.core.scanserver import ScanServer
+from sqlalchemy.orm import sessionmaker
+import asyncio
+import os
+
+
+class ScanServerController(Controller):
+    class Meta:
+        label = 'scanserver'
+        stacked_type = 'embedded'
+        stacked_on = 'base'
+
+    @ex(
+        help='Serve scan events from many scanner stations over a socket',
+        arguments=[
+            (['--host'],
+             {'default': '127.0.0.1',
+              'help': 'TCP host to listen on (default 127.0.0.1)',
+              'action': 'store',
+              'dest': 'host'}),
+            (['-p', '--port'],
+             {'default': 7070,
+              'help': 'TCP port to listen on (default 7070)',
+              'action': 'store',
+              'dest': 'port'}),
+            (['-s', '--socket'],
+             {'help': 'listen on this Unix socket path instead of TCP',
+              'action': 'store',
+              'dest': 'socket'}),
+            (['-b', '--flush-every'],
+             {'default': 500,
+              'help': 'write coalesced scans every N scans (default 500)',
+              'action': 'store',
+              'dest': 'flush_every'}),
+            (['-t', '--flush-ms'],
+             {'default': 1000,
+              'help': 'write coalesced scans at least every T milliseconds',
+              'action': 'store',
+              'dest': 'flush_ms'}),
+            (['--pool-size'],
+             {'default': 4,
+              'help': 'number of database writer connections (default 4)',
+              'action': 'store',
+              'dest': 'pool_size'}),
+        ],
+    )
+    def serve_scans(self):
+        """
+        Run the scan ingestion server until interrupted, stations send newline
+        delimited json scan events, see honey.core.scanserver
+        """
+        path = self.app.pargs.socket
+        if path and os.path.exists(path):
+            raise HoneyError(f'The socket {path} already exists.')
+        upc_index = UpcIndex(self.app, shared=True).load()
+        server = ScanServer(
+            sessionmaker(bind=self.app.session.get_bind()), upc_index,
+            flush_every=int(self.app.pargs.flush_every),
+            flush_ms=int(self.app.pargs.flush_ms),
+            pool_size=int(self.app.pargs.pool_size),
+            on_flush=lambda s: self.app.log.info(
+                f'wrote {s.scans} scans over {s.skus} skus in {s.elapsed_ms:.1f} ms'))
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(server.start(
+                host=self.app.pargs.host, port=int(self.app.pargs.port), path=path))
+            where = path or f'{self.app.pargs.host}:{self.app.pargs.port}'
+            self.app.log.info(f'serving scans on {where}')
+            loop.run_forever()
+        finally:
+            # Ctrl-C raises CaughtSignal out of run_forever, write what is pending
+            loop.run_until_complete(server.close())
+            loop.close()
+            if path and os.path.exists(path):
+                os.unlink(path)
@@ -2,5 +2,111 @@
 A module to manage skus (create, read, update, delete). To get started I just
 imported our HG skus into the database directly.
 """
+import sys
+import time
+from cement import Controller, ex
+from tabulate import tabulate
+from honey.core.facets import FacetIndex, parse_term
+from honey.core.skusearch import SkuSearch
+from honey.models.entities import Entity
+from honey.models.skus import ProductSku
 
 
+class SkuController(Controller):
+    class Meta:
+        label = 'sku'
+        stacked_type = 'nested'
+        stacked_on = 'base'
+
+    def _render(self, data, headers):
+        try:
+            if self.app.__test__:
+                self.app.render(data, headers=headers, tablefmt="grid")
+        except AttributeError:
+            sys.stdout.write(tabulate(data, headers=headers, tablefmt="grid") + '\n')
+
+    @ex(
+        help='find the skus by their attributes',
+        arguments=[
+            (['-a', '--attr'],
+             {'help': 'honey sku search --attr family=Grapple --attr color=white, '
+                      'the skus must have every --attr, comma separated values '
+                      'match any of them, like color=white,black',
+              'action': 'append',
+              'default': [],
+              'dest': 'attrs'}),
+            (['-x', '--not'],
+             {'help': 'the skus must not have this attribute, like connector=USB-C',
+              'action': 'append',
+              'default': [],
+              'dest': 'exclude'}),
+            (['-n', '--limit'],
+             {'help': 'show at most this many skus (default 50)',
+              'default': 50,
+              'action': 'store',
+              'dest': 'limit'}),
+            (['--shared-index'],
+             {'help': 'share the attribute index with other processes via redis',
+              'action': 'store_true',
+              'dest': 'shared_index'}),
+        ],
+    )
+    def search(self):
+        """
+        Answer the attribute query from the FacetIndex bitmaps, then load only the
+        skus which are shown.
+        """
+        terms = [parse_term(text) for text in self.app.pargs.attrs]
+        exclude = [key for text in self.app.pargs.exclude for key in parse_term(text)]
+        facets = FacetIndex(self.app, shared=self.app.pargs.shared_index).load()
+        started = time.perf_counter()
+        sku_ids = facets.search(terms, exclude)
+        elapsed = (time.perf_counter() - started) * 1e6
+        shown = sku_ids[:int(self.app.pargs.limit)]
+        rows = self.app.session.query(
+            ProductSku.sku, ProductSku.description, Entity.name
+        ).join(Entity, Entity.id == ProductSku.entity_id).filter(
+            ProductSku.id.in_(shown)).order_by(ProductSku.sku) if shown else []
+        headers = ['sku', 'description', 'owner']
+        self._render([list(row) for row in rows], headers=headers)
+        return self.app.log.info(f'{len(sku_ids)} skus match, {len(shown)} shown '
+                                 f'({elapsed:.0f} µs).')
+
+    @ex(
+        help='count the skus per attribute value',
+        arguments=[
+            (['key'],
+             {'help': 'honey sku facets [<key>], only count the values of the key',
+              'action': 'store',
+              'nargs': '?'}),
+        ],
+    )
+    def facets(self):
+        counts = FacetIndex(self.app).load().counts(self.app.pargs.key)
+        self._render([list(row) for row in counts], headers=['key', 'value', 'skus'])
+
+    @ex(
+        help='find skus by a partial or mistyped code or description',
+        arguments=[
+            (['text'],
+             {'help': 'honey sku find <text>, like grapl or "white grapple"',
+              'action': 'store'}),
+            (['-n', '--limit'],
+             {'help': 'show at most this many matches (default 10)',
+              'default': 10,
+              'action': 'store',
+              'dest': 'limit'}),
+        ],
+    )
+    def find(self):
+        """
+        Rank the skus by prefix and trigram similarity, see honey.core.skusearch.
+        """
+        search = SkuSearch(self.app.session)
+        started = time.perf_counter()
+        matches = search.find(self.app.pargs.text, limit=int(self.app.pargs.limit))
+        elapsed = (time.perf_counter() - started) * 1000
+        self._render([[match.sku, match.description, match.score] for match in matches],
+                     headers=['sku', 'description', 'score'])
+        return self.app.log.info(f'{len(matches)} matches ({search.backend}, '
+                                 f'{elapsed:.1f} ms).')
@@ -0,0 +1,74 @@
+from cement import Controller, ex
+from honey.core.resolver import IdentifierResolver
+from honey.core.snapshot import export_snapshot, import_snapshot
+from honey.core.upcindex import UpcIndex
+from tabulate import tabulate
+import sys
+import time
+
+
+class SnapshotController(Controller):
+    class Meta:
+        label = 'snapshot'
+        stacked_type = 'nested'
+        stacked_on = 'base'
+
+    def _render(self, data, headers):
+        try:
+            if self.app.__test__:
+                self.app.render(data, headers=headers, tablefmt="grid")
+        except AttributeError:
+            sys.stdout.write(tabulate(data, headers=headers, tablefmt="grid") + '\n')
+
+    @ex(
+        help='Export every honey table into a snapshot archive',
+        arguments=[
+            (['path'],
+             {'help': 'honey snapshot export <path>, the zip archive written',
+              'action': 'store'}),
+            (['-z', '--compress-level'],
+             {'default': 6,
+              'help': 'the deflate level, 0 (fastest) to 9 (smallest), default 6',
+              'action': 'store',
+              'dest': 'compress_level'}),
+        ],
+    )
+    def export(self):
+        started = time.perf_counter()
+        # the snapshot is read on its own connection, don't hold locks meanwhile
+        self.app.session.rollback()
+        manifest = export_snapshot(self.app.session.get_bind(), self.app.pargs.path,
+                                   compresslevel=int(self.app.pargs.compress_level))
+        self._render([[table['name'], table['rows']] for table in manifest['tables']],
+                     headers=['table', 'rows'])
+        elapsed = time.perf_counter() - started
+        return self.app.log.info(f'Exported the snapshot to {self.app.pargs.path} '
+                                 f'in {elapsed:.1f} s.')
+
+    @ex(
+        label='import',
+        help='Restore a snapshot archive, replacing the inventory records',
+        arguments=[
+            (['path'],
+             {'help': 'honey snapshot import <path>, an archive of snapshot export',
+              'action': 'store'}),
+            (['--replace'],
+             {'help': 'delete the existing records, the database must be empty '
+                      'otherwise',
+              'action': 'store_true',
+              'dest': 'replace'}),
+        ],
+    )
+    def import_snapshot(self):
+        started = time.perf_counter()
+        self.app.session.rollback()
+        summaries = import_snapshot(self.app.session.get_bind(), self.app.pargs.path,
+                                    replace=self.app.pargs.replace)
+        # the restored records were written around the session
+        self.app.session.expire_all()
+        IdentifierResolver(self.app).invalidate()
+        UpcIndex(self.app, shared=True).invalidate()
+        self._render([list(summary) for summary in summaries], headers=['table', 'rows'])
+        elapsed = time.perf_counter() - started
+        return self.app.log.info(f'Restored the snapshot {self.app.pargs.path} '
+                                 f'in {elapsed:.1f} s.')
@@ -0,0 +1,184 @@
+import sys
+from tabulate import tabulate
+from cement import Controller, ex
+from honey.models.inventory import (Warehouse, InventoryLocation, LocationSkuAssoc,
+                                    StockTotal)
+from honey.models.movements import InventoryMovement, StockSnapshot
+from honey.models.skus import ProductSku
+from honey.models.entities import Entity
+from honey.core.exc import HoneyError
+from honey.utils import parse_time
+
+
+class StockController(Controller):
+    class Meta:
+        label = 'stock'
+        stacked_type = 'nested'
+        stacked_on = 'base'
+
+    @ex(
+        help='show the stock on hand of a sku per warehouse',
+        arguments=[
+            (['sku'],
+             {'help': 'honey stock show <sku> -w <warehouse>',
+              'action': 'store'}),
+            (['-w', '--warehouse'],
+             {'help': 'only show this warehouse (a name or id)',
+              'action': 'store',
+              'dest': 'wh_id'}),
+        ],
+    )
+    def show(self):
+        """
+        Render the stock_totals of a sku, one primary key read per warehouse
+        instead of summing the quantity of every location.
+        """
+        sku = self.app.pargs.sku
+        rows = self.app.session.query(
+            ProductSku.sku, Warehouse.name, Entity.name, StockTotal.quantity
+        ).join(StockTotal, StockTotal.sku_id == ProductSku.id).join(
+            Warehouse, Warehouse.id == StockTotal.warehouse_id).join(
+            Entity, Entity.id == Warehouse.entity_id).filter(
+            ProductSku.sku == sku).order_by(Warehouse.name)
+        wh_identifier = self.app.pargs.wh_id
+        if wh_identifier and wh_identifier.isnumeric():
+            rows = rows.filter(Warehouse.id == int(wh_identifier))
+        elif wh_identifier:
+            rows = rows.filter(Warehouse.name == wh_identifier)
+        # for tabulate
+        headers = ['sku', 'warehouse', 'owner', 'quantity']
+        data = [list(row) for row in rows]
+        if not data:
+            self.app.log.info(f'There is no stock of {sku}.')
+        try:
+            if self.app.__test__:
+                self.app.render(data, headers=headers, tablefmt="grid")
+        except AttributeError:
+            sys.stdout.write(tabulate(data, headers=headers, tablefmt="grid"))
+
+    @ex(
+        help='show the quantity changes of a sku from the movement ledger',
+        arguments=[
+            (['sku'],
+             {'help': 'honey stock history <sku> -w <warehouse> -l <label>',
+              'action': 'store'}),
+            (['-w', '--warehouse'],
+             {'help': 'only show the locations of this warehouse (a name or id)',
+              'action': 'store',
+              'dest': 'wh_id'}),
+            (['-l', '--location'],
+             {'help': 'only show the location with this label',
+              'action': 'store',
+              'dest': 'label'}),
+            (['--since'],
+             {'help': 'only show the changes from this date or time, like 2026-09-30',
+              'action': 'store',
+              'dest': 'since'}),
+            (['-n', '--limit'],
+             {'help': 'show at most this many changes, the latest first (default 50)',
+              'default': 50,
+              'action': 'store',
+              'dest': 'limit'}),
+        ],
+    )
+    def history(self):
+        """
+        Render the latest movements of a sku, read newest first along the
+        (sku_id, occurred_on) index. Movements of deleted locations show no label.
+        """
+        sku_id = self.app.session.query(ProductSku.id).filter(
+            ProductSku.sku == self.app.pargs.sku).scalar()
+        if sku_id is None:
+            raise HoneyError(f'The sku {self.app.pargs.sku} does not exist.')
+        rows = self.app.session.query(
+            InventoryMovement.occurred_on, Warehouse.name, InventoryLocation.label,
+            InventoryMovement.delta, InventoryMovement.reason, InventoryMovement.actor
+        ).outerjoin(InventoryLocation,
+                    InventoryLocation.id == InventoryMovement.location_id).outerjoin(
+            Warehouse, Warehouse.id == InventoryLocation.warehouse_id).filter(
+            InventoryMovement.sku_id == sku_id)
+        wh_identifier = self.app.pargs.wh_id
+        if wh_identifier and wh_identifier.isnumeric():
+            rows = rows.filter(Warehouse.id == int(wh_identifier))
+        elif wh_identifier:
+            rows = rows.filter(Warehouse.name == wh_identifier)
+        if self.app.pargs.label:
+            rows = rows.filter(InventoryLocation.label == self.app.pargs.label)
+        if self.app.pargs.since:
+            rows = rows.filter(
+                InventoryMovement.occurred_on >= parse_time(self.app.pargs.since))
+        rows = rows.order_by(InventoryMovement.occurred_on.desc(),
+                             InventoryMovement.id.desc()).limit(int(self.app.pargs.limit))
+        # for tabulate
+        headers = ['time', 'warehouse', 'location', 'delta', 'reason', 'actor']
+        data = [[occurred_on.isoformat(timespec='seconds'), *values]
+                for occurred_on, *values in rows]
+        if not data:
+            self.app.log.info(f'There are no movements of {self.app.pargs.sku}.')
+        try:
+            if self.app.__test__:
+                self.app.render(data, headers=headers, tablefmt="grid")
+        except AttributeError:
+            sys.stdout.write(tabulate(data, headers=headers, tablefmt="grid"))
+
+    @ex(
+        help='store the location quantities at a time for past date queries',
+        arguments=[
+            (['--at'],
+             {'help': 'the snapshot date or time, like 2026-09-30T23:59, default now',
+              'action': 'store',
+              'dest': 'at'}),
+        ],
+    )
+    def snapshot(self):
+        """
+        Take a StockSnapshot, as of queries read the nearest earlier snapshot and
+        the movements since. Run it periodically, like at every month-end close.
+        """
+        at = self.app.pargs.at and parse_time(self.app.pargs.at)
+        snapshot = StockSnapshot.take(self.app.session, at)
+        self.app.session.commit()
+        return self.app.log.info(f'Took a snapshot of {snapshot.records} location sku '
+                                 f'records as of {snapshot.taken_at}.')
+
+    @ex(
+        help='fold the movements before a date into one per location and sku',
+        arguments=[
+            (['before'],
+             {'help': 'honey stock compact <date>, like 2026-01-01',
+              'action': 'store'}),
+        ],
+    )
+    def compact(self):
+        """
+        Compact the ledger, the quantities are unchanged but the history before
+        the date is reduced to one movement per location and sku. Stock as of an
+        earlier time is then answered at the snapshot times.
+        """
+        removed, kept = InventoryMovement.compact(
+            self.app.session, parse_time(self.app.pargs.before))
+        self.app.session.commit()
+        return self.app.log.info(f'Compacted {removed} movements into {kept}.')
+
+    @ex(
+        help='recompute the stock totals from the location quantities',
+        arguments=[
+            (['--locations'],
+             {'help': 'first project the location quantities from the movement ledger',
+              'action': 'store_true',
+              'dest': 'locations'}),
+        ],
+    )
+    def rebuild(self):
+        """
+        Recompute every stock total with one GROUP BY over sku_locations. The
+        totals are maintained on every change, this repairs them after changes
+        made outside of honey. With --locations the sku_locations table is first
+        projected from the inventory_movements ledger.
+        """
+        if self.app.pargs.locations:
+            records = LocationSkuAssoc.rebuild(self.app.session)
+            self.app.log.info(f'Projected {records} location sku records.')
+        totals = StockTotal.rebuild(self.app.session)
+        self.app.session.commit()
+        return self.app.log.info(f'Rebuilt {totals} stock totals.')
@@ -1,9 +1,12 @@
 import sys
 from tabulate import tabulate
 from cement import Controller, ex
-from honey.models.inventory import Warehouse
+from honey.models.inventory import Warehouse, InventoryLocation
 from honey.models.entities import Entity
 from honey.core.exc import HoneyError
+from honey.core.resolver import IdentifierResolver
+from honey.core.context import (ActiveContext, SCOPES, set_active_context,
+                                clear_active_context)
 
 
 class WarehouseController(Controller):
@@ -163,48 +166,66 @@ class WarehouseController(Controller):
         arguments=[
             (['identifier'],
              {'help': 'honey warehouse activate <identifier>',
-              'action': 'store'})
+              'action': 'store'}),
+            (['-e', '--entity'],
+             {'help': 'warehouse owner entity (a name or id)',
+              'action': 'store',
+              'dest': 'entity_id'}),
+            (['-l', '--location'],
+             {'help': 'a default location label for the scan commands',
+              'action': 'store',
+              'dest': 'location'}),
+            (['-s', '--scope'],
+             {'help': 'activate for every station (global), this station or '
+                      'this user, default global',
+              'action': 'store',
+              'choices': SCOPES,
+              'default': 'global',
+              'dest': 'scope'}),
         ],
         )
     def activate(self):
         """
-        Sets the active warehouse in redis cache. This cuts down redundant
+        Sets the active warehouse context in redis cache. This cuts down redundant
         commands in managing locations. It assumes the user is issuing
         multiple consecutive commands in working within the same warehouse.
         """
         identifier = self.app.pargs.identifier
-        try:
-            if self.app.__test__:
-                wh_cache_key = self.app.config.get('honeytest', 'WAREHOUSE_CACHE_KEY')
-        except AttributeError:
-            wh_cache_key = self.app.config.get('honey', 'WAREHOUSE_CACHE_KEY')
-        if identifier.isnumeric():
-            id = int(identifier)
-            wh_obj = self.app.session.query(Warehouse).filter_by(id=id).first()
-        else:
-            wh_obj = self.app.session.query(Warehouse).filter_by(
-                name=identifier).first()
-        if wh_obj:
-            self.deactivate()
-            self.app.cache.set(wh_cache_key, wh_obj.name)
-            self.app.log.info(
-                f"Activating warehouse '{wh_obj.name}' with id='{wh_obj.id}'.")
-        else:
-            self.app.log.info(
+        scope = self.app.pargs.scope
+        wh_obj = IdentifierResolver(self.app).warehouse(
+            identifier, self.app.pargs.entity_id)
+        if not wh_obj:
+            return self.app.log.info(
                 f"A warehouse with the identifier {identifier} does not exist.")
+        location_id = location = None
+        if self.app.pargs.location:
+            labels = InventoryLocation.label_map(self.app.session, wh_obj.id)
+            key = self.app.pargs.location.lower().strip()
+            if key not in labels:
+                raise HoneyError(f"The label {self.app.pargs.location} does not "
+                                 f"exist in the {wh_obj.name} warehouse.")
+            location_id, location = labels[key]
+        context = ActiveContext(*wh_obj, location_id, location)
+        set_active_context(self.app, context, scope)
+        self.app.log.info(
+            f"Activating warehouse '{wh_obj.name}' with id='{wh_obj.id}' "
+            f"for the {scope} scope"
+            + (f", default location '{location}'." if location else '.'))
 
     @ex(
-        help='clear active warehouse'
+        help='clear active warehouse',
+        arguments=[
+            (['-s', '--scope'],
+             {'help': 'the scope to clear (global, station or user), default global',
+              'action': 'store',
+              'choices': SCOPES,
+              'default': 'global',
+              'dest': 'scope'}),
+        ],
     )
     def deactivate(self):
-        try:
-            if self.app.__test__:
-                wh_cache_key = self.app.config.get('honeytest', 'WAREHOUSE_CACHE_KEY')
-        except AttributeError:
-            wh_cache_key = self.app.config.get('honey', 'WAREHOUSE_CACHE_KEY')
-        active_warehouse = self.app.cache.get(wh_cache_key)
-        if active_warehouse:
-            self.app.log.info(f"Deactivated warehouse '{active_warehouse}'.")
-            self.app.cache.delete(wh_cache_key)
+        context = clear_active_context(self.app, self.app.pargs.scope)
+        if context:
+            self.app.log.info(f"Deactivated warehouse '{context.warehouse}'.")
         else:
-            self.app.log.info(f"No active warehouse.")
\ No newline at end of file
+            self.app.log.info(f"No active warehouse.")
@@ -0,0 +1,221 @@
+"""
+An asyncio data access layer, to embed honey in a web backend.
+
+The commands use the synchronous engine and scoped session of
+honey.core.database, one connection per process. A web backend serves many
+concurrent requests from one event loop instead, so AsyncDatabase opens an
+AsyncEngine on the same DB_CONNECTION with the asyncio driver of the database,
+asyncpg for postgres and aiosqlite for sqlite, and hands out one AsyncSession
+per request from its pool. Neither driver is needed by the command line app.
+
+The lookups below are awaitable equivalents of the sync ones. Reads are plain
+`await session.execute()` queries. The writes call the sync model code through
+`AsyncSession.run_sync`, so the upserts, the StockTotal and ledger maintenance
+and the session events are the same code as in the commands, while their
+database round trips are awaited on the event loop.
+
+Usage::
+
+    db = AsyncDatabase()
+    async with db.session() as session:
+        warehouse = await get_warehouse(session, 'Garage', 'honeygear')
+        location = await get_location(session, warehouse.id, 'HG-1')
+        result = await apply_scans(session, location.id, ['850016398017'])
+        await session.commit()
+    await db.dispose()
+"""
+from collections import defaultdict, namedtuple
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from honey.core.barcode import InvalidBarcode, barcode_key
+from honey.core.database import conn
+from honey.core.exc import HoneyError
+from honey.core.ingest import normalize_code
+from honey.core.upcindex import UpcEntry, entry_query, match_keys
+from honey.models.entities import Entity
+from honey.models.inventory import InventoryLocation, LocationSkuAssoc, Warehouse
+from honey.models.movements import SCAN, StockSnapshot
+from honey.models.skus import ProductSku
+
+# the asyncio driver of each database
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+# what apply_scans() did, the number of resolved codes and skus, the codes which
+# resolve to no sku and the (location_id, sku_id) keys which could not be decreased
+ScanResult = namedtuple('ScanResult', ['scans', 'skus', 'unknown', 'missing'])
+
+
+def async_url(url):
+    """
+    :param: url: a database url, like the DB_CONNECTION of the config
+    :return: the url with the asyncio driver of its database, raise HoneyError
+    for a database without one
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise HoneyError(f'The async database layer does not support {backend}.')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+class AsyncDatabase:
+    """
+    An AsyncEngine and AsyncSession factory, create one per process.
+
+    :param: url: the database url, default the DB_CONNECTION of the config
+    :param: engine_kwargs: passed to create_async_engine, like pool_size
+    """
+
+    def __init__(self, url=None, **engine_kwargs):
+        self.url = async_url(url or conn)
+        try:
+            self.engine = create_async_engine(self.url, **engine_kwargs)
+        except ImportError:
+            raise HoneyError(f'Install {self.url.get_driver_name()} to use the async '
+                             f'database layer.')
+        self.session_factory = sessionmaker(self.engine, class_=AsyncSession,
+                                            expire_on_commit=False)
+
+    def session(self):
+        """:return: a new AsyncSession, use it as `async with db.session() as s:`"""
+        return self.session_factory()
+
+    async def dispose(self):
+        """Close the pooled connections."""
+        await self.engine.dispose()
+
+
+async def get_entity(session, identifier):
+    """
+    Like Entity.get_obj.
+    :param: session: the AsyncSession
+    :param: identifier: either a database record id or an Entity name
+    :return: Entity object or raise HoneyError
+    """
+    identifier = str(identifier)
+    column = Entity.id if identifier.isnumeric() else Entity.name
+    ent_obj = (await session.execute(
+        select([Entity]).where(column == identifier))).scalars().first()
+    if not ent_obj:
+        raise HoneyError('No Entity exists with the provided identifier')
+    return ent_obj
+
+
+async def get_warehouse(session, identifier, ent_identifier=None):
+    """
+    Like Warehouse.get_obj_with_entity, the entity is only required when several
+    warehouses have the same name.
+    :param: session: the AsyncSession
+    :param: identifier: either a warehouse record id or a Warehouse name
+    :param: ent_identifier: either an entity record id or an Entity name
+    :return: Warehouse object or raise HoneyError
+    """
+    if identifier is None:
+        raise HoneyError("You must provide a warehouse identifier")
+    identifier = str(identifier)
+    column = Warehouse.id if identifier.isnumeric() else Warehouse.name
+    warehouses = (await session.execute(select([Warehouse]).where(
+        column == identifier).order_by(Warehouse.id))).scalars().all()
+    if len(warehouses) > 1 or (warehouses and ent_identifier
+                               and not identifier.isnumeric()):
+        if not ent_identifier:
+            raise HoneyError(f"You must provide an entity identifier to find the "
+                             f"correct warehouse with name={identifier}")
+        entity = await get_entity(session, ent_identifier)
+        warehouses = [wh_obj for wh_obj in warehouses if wh_obj.entity_id == entity.id]
+    if not warehouses:
+        raise HoneyError('No warehouse exists with the provided identifier')
+    return warehouses[0]
+
+
+async def get_location(session, warehouse_id, identifier):
+    """
+    :param: session: the AsyncSession
+    :param: warehouse_id: the Warehouse id the label is in
+    :param: identifier: an inventory location label or id
+    :return: InventoryLocation object or None
+    """
+    identifier = str(identifier)
+    if identifier.isnumeric():
+        query = select([InventoryLocation]).where(
+            InventoryLocation.id == int(identifier))
+    else:
+        query = select([InventoryLocation]).where(
+            InventoryLocation.label == identifier,
+            InventoryLocation.warehouse_id == warehouse_id)
+    return (await session.execute(query)).scalars().first()
+
+
+async def location_contents(session, location_id, at=None):
+    """
+    Like `honey invloc contents`.
+    :param: session: the AsyncSession
+    :param: location_id: the InventoryLocation id
+    :param: at: a past time, default now
+    :return: a list of (sku, description, quantity) in sku order
+    """
+    if at is not None:
+        # the nearest snapshot is looked up with the sync session
+        quantities = (await session.run_sync(
+            StockSnapshot.as_of, at, [location_id])).alias('quantities')
+        query = select([ProductSku.sku, ProductSku.description, quantities.c.quantity]
+                       ).join(quantities, quantities.c.sku_id == ProductSku.id)
+    else:
+        query = select([ProductSku.sku, ProductSku.description,
+                        LocationSkuAssoc.quantity]).join(
+            LocationSkuAssoc, LocationSkuAssoc.sku_id == ProductSku.id).where(
+            LocationSkuAssoc.location_id == location_id)
+    return [tuple(row) for row in await session.execute(query.order_by(ProductSku.sku))]
+
+
+async def apply_deltas(session, deltas, reason=SCAN, actor=None):
+    """
+    Like LocationSkuAssoc.apply_deltas, the caller commits.
+    :param: session: the AsyncSession
+    :param: deltas: a dict like {(location_id, sku_id): signed quantity change}
+    :return: a list of (location_id, sku_id) keys which could not be decreased
+    """
+    # in key order so concurrent requests lock rows in the same order
+    return await session.run_sync(LocationSkuAssoc.apply_deltas,
+                                  dict(sorted(deltas.items())), reason, actor)
+
+
+def _apply_scans(session, location_id, codes, delta, actor):
+    """The sync part of apply_scans(), run with the sync session of the AsyncSession."""
+    keys = {}
+    for code in codes:
+        try:
+            keys[code] = barcode_key(code)
+        except InvalidBarcode:
+            keys[code] = None
+    wanted = {key for key in keys.values() if key}
+    entries = {key: UpcEntry(*values) for key, *values in entry_query(session).filter(
+        match_keys(wanted))} if wanted else {}
+    deltas = defaultdict(int)
+    unknown = []
+    for code in codes:
+        entry = entries.get(keys[code])
+        if entry is None:
+            unknown.append(code)
+        else:
+            deltas[(location_id, entry.id)] += delta * entry.multiple
+    missing = LocationSkuAssoc.apply_deltas(session, dict(sorted(deltas.items())),
+                                            SCAN, actor)
+    return ScanResult(len(codes) - len(unknown), len(deltas), unknown, missing)
+
+
+async def apply_scans(session, location_id, codes, delta=1, actor=None):
+    """
+    Resolve a batch of scanned barcodes with one query and apply their summed
+    quantity changes, a carton barcode counts its units. The caller commits.
+    :param: session: the AsyncSession
+    :param: location_id: the InventoryLocation id scanned into
+    :param: codes: the scanned barcodes
+    :param: delta: 1 to increase, -1 to decrease
+    :param: actor: who scanned, for the ledger, default the user and host
+    :return: a ScanResult(scans, skus, unknown, missing)
+    """
+    codes = [code for code in map(normalize_code, codes) if code]
+    return await session.run_sync(_apply_scans, location_id, codes, delta, actor)
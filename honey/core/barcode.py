@@ -0,0 +1,62 @@
+"""
+GTIN barcode normalization.
+
+The same item can be scanned as a UPC-A (12 digits), an EAN-13, a GTIN-14 from a
+case, or a GTIN-8. All of them are the same GTIN once left padded with zeros to
+14 digits, so ProductSku stores that canonical form in its indexed `gtin` column
+and every scanned code is normalized the same way before the lookup. A read with
+a bad check digit is rejected before it touches the database.
+
+Codes which are not numeric GTIN lengths, like internal sku codes, are not GTINs
+and are looked up as they are.
+"""
+from honey.core.exc import HoneyError
+
+GTIN_LENGTHS = (8, 12, 13, 14)
+
+
+class InvalidBarcode(HoneyError):
+    """A GTIN length numeric code with a bad check digit, usually a bad read."""
+    pass
+
+
+def gtin_check_digit(body):
+    """
+    Compute the GS1 mod 10 check digit.
+    :param: body: the GTIN digits without the check digit
+    :return: the check digit as an int
+    """
+    total = 0
+    # weights alternate 3, 1 from the rightmost digit of the body
+    for position, digit in enumerate(reversed(body)):
+        total += int(digit) * (3 if position % 2 == 0 else 1)
+    return (10 - total % 10) % 10
+
+
+def is_gtin(code):
+    """:return: True if the code has the shape of a GTIN, ignoring the check digit"""
+    return code.isdigit() and code.isascii() and len(code) in GTIN_LENGTHS
+
+
+def to_gtin14(code):
+    """
+    Normalize a scanned or stored code to the canonical GTIN-14.
+    :param: code: the code, surrounding whitespace is ignored
+    :return: the 14 digit GTIN, or None if the code is not a GTIN. Raise
+    InvalidBarcode if the check digit is wrong.
+    """
+    if code is None:
+        return None
+    code = code.strip()
+    if not is_gtin(code):
+        return None
+    if gtin_check_digit(code[:-1]) != int(code[-1]):
+        raise InvalidBarcode(f'The barcode {code} has a bad check digit.')
+    return code.zfill(14)
+
+
+def barcode_key(code):
+    """
+    :return: the key a code is indexed by, its GTIN-14 or else the code itself
+    """
+    return to_gtin14(code) or code
@@ -0,0 +1,125 @@
+"""
+The active warehouse context.
+
+`honey warehouse activate` stores the context most commands need, the active
+warehouse id, name and owner entity id and an optional default location, as a
+compact json record in the cache. Commands read it back without a query.
+
+A context is set for a scope:
+    global: every station and user, the WAREHOUSE_CACHE_KEY itself
+    station: this scanner station, named by STATION_ID or the host name
+    user: the current operating system user
+
+and the most specific scope which is set wins. Each record carries a version
+stamp, records written by another version are ignored. A plain warehouse name,
+as stored by older releases, is still resolved by name.
+"""
+import getpass
+import json
+import socket
+from collections import namedtuple
+from honey.core.resolver import IdentifierResolver, WarehouseRef
+from honey.utils import get_config
+
+CONTEXT_VERSION = 1
+
+# from the most to the least specific
+SCOPES = ('user', 'station', 'global')
+
+
+class ActiveContext(namedtuple('ActiveContext', [
+        'warehouse_id', 'warehouse', 'entity_id', 'location_id', 'location'],
+        defaults=(None, None))):
+    """
+    The active warehouse and default location of a scope.
+    """
+
+    @property
+    def warehouse_ref(self):
+        """:return: the WarehouseRef of the active warehouse"""
+        return WarehouseRef(self.warehouse_id, self.warehouse, self.entity_id)
+
+    def dumps(self):
+        """:return: the compact json record stored in the cache"""
+        record = {'v': CONTEXT_VERSION,
+                  'wh': [self.warehouse_id, self.warehouse, self.entity_id]}
+        if self.location_id is not None:
+            record['loc'] = [self.location_id, self.location]
+        return json.dumps(record, separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, value):
+        """
+        :param: value: a cached record
+        :return: an ActiveContext, or None if the record is of another version.
+        Raise ValueError if the value isn't a context record.
+        """
+        record = json.loads(value)
+        if not isinstance(record, dict):
+            raise ValueError('not a context record')
+        if record.get('v') != CONTEXT_VERSION:
+            return None
+        return cls(*record['wh'], *record.get('loc', (None, None)))
+
+
+def context_key(app, scope='global'):
+    """
+    :param: scope: one of SCOPES
+    :return: the cache key of the context of the scope
+    """
+    key = get_config(app, 'WAREHOUSE_CACHE_KEY')
+    if scope == 'global':
+        return key
+    if scope == 'station':
+        return f"{key}:station:{get_config(app, 'STATION_ID') or socket.gethostname()}"
+    if scope == 'user':
+        return f'{key}:user:{getpass.getuser()}'
+    raise ValueError(f'The context scope {scope} does not exist.')
+
+
+def read_context(app, scope):
+    """
+    :return: the ActiveContext set for the scope or None
+    """
+    value = app.cache.get(context_key(app, scope))
+    if not value:
+        return None
+    try:
+        return ActiveContext.loads(value)
+    except ValueError:
+        # a warehouse name stored by an older release
+        ref = IdentifierResolver(app).warehouse(value)
+        return ref and ActiveContext(*ref)
+
+
+def get_active_context(app):
+    """
+    :return: the ActiveContext of the most specific scope which is set, or None
+    """
+    for scope in SCOPES:
+        context = read_context(app, scope)
+        if context is not None:
+            return context
+    return None
+
+
+def set_active_context(app, context, scope='global'):
+    """Store the ActiveContext for the scope."""
+    app.cache.set(context_key(app, scope), context.dumps())
+
+
+def clear_active_context(app, scope='global'):
+    """
+    :return: the ActiveContext which was set for the scope, or None
+    """
+    context = read_context(app, scope)
+    app.cache.delete(context_key(app, scope))
+    return context
+
+
+def active_warehouse(app):
+    """
+    :return: the WarehouseRef of the active warehouse or None
+    """
+    context = get_active_context(app)
+    return context and context.warehouse_ref
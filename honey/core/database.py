@@ -15,9 +15,11 @@ import yaml
 import pendulum
 from sqlalchemy import (create_engine, Integer, Column, ForeignKey, MetaData,
                         TypeDecorator, DateTime)
+from sqlalchemy.dialects import postgresql, sqlite, mysql
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from sqlalchemy.orm import sessionmaker, scoped_session, relationship, backref
 from honey import config_file
+from honey.core.exc import HoneyError
 
 
 with open(config_file, 'r') as stream:
@@ -121,6 +123,7 @@ class SurrogatePK(object):
 class UTCDateTime(TypeDecorator):
 
     impl = DateTime
+    cache_ok = True
 
     def process_bind_param(self, value, dialect):
         """Way into the database."""
@@ -171,3 +174,57 @@ def reference_col(tablename, pk_name='id', fk_kwargs=None,
     return Column(
         ForeignKey('{0}.{1}'.format(tablename, pk_name), **fk_kwargs),
         **col_kwargs)
+
+
+def dialect_insert(bind, table):
+    """
+    Get the dialect specific INSERT construct for `table`, which supports upserts.
+    :param bind: a session, connection or engine
+    :param table: a Table or mapped class
+    :return: an Insert with `on_conflict_do_update` or `on_duplicate_key_update`
+    """
+    if hasattr(bind, 'get_bind'):
+        bind = bind.get_bind()
+    if hasattr(table, '__table__'):
+        table = table.__table__
+    dialect = bind.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    if dialect == 'mysql':
+        return mysql.insert(table)
+    raise HoneyError(f'upserts are not supported on the {dialect} database')
+
+
+def on_conflict_update(stmt, index_elements, values):
+    """
+    Make a dialect_insert() update the existing row when `index_elements` conflict.
+    :param stmt: an Insert from dialect_insert()
+    :param index_elements: the column names of the unique key
+    :param values: a dict of column name to the new value or SQL expression
+    :return: the upsert statement
+    """
+    if 'updated_on' in stmt.table.c and 'updated_on' not in values:
+        values = dict(values, updated_on=time_utcnow())
+    if hasattr(stmt, 'on_conflict_do_update'):
+        return stmt.on_conflict_do_update(index_elements=index_elements, set_=values)
+    return stmt.on_duplicate_key_update(values)
+
+
+def on_conflict_increment(stmt, index_elements, columns):
+    """
+    Make a dialect_insert() add to the existing row when `index_elements` conflict,
+    like `INSERT ... ON CONFLICT (location_id, sku_id) DO UPDATE SET
+    quantity = quantity + excluded.quantity`. The row is then created or
+    incremented in one statement, which is safe under concurrent writers.
+    :param stmt: an Insert from dialect_insert()
+    :param index_elements: the column names of the unique key
+    :param columns: the column names to increment by the inserted value
+    :return: the upsert statement
+    """
+    table = stmt.table
+    # postgres and sqlite call the proposed row `excluded`, mysql `inserted`
+    proposed = stmt.excluded if hasattr(stmt, 'excluded') else stmt.inserted
+    values = {col: table.c[col] + proposed[col] for col in columns}
+    return on_conflict_update(stmt, index_elements, values)
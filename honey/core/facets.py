@@ -0,0 +1,264 @@
+"""
+An in-memory faceted index of the ProductSku attributes.
+
+Filtering skus by several SkuAttributes, like all Grapple Pro in white with
+Micro-USB, costs a join through productskus_skuattrs per attribute. The
+FacetIndex holds one bitmap per (key, value), a python int with the bit of every
+sku id having that attribute set, so a query is a few AND, OR and NOT operations
+on ints of catalog size / 8 bytes and is answered in microseconds.
+
+Keys and values are matched case insensitively. Like the UpcIndex the index is
+loaded with a single query, or from the redis cache when it is shared, and the
+mapper events only mark the session. After the session commits, the skus which
+changed are refreshed in the live indexes on their next query with one query
+for just those skus, a renamed or deleted SkuAttribute reloads the whole index.
+"""
+import json
+import weakref
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from honey.core.exc import HoneyError
+from honey.models.skus import ProductSku, SkuAttribute, productsku_skuattr_assoc
+from honey.utils import get_config
+
+# rows fetched per round trip while loading the index
+FACET_BATCH_SIZE = 10000
+
+# every index which is alive in this process, used for invalidation
+_live_indexes = weakref.WeakSet()
+
+
+def facet(key, value):
+    """:return: the index key of an attribute, matched case insensitively"""
+    return key.strip().casefold(), value.strip().casefold()
+
+
+def parse_term(text):
+    """
+    Parse a command line facet term, values separated by a comma match any of them.
+    :param: text: like `family=Grapple` or `color=white,black`
+    :return: a list of facets, raise HoneyError if the text isn't `key=value`
+    """
+    key, sep, values = text.partition('=')
+    if not sep or not key.strip() or not values.strip():
+        raise HoneyError(f'{text} is not an attribute like key=value')
+    return [facet(key, value) for value in values.split(',') if value.strip()]
+
+
+def to_bitmap(sku_ids):
+    """:return: the bitmap of the sku ids, built in one pass over a bytearray"""
+    sku_ids = list(sku_ids)
+    if not sku_ids:
+        return 0
+    bits = bytearray((max(sku_ids) >> 3) + 1)
+    for sku_id in sku_ids:
+        bits[sku_id >> 3] |= 1 << (sku_id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def bit_ids(bitmap):
+    """:return: a generator of the sku ids set in a bitmap, in id order"""
+    bits = bin(bitmap)[:1:-1]
+    position = bits.find('1')
+    while position != -1:
+        yield position
+        position = bits.find('1', position + 1)
+
+
+def bit_count(bitmap):
+    """:return: the number of sku ids set in a bitmap"""
+    return bin(bitmap).count('1')
+
+
+class FacetIndex:
+    """
+    Map every (key, value) of the SkuAttributes to a bitmap of ProductSku ids.
+
+    Usage::
+
+        facets = FacetIndex(app, shared=True).load()
+        ids = facets.search([parse_term('family=Grapple'),
+                             parse_term('color=white,black')],
+                            exclude=[parse_term('connector=Micro-USB')])
+
+    :param: app: the current app, used for the session and redis cache
+    :param: shared: if True, read and publish the index through `app.cache`
+    """
+
+    def __init__(self, app, shared=False):
+        self.app = app
+        self.shared = shared
+        self.cache_key = get_config(app, 'FACET_INDEX_CACHE_KEY', 'honey-facet-index')
+        self.bitmaps = {}
+        # every sku id, for NOT
+        self.universe = 0
+        self.stale = True
+        # the sku ids changed since the index was loaded
+        self.pending = set()
+        _live_indexes.add(self)
+
+    def __len__(self):
+        return len(self.bitmaps)
+
+    def load(self):
+        """
+        Load the index from the shared cache if possible, else from the database.
+        :return: self, to allow `FacetIndex(app).load()`
+        """
+        loaded = self._load_from_cache() if self.shared else None
+        if loaded is None:
+            loaded = self._load_from_db()
+            if self.shared:
+                self._publish(*loaded)
+        self.universe, self.bitmaps = loaded
+        self.stale = False
+        self.pending = set()
+        return self
+
+    def refresh(self):
+        """Bring the index up to date, reload it if stale or refresh the changed skus."""
+        if self.stale:
+            self.load()
+        elif self.pending:
+            self._refresh_skus(self.pending)
+            self.pending = set()
+            if self.shared:
+                self._publish(self.universe, self.bitmaps)
+
+    def bitmap(self, key, value):
+        """:return: the bitmap of the skus with the attribute, 0 if none"""
+        self.refresh()
+        return self.bitmaps.get(facet(key, value), 0)
+
+    def match(self, terms, exclude=()):
+        """
+        :param: terms: a list of terms, each a list of facets, the skus must match
+        any facet of every term
+        :param: exclude: facets the skus must not have
+        :return: the bitmap of the matching skus
+        """
+        self.refresh()
+        result = self.universe
+        for term in terms:
+            matches = 0
+            for key in term:
+                matches |= self.bitmaps.get(key, 0)
+            result &= matches
+        for key in exclude:
+            result &= ~self.bitmaps.get(key, 0)
+        return result
+
+    def search(self, terms, exclude=()):
+        """
+        :return: a list of the matching sku ids in id order, see match()
+        """
+        return list(bit_ids(self.match(terms, exclude)))
+
+    def counts(self, key=None):
+        """
+        :param: key: only count the values of this key
+        :return: a sorted list of (key, value, number of skus)
+        """
+        self.refresh()
+        wanted = key and key.strip().casefold()
+        return sorted((facet_key, value, bit_count(bitmap))
+                      for (facet_key, value), bitmap in self.bitmaps.items()
+                      if wanted is None or facet_key == wanted)
+
+    def invalidate(self):
+        """Mark the index stale and drop the shared copy from the cache."""
+        self.stale = True
+        if self.shared:
+            self.app.cache.delete(self.cache_key)
+
+    def _query(self):
+        """:return: a query of (sku_id, key, value) of every sku attribute link"""
+        return self.app.session.query(
+            productsku_skuattr_assoc.c.sku_id, SkuAttribute.key, SkuAttribute.value
+        ).join(SkuAttribute, SkuAttribute.id == productsku_skuattr_assoc.c.skuattr_id
+               ).filter(SkuAttribute.key.isnot(None), SkuAttribute.value.isnot(None))
+
+    def _load_from_db(self):
+        universe = to_bitmap(sku_id for sku_id, in self.app.session.query(
+            ProductSku.id).yield_per(FACET_BATCH_SIZE))
+        facet_ids = {}
+        for sku_id, key, value in self._query().yield_per(FACET_BATCH_SIZE):
+            facet_ids.setdefault(facet(key, value), []).append(sku_id)
+        return universe, {key: to_bitmap(sku_ids) for key, sku_ids in facet_ids.items()}
+
+    def _refresh_skus(self, sku_ids):
+        """Reread the attributes of the changed skus, deleted skus drop out."""
+        keep = ~to_bitmap(sku_ids)
+        bitmaps = {key: bitmap & keep for key, bitmap in self.bitmaps.items()}
+        self.universe &= keep
+        for sku_id, in self.app.session.query(ProductSku.id).filter(
+                ProductSku.id.in_(sku_ids)):
+            self.universe |= 1 << sku_id
+        for sku_id, key, value in self._query().filter(
+                productsku_skuattr_assoc.c.sku_id.in_(sku_ids)):
+            index_key = facet(key, value)
+            bitmaps[index_key] = bitmaps.get(index_key, 0) | 1 << sku_id
+        self.bitmaps = {key: bitmap for key, bitmap in bitmaps.items() if bitmap}
+
+    def _load_from_cache(self):
+        cached = self.app.cache.get(self.cache_key)
+        if not cached:
+            return None
+        data = json.loads(cached)
+        return int(data['universe'], 16), {
+            (key, value): int(bitmap, 16) for key, value, bitmap in data['facets']}
+
+    def _publish(self, universe, bitmaps):
+        self.app.cache.set(self.cache_key, json.dumps({
+            'universe': format(universe, 'x'),
+            'facets': [[key, value, format(bitmap, 'x')]
+                       for (key, value), bitmap in bitmaps.items()]}))
+
+
+def _mark_sku_changed(mapper, connection, target):
+    # fires for relationship only changes too, like a sku_attrs append
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('facet_skus_changed', set()).add(target.id)
+
+
+def _mark_attribute_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['facet_index_stale'] = True
+
+
+def _mark_attribute_updated(mapper, connection, target):
+    # a sku link changed from this side makes the sku dirty too, only a renamed
+    # attribute reloads the index
+    state = inspect(target)
+    if state.attrs.key.history.has_changes() or state.attrs.value.history.has_changes():
+        _mark_attribute_changed(mapper, connection, target)
+
+
+def _refresh_after_commit(session):
+    stale = session.info.pop('facet_index_stale', False)
+    changed = session.info.pop('facet_skus_changed', set())
+    if not (stale or changed):
+        return
+    for facet_index in list(_live_indexes):
+        if stale:
+            facet_index.invalidate()
+        else:
+            # no SQL can be emitted here, the skus are reread on the next query
+            facet_index.pending |= changed
+            if facet_index.shared:
+                facet_index.app.cache.delete(facet_index.cache_key)
+
+
+def _forget_after_rollback(session, previous_transaction):
+    session.info.pop('facet_index_stale', None)
+    session.info.pop('facet_skus_changed', None)
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(ProductSku, _event_name, _mark_sku_changed)
+event.listen(SkuAttribute, 'after_update', _mark_attribute_updated)
+event.listen(SkuAttribute, 'after_delete', _mark_attribute_changed)
+event.listen(Session, 'after_commit', _refresh_after_commit)
+event.listen(Session, 'after_soft_rollback', _forget_after_rollback)
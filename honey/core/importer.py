@@ -0,0 +1,434 @@
+"""
+Bulk import of the initial configuration data from csv or xlsx templates.
+
+A template is a csv file named like its table, `entities.csv`, or a sheet named
+like its table in an xlsx workbook. The tables are imported in this order, with
+these columns:
+
+    entities: name
+    containers: name, description, parent (a container name, blank for a
+        top level container which is its own parent), units_per_parent
+        (optional, how many of the container its parent holds)
+    warehouses: name, entity
+    sku_attrs: key, value, entity
+    product_skus: sku, upc, description, entity, container, unit_sku (optional,
+        the sku one container level down), attributes (optional, like
+        `family=Grapple;color=White`)
+
+The rows are read as a stream, validated, and their entity, container, unit sku
+and attribute names resolved through in-memory maps of the existing records.
+Records which already exist are skipped, so a template can be imported again.
+New rows are inserted in chunks with one executemany INSERT per chunk, and the
+ids of a chunk are read back with one SELECT. Every row is validated before the
+transaction commits, any invalid row rolls back the whole import.
+"""
+import csv
+import pathlib
+from collections import namedtuple
+from sqlalchemy import bindparam, func, select, tuple_
+from honey.core.barcode import to_gtin14, InvalidBarcode
+from honey.core.exc import HoneyError
+from honey.models.entities import Entity
+from honey.models.inventory import Warehouse
+from honey.models.skus import (Container, ContainerClosure, ProductSku, SkuAttribute,
+                               SkuPackCapacity, productsku_skuattr_assoc)
+
+# in import order
+TABLES = ('entities', 'containers', 'warehouses', 'sku_attrs', 'product_skus')
+
+# rows per executemany INSERT
+IMPORT_CHUNK_SIZE = 5000
+
+# how many invalid rows are reported
+ERROR_LIMIT = 20
+
+ImportSummary = namedtuple('ImportSummary', ['table', 'inserted', 'skipped'])
+
+
+class RowError(ValueError):
+    """An invalid template row."""
+    pass
+
+
+def find_templates(paths):
+    """
+    :param: paths: csv files, xlsx workbooks or directories holding them
+    :return: a list of (table, path, sheet) in import order, sheet is None for csv
+    """
+    templates = []
+    for path in map(pathlib.Path, paths):
+        if not path.exists():
+            raise HoneyError(f'The template {path} does not exist.')
+        files = sorted(path.iterdir()) if path.is_dir() else [path]
+        for file in files:
+            suffix = file.suffix.lower()
+            if suffix == '.csv' and file.stem.lower() in TABLES:
+                templates.append((file.stem.lower(), file, None))
+            elif suffix == '.xlsx':
+                for sheet in _xlsx_sheets(file):
+                    if sheet.lower() in TABLES:
+                        templates.append((sheet.lower(), file, sheet))
+            elif not path.is_dir():
+                raise HoneyError(f'The template {file} is not a csv file named like '
+                                 f'a table ({", ".join(TABLES)}) or an xlsx workbook.')
+    return sorted(templates, key=lambda template: TABLES.index(template[0]))
+
+
+def read_rows(path, sheet=None):
+    """
+    Stream the rows of a template.
+    :return: an iterator of (row number, dict of lowercase column name to the
+    stripped value, blank values are None)
+    """
+    if sheet is None:
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            reader = csv.reader(stream)
+            yield from _rows(reader)
+        return
+    workbook = _open_workbook(path)
+    try:
+        yield from _rows(workbook[sheet].iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def _rows(rows):
+    rows = iter(rows)
+    header = next(rows, None) or []
+    columns = [str(name or '').strip().lower().replace(' ', '_') for name in header]
+    for number, values in enumerate(rows, start=2):
+        row = {}
+        for column, value in zip(columns, values):
+            value = None if value is None else str(value).strip()
+            row[column] = value or None
+        if any(row.values()):
+            yield number, row
+
+
+def _open_workbook(path):
+    try:
+        import openpyxl
+    except ImportError:
+        raise HoneyError('Install openpyxl to import xlsx templates, '
+                         'or save the sheets as csv files.')
+    return openpyxl.load_workbook(path, read_only=True, data_only=True)
+
+
+def _xlsx_sheets(path):
+    workbook = _open_workbook(path)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def _required(row, *columns):
+    missing = [column for column in columns if not row.get(column)]
+    if missing:
+        raise RowError(f'missing {", ".join(missing)}')
+    return [row[column] for column in columns]
+
+
+class Importer:
+    """
+    Import templates into the database in one transaction.
+
+    Usage::
+
+        importer = Importer(session)
+        summaries = importer.run(find_templates(['templates/']))
+        session.commit()
+
+    :param: session: the sqlalchemy session, the caller commits
+    :param: chunk_size: rows per executemany INSERT
+    """
+
+    def __init__(self, session, chunk_size=IMPORT_CHUNK_SIZE):
+        self.session = session
+        self.chunk_size = chunk_size
+        self.errors = []
+        self.entities = None
+        self.containers = None
+        self.attrs = None
+        self.skus = None
+        self.barcodes = None
+        # (sku id, (sku, entity id), unit sku) to link after every sku is imported
+        self.unit_skus = []
+
+    def run(self, templates):
+        """
+        :param: templates: a list of (table, path, sheet) from find_templates()
+        :return: a list of ImportSummary, raise HoneyError if any row is invalid
+        """
+        summaries = []
+        for table, path, sheet in templates:
+            source = f'{path.name}:{sheet}' if sheet else path.name
+            summaries.append(getattr(self, f'_import_{table}')(
+                read_rows(path, sheet), source))
+        # the bulk inserts bypass the mapper event which maintains the closure,
+        # the carton capacities below read it
+        if any(summary.inserted for summary in summaries
+               if summary.table == 'containers'):
+            ContainerClosure.rebuild(self.session)
+        if self.unit_skus:
+            self._link_unit_skus()
+        if self.errors:
+            shown = '\n'.join(self.errors[:ERROR_LIMIT])
+            raise HoneyError(f'{len(self.errors)} template rows are invalid, nothing '
+                             f'was imported:\n{shown}')
+        # the bulk statements bypass the mapper events which invalidate these
+        if any(summary.inserted for summary in summaries
+               if summary.table in ('entities', 'warehouses')):
+            self.session.info['resolver_stale'] = True
+        if any(summary.inserted for summary in summaries
+               if summary.table == 'product_skus') or self.unit_skus:
+            self.session.info['upc_index_stale'] = True
+        if any(summary.inserted for summary in summaries
+               if summary.table == 'product_skus'):
+            self.session.info['facet_index_stale'] = True
+            self.session.info['sku_search_stale'] = True
+        return summaries
+
+    def _chunks(self, table, rows, source, prepare, insert, chunk_size=None):
+        """
+        Validate the rows with `prepare` and insert the valid new ones in chunks.
+        :return: an ImportSummary
+        """
+        chunk_size = chunk_size or self.chunk_size
+        inserted = skipped = 0
+        chunk = []
+        for number, row in rows:
+            try:
+                values = prepare(row)
+            except RowError as e:
+                self.errors.append(f'{source} row {number}: {e}')
+                continue
+            if values is None:
+                skipped += 1
+                continue
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                inserted += self._insert(insert, chunk)
+                chunk = []
+        if chunk:
+            inserted += self._insert(insert, chunk)
+        return ImportSummary(table, inserted, skipped)
+
+    def _insert(self, insert, chunk):
+        # once a row is invalid nothing is committed, only validate the rest
+        if not self.errors:
+            insert(chunk)
+        return len(chunk)
+
+    def _load_entities(self):
+        if self.entities is None:
+            self.entities = dict(self.session.query(Entity.name, Entity.id))
+        return self.entities
+
+    def _entity_id(self, name):
+        if name not in self._load_entities():
+            raise RowError(f'the entity {name} does not exist')
+        return self.entities[name]
+
+    def _import_entities(self, rows, source):
+        self._load_entities()
+
+        def prepare(row):
+            name, = _required(row, 'name')
+            if name in self.entities:
+                return None
+            self.entities[name] = None
+            return {'name': name}
+
+        def insert(chunk):
+            table = Entity.__table__
+            self.session.execute(table.insert(), chunk)
+            self.entities.update(self.session.query(Entity.name, Entity.id).filter(
+                Entity.name.in_([values['name'] for values in chunk])))
+
+        return self._chunks('entities', rows, source, prepare, insert)
+
+    def _import_containers(self, rows, source):
+        """
+        Containers reference their parent by name, so they are inserted one row at
+        a time. A template holds a handful of container levels.
+        """
+        if self.containers is None:
+            self.containers = {}
+            for name, id in self.session.query(Container.name, Container.id).order_by(
+                    Container.id):
+                self.containers.setdefault(name, id)
+        table = Container.__table__
+
+        def prepare(row):
+            name, description = _required(row, 'name', 'description')
+            parent = row.get('parent') or name
+            if name in self.containers:
+                return None
+            if parent != name and parent not in self.containers:
+                raise RowError(f'the parent container {parent} does not exist, '
+                               f'list the parent containers first')
+            units_per_parent = row.get('units_per_parent') or None
+            if units_per_parent is not None:
+                try:
+                    units_per_parent = int(units_per_parent)
+                except ValueError:
+                    raise RowError(f'units_per_parent {units_per_parent} is not an '
+                                   f'integer')
+            self.containers[name] = None
+            return {'name': name, 'description': description, 'parent': parent,
+                    'units_per_parent': units_per_parent}
+
+        def insert(chunk):
+            for values in chunk:
+                parent = values.pop('parent')
+                if parent == values['name']:
+                    # a top level container is its own parent
+                    values['id'] = self._next_id(table)
+                    values['parent_id'] = values['id']
+                else:
+                    values['parent_id'] = self.containers[parent]
+                result = self.session.execute(table.insert(), values)
+                self.containers[values['name']] = \
+                    values.get('id') or result.inserted_primary_key[0]
+
+        return self._chunks('containers', rows, source, prepare, insert, chunk_size=1)
+
+    def _next_id(self, table):
+        """:return: an id for a row which references itself"""
+        if self.session.get_bind().dialect.name == 'postgresql':
+            return self.session.execute(select([func.nextval(
+                func.pg_get_serial_sequence(table.name, 'id'))])).scalar()
+        return (self.session.execute(select([func.max(table.c.id)])).scalar() or 0) + 1
+
+    def _import_warehouses(self, rows, source):
+        existing = set(self.session.query(Warehouse.name, Warehouse.entity_id))
+
+        def prepare(row):
+            name, entity = _required(row, 'name', 'entity')
+            key = (name, self._entity_id(entity))
+            if key in existing:
+                return None
+            existing.add(key)
+            return {'name': name, 'entity_id': key[1]}
+
+        def insert(chunk):
+            self.session.execute(Warehouse.__table__.insert(), chunk)
+
+        return self._chunks('warehouses', rows, source, prepare, insert)
+
+    def _load_attrs(self):
+        if self.attrs is None:
+            self.attrs = {(key, value, entity_id): id for id, key, value, entity_id in
+                          self.session.query(SkuAttribute.id, SkuAttribute.key,
+                                             SkuAttribute.value, SkuAttribute.entity_id)}
+        return self.attrs
+
+    def _import_sku_attrs(self, rows, source):
+        attrs = self._load_attrs()
+
+        def prepare(row):
+            key, value, entity = _required(row, 'key', 'value', 'entity')
+            attr = (key, value, self._entity_id(entity))
+            if attr in attrs:
+                return None
+            attrs[attr] = None
+            return {'key': key, 'value': value, 'entity_id': attr[2]}
+
+        def insert(chunk):
+            self.session.execute(SkuAttribute.__table__.insert(), chunk)
+            keys = [(values['key'], values['value'], values['entity_id'])
+                    for values in chunk]
+            for id, *attr in self.session.query(
+                    SkuAttribute.id, SkuAttribute.key, SkuAttribute.value,
+                    SkuAttribute.entity_id).filter(tuple_(
+                    SkuAttribute.key, SkuAttribute.value, SkuAttribute.entity_id).in_(
+                    keys)):
+                attrs[tuple(attr)] = id
+
+        return self._chunks('sku_attrs', rows, source, prepare, insert)
+
+    def _load_skus(self):
+        if self.skus is None:
+            self.skus, self.barcodes = {}, set()
+            for id, sku, entity_id, upc, gtin in self.session.query(
+                    ProductSku.id, ProductSku.sku, ProductSku.entity_id,
+                    ProductSku.upc, ProductSku.gtin):
+                self.skus[(sku, entity_id)] = id
+                self.barcodes.update(code for code in (upc, gtin) if code)
+        return self.skus
+
+    def _import_product_skus(self, rows, source):
+        skus = self._load_skus()
+        attrs = self._load_attrs()
+        if self.containers is None:
+            self.containers = dict(self.session.query(Container.name, Container.id))
+
+        def prepare(row):
+            sku, entity, container = _required(row, 'sku', 'entity', 'container')
+            entity_id = self._entity_id(entity)
+            if (sku, entity_id) in skus:
+                return None
+            if container not in self.containers:
+                raise RowError(f'the container {container} does not exist')
+            upc = row.get('upc')
+            try:
+                gtin = to_gtin14(upc)
+            except InvalidBarcode as e:
+                raise RowError(str(e))
+            for code in (upc, gtin):
+                if code and code in self.barcodes:
+                    raise RowError(f'the barcode {upc} already belongs to another sku')
+            attr_ids = []
+            for pair in (row.get('attributes') or '').split(';'):
+                if not pair.strip():
+                    continue
+                key, _, value = pair.partition('=')
+                attr = (key.strip(), value.strip(), entity_id)
+                if attr not in attrs:
+                    raise RowError(f'the sku attribute {key.strip()}={value.strip()} '
+                                   f'does not exist')
+                attr_ids.append(attrs[attr])
+            skus[(sku, entity_id)] = None
+            self.barcodes.update(code for code in (upc, gtin) if code)
+            return {'sku': sku, 'upc': upc, 'gtin': gtin,
+                    'description': row.get('description'), 'entity_id': entity_id,
+                    'container_id': self.containers[container],
+                    'unit_sku_id': None, 'attr_ids': attr_ids,
+                    'unit_sku': row.get('unit_sku')}
+
+        def insert(chunk):
+            extras = [(values.pop('attr_ids'), values.pop('unit_sku'))
+                      for values in chunk]
+            self.session.execute(ProductSku.__table__.insert(), chunk)
+            keys = [(values['sku'], values['entity_id']) for values in chunk]
+            for id, *key in self.session.query(
+                    ProductSku.id, ProductSku.sku, ProductSku.entity_id).filter(
+                    tuple_(ProductSku.sku, ProductSku.entity_id).in_(keys)):
+                skus[tuple(key)] = id
+            links = []
+            for key, (attr_ids, unit_sku) in zip(keys, extras):
+                links.extend({'sku_id': skus[key], 'skuattr_id': attr_id}
+                             for attr_id in attr_ids)
+                if unit_sku:
+                    self.unit_skus.append((skus[key], key, unit_sku))
+            if links:
+                self.session.execute(productsku_skuattr_assoc.insert(), links)
+
+        return self._chunks('product_skus', rows, source, prepare, insert)
+
+    def _link_unit_skus(self):
+        """Set the unit sku of the carton level skus and rebuild the pack capacities."""
+        params = []
+        for sku_id, (sku, entity_id), unit_sku in self.unit_skus:
+            unit_sku_id = self.skus.get((unit_sku, entity_id))
+            if unit_sku_id is None:
+                self.errors.append(f'the unit sku {unit_sku} of {sku} does not exist')
+                continue
+            params.append({'pack': sku_id, 'unit': unit_sku_id})
+        if params and not self.errors:
+            table = ProductSku.__table__
+            self.session.execute(table.update().where(
+                table.c.id == bindparam('pack')).values(unit_sku_id=bindparam('unit')),
+                params)
+            SkuPackCapacity.rebuild(self.session)
@@ -0,0 +1,149 @@
+"""
+Streaming, non-interactive scan ingestion.
+
+Handheld terminals export scan dumps with one barcode per line. Instead of
+feeding those through the `input()` prompt of `honey invact scan`, the dump is
+consumed as a generator pipeline::
+
+    read lines -> normalize -> resolve upcs per chunk -> sum deltas -> bulk write
+
+A `LOC:` code or a bare location label in the dump switches the location the
+following scans go to, like it does at the scan prompt.
+
+Nothing holds more than one chunk of lines in memory, and the summed deltas are
+bounded by the number of distinct skus, so a multi-million line file is ingested
+in constant memory.
+"""
+import itertools
+import time
+from collections import namedtuple
+
+IngestSummary = namedtuple(
+    'IngestSummary', ['codes', 'scans', 'unknown', 'elapsed', 'scans_per_sec'])
+
+# a scanned code like `LOC:HG-1` switches the scan session to that location label
+LOCATION_PREFIX = 'loc:'
+
+
+def normalize_code(raw):
+    """
+    Normalize a scanned code, shared by the scan prompt and file ingestion.
+    :param: raw: the scanned text
+    :return: the cleaned code, may be an empty string
+    """
+    return raw.lower().strip().replace('\t', '').replace('\n', '')
+
+
+def location_label(code):
+    """
+    :param: code: a normalized scanned code
+    :return: the location label of a `LOC:` code, else None
+    """
+    if code.startswith(LOCATION_PREFIX):
+        return code[len(LOCATION_PREFIX):].strip()
+    return None
+
+
+def switch_label(code, locations):
+    """
+    Checked before the upc lookup, so a label is never queried as a barcode or
+    rejected for a bad check digit.
+    :param: code: a normalized scanned code
+    :param: locations: the label map of the warehouse, see InventoryLocation.label_map
+    :return: the label a `LOC:` code or a bare location label switches to, else None
+    """
+    label = location_label(code)
+    if label is None and code in locations:
+        label = code
+    return label
+
+
+def read_codes(stream):
+    """
+    :param: stream: a file object of scanned codes, one per line
+    :return: a generator of normalized, non empty codes
+    """
+    for line in stream:
+        code = normalize_code(line)
+        if code:
+            yield code
+
+
+def chunked(iterable, size):
+    """
+    :return: a generator of lists with up to `size` items from `iterable`
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def resolve_chunks(codes, upc_index, chunk_size=5000, skip=None):
+    """
+    Resolve the codes against the upc index, one chunk at a time.
+    :param: skip: optional callable, the codes it is true for aren't looked up
+    :return: a generator of (code, UpcEntry or None)
+    """
+    for chunk in chunked(codes, chunk_size):
+        resolved = upc_index.get_many(
+            [code for code in chunk if not skip(code)] if skip else chunk)
+        for code in chunk:
+            yield code, resolved.get(code)
+
+
+def ingest(stream, location_id, delta, upc_index, scan_buffer, chunk_size=5000,
+           on_unknown=None, locations=None):
+    """
+    Ingest a stream of scanned codes into a location. The scan buffer sums the
+    deltas per sku and writes them in bulk per its flush policy.
+    :param: stream: a file object of scanned codes, one per line
+    :param: location_id: the InventoryLocation id to scan into, until a location
+    label switches it
+    :param: delta: the signed quantity per scan, like 1 or -1, carton barcodes
+    are multiplied by their unit multiple
+    :param: upc_index: a loaded UpcIndex
+    :param: scan_buffer: the ScanBuffer to write through, the caller closes it
+    :param: chunk_size: codes resolved per lookup chunk
+    :param: on_unknown: optional callable receiving each unrecognized code
+    :param: locations: the label map of the warehouse, to switch locations
+    :return: IngestSummary
+    """
+    started = time.perf_counter()
+    scans = unknown = 0
+    locations = locations or {}
+    counted = _Counted(read_codes(stream))
+
+    def is_label(code):
+        return switch_label(code, locations) is not None
+
+    for code, entry in resolve_chunks(counted, upc_index, chunk_size, skip=is_label):
+        label = switch_label(code, locations)
+        if label is not None and label in locations:
+            location_id = locations[label][0]
+            continue
+        if entry is None:
+            unknown += 1
+            if on_unknown:
+                on_unknown(code)
+            continue
+        scan_buffer.add(location_id, entry.id, delta * entry.multiple)
+        scans += 1
+    elapsed = time.perf_counter() - started
+    return IngestSummary(counted.count, scans, unknown, elapsed,
+                         scans / elapsed if elapsed else 0.0)
+
+
+class _Counted:
+    """Wrap an iterator to count the items which passed through it."""
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.iterable:
+            self.count += 1
+            yield item
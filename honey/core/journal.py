@@ -0,0 +1,226 @@
+"""
+A crash-safe, append-only local journal of scan events.
+
+When a scanner station runs on a laptop at a remote location, a dropped database
+connection during `honey invact scan` would lose the scan. With the journal
+enabled every scan event is appended, flushed and fsync'd to a local segment
+file before it is applied to the database, and `honey invact replay` streams the
+journal to the database in large batches once connectivity returns.
+
+Journal layout, one directory per station::
+
+    <JOURNAL_DIR>/<station>/scans-000001.jsonl
+    <JOURNAL_DIR>/<station>/scans-000002.jsonl
+
+Each line is a json scan event like
+`{"ts": "2020-06-01T10:22:01+00:00", "location_id": 4, "sku_id": 12, "delta": 1}`.
+A segment is rotated when it grows past `segment_bytes`. Positions in the journal
+are (segment, byte offset) tuples, and the ScanJournalCheckpoint table stores
+the position applied per station in the same transaction as the quantities, so
+replay is idempotent. Replayed movements are recorded in the ledger at the time
+of their scan, not the time of the replay.
+"""
+import json
+import os
+import pathlib
+import socket
+from collections import namedtuple, defaultdict
+import pendulum
+from cement.core.interface import minimal_logger
+from honey.core.database import time_utcnow
+from honey.models.inventory import LocationSkuAssoc
+from honey.models.journal import ScanJournalCheckpoint
+from honey.utils import get_config
+
+JournalPosition = namedtuple('JournalPosition', ['segment', 'offset'])
+
+ReplaySummary = namedtuple('ReplaySummary', ['scans', 'skus', 'position'])
+
+SEGMENT_PREFIX = 'scans-'
+SEGMENT_SUFFIX = '.jsonl'
+
+logger = minimal_logger(namespace='honey')
+
+
+class ScanJournal:
+    """
+    Append scan events to fsync'd, size rotated segment files.
+
+    :param: directory: the journal directory for this station
+    :param: station: the scanner station name, used for the db checkpoint
+    :param: segment_bytes: rotate to a new segment past this size
+    :param: fsync: fsync after every append, disable only for tests/benchmarks
+    """
+
+    def __init__(self, directory, station, segment_bytes=8 * 1024 * 1024, fsync=True):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.station = station
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._file = None
+        self._segment = None
+
+    @classmethod
+    def for_app(cls, app, station=None, directory=None):
+        """
+        Open the journal configured for the app, `JOURNAL_DIR` and `STATION_ID`
+        in the honey config, defaulting to ~/.honey/journal and the host name.
+        :param: app: the current app
+        :param: station: override the configured station name
+        :param: directory: override the configured journal directory
+        :return: ScanJournal
+        """
+        station = station or get_config(app, 'STATION_ID') or socket.gethostname()
+        directory = directory or get_config(
+            app, 'JOURNAL_DIR', pathlib.Path.home() / '.honey' / 'journal')
+        return cls(pathlib.Path(directory).expanduser() / station, station)
+
+    def segments(self):
+        """
+        :return: a sorted list of (segment number, path) for the journal files
+        """
+        segments = []
+        for path in self.directory.glob(f'{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}'):
+            number = path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+            if number.isnumeric():
+                segments.append((int(number), path))
+        return sorted(segments)
+
+    def segment_path(self, number):
+        return self.directory / f'{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}'
+
+    def _open_segment(self):
+        segments = self.segments()
+        number = segments[-1][0] if segments else 1
+        if segments:
+            self._truncate_torn_tail(segments[-1][1])
+            if segments[-1][1].stat().st_size >= self.segment_bytes:
+                number += 1
+        self._segment = number
+        self._file = open(self.segment_path(number), 'ab')
+
+    @staticmethod
+    def _truncate_torn_tail(path, chunk_size=64 * 1024):
+        """
+        Cut a torn last line, from a crash in the middle of an append, back to the
+        end of the last complete line, so the next append starts a new line.
+        """
+        with open(path, 'r+b') as stream:
+            end = stream.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - chunk_size)
+                stream.seek(start)
+                newline = stream.read(position - start).rfind(b'\n')
+                if newline != -1:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                logger.warning(f'Truncating a torn scan event at the end of {path}.')
+                stream.truncate(position)
+                stream.flush()
+                os.fsync(stream.fileno())
+
+    def append(self, location_id, sku_id, delta):
+        """
+        Durably append a scan event.
+        :return: the JournalPosition just past the event
+        """
+        if self._file is None:
+            self._open_segment()
+        elif self._file.tell() >= self.segment_bytes:
+            self._file.close()
+            self._segment += 1
+            self._file = open(self.segment_path(self._segment), 'ab')
+        event = {'ts': time_utcnow().isoformat(), 'location_id': location_id,
+                 'sku_id': sku_id, 'delta': delta}
+        self._file.write(json.dumps(event).encode('utf-8') + b'\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        return JournalPosition(self._segment, self._file.tell())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read(self, position=(0, 0)):
+        """
+        Stream the events after a position. A torn last line, from a crash in
+        the middle of an append, is not yielded and an undecodable line is logged
+        and skipped.
+        :param: position: a (segment, offset) to start after
+        :return: a generator of (event dict, JournalPosition after the event)
+        """
+        start_segment, start_offset = position
+        for number, path in self.segments():
+            if number < start_segment:
+                continue
+            with open(path, 'rb') as stream:
+                if number == start_segment:
+                    stream.seek(start_offset)
+                for line in stream:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        logger.warning(f'Skipping an undecodable scan event in {path}: '
+                                       f'{line[:200]!r}')
+                        continue
+                    yield event, JournalPosition(number, stream.tell())
+
+    def prune(self, position):
+        """
+        Delete the segments which are entirely before an applied position.
+        :return: the number of deleted segment files
+        """
+        deleted = 0
+        for number, path in self.segments():
+            if number < position[0]:
+                path.unlink()
+                deleted += 1
+        return deleted
+
+
+def replay(session, journal, batch_size=10000, on_batch=None):
+    """
+    Apply the journal to the database from the station checkpoint. Each batch is
+    summed per (location_id, sku_id) and written with the checkpoint in one
+    transaction, so an interrupted replay can simply be run again. The ledger
+    records each summed change at the time of the last journaled scan of its key
+    in the batch.
+    :param: session: the sqlalchemy session
+    :param: journal: the ScanJournal to replay
+    :param: batch_size: scan events per transaction
+    :param: on_batch: optional callable receiving a ReplaySummary per batch
+    :return: ReplaySummary for the whole replay
+    """
+    checkpoint = ScanJournalCheckpoint.position(session, journal.station)
+    total_scans, total_skus, position = 0, 0, checkpoint
+    deltas, scanned_on, scans = defaultdict(int), {}, 0
+
+    def apply_batch():
+        LocationSkuAssoc.apply_deltas(session, deltas, actor=journal.station,
+                                      occurred_on=scanned_on)
+        ScanJournalCheckpoint.advance(session, journal.station, position)
+        session.commit()
+        if on_batch:
+            on_batch(ReplaySummary(scans, len(deltas), position))
+
+    for event, position in journal.read(checkpoint):
+        key = (event['location_id'], event['sku_id'])
+        deltas[key] += event['delta']
+        scanned_on[key] = pendulum.parse(event['ts'])
+        scans += 1
+        if scans >= batch_size:
+            apply_batch()
+            total_scans, total_skus = total_scans + scans, total_skus + len(deltas)
+            deltas, scanned_on, scans = defaultdict(int), {}, 0
+    if scans:
+        apply_batch()
+        total_scans, total_skus = total_scans + scans, total_skus + len(deltas)
+    return ReplaySummary(total_scans, total_skus, position)
@@ -0,0 +1,221 @@
+"""
+Resolve warehouse and entity identifiers to ids.
+
+Commands take a warehouse or entity as a name or a record id, and resolving one
+used to cost up to four queries per command. The IdentifierResolver answers from
+an in-process LRU first, then from a redis hash shared by every honey process,
+and only queries the database on a miss of both.
+
+The entries are invalidated whenever a Warehouse or Entity row is inserted,
+updated or deleted. Like the UpcIndex, the mapper events only mark the session,
+the LRU is cleared and the redis hash deleted after the session commits. Other
+processes drop their LRU entries after RESOLVER_LRU_SECONDS at the latest.
+"""
+import json
+import time
+from collections import OrderedDict, namedtuple
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from honey.core.exc import HoneyError
+from honey.models.entities import Entity
+from honey.models.inventory import Warehouse
+from honey.utils import get_config
+
+# what a warehouse identifier resolves to, enough for most commands to skip
+# loading the Warehouse object
+WarehouseRef = namedtuple('WarehouseRef', ['id', 'name', 'entity_id'])
+
+# how many identifiers the in-process LRU remembers
+RESOLVER_LRU_SIZE = 1024
+# how long an in-process entry is trusted without checking redis again, this
+# bounds how long a change committed by another process can go unnoticed
+RESOLVER_LRU_SECONDS = 60
+# how long the shared redis hash lives without any change
+RESOLVER_CACHE_SECONDS = 24 * 3600
+
+
+class LruCache:
+    """
+    A small LRU mapping with a time to live per entry.
+
+    :param: maxsize: the number of entries kept, the least recently used is dropped
+    :param: ttl: seconds an entry is returned for after it was set
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, fallback=None):
+        item = self.entries.get(key)
+        if item is None:
+            return fallback
+        value, expires = item
+        if expires < time.monotonic():
+            del self.entries[key]
+            return fallback
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+# shared by every resolver in the process
+_local = LruCache(RESOLVER_LRU_SIZE, RESOLVER_LRU_SECONDS)
+# the redis hash keys of the resolvers used in this process, for invalidation
+_shared_keys = {}
+
+
+class IdentifierResolver:
+    """
+    Resolve warehouse and entity identifiers, a record id or a name, to ids.
+
+    Usage::
+
+        resolver = IdentifierResolver(app)
+        warehouse = resolver.warehouse('Garage', 'honeygear')
+        entity_id = resolver.entity_id('honeygear')
+
+    :param: app: the current app, used for the session and redis cache
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.cache_key = get_config(app, 'RESOLVER_CACHE_KEY', 'honey-resolver')
+        self.redis = getattr(app.cache, 'r', None)
+        _shared_keys[self.cache_key] = self.redis
+
+    def entity_id(self, identifier):
+        """
+        :param: identifier: an entity record id or name
+        :return: the entity id or None
+        """
+        if identifier is None:
+            return None
+        return self._resolve('ent', str(identifier), self._entity_from_db)
+
+    def warehouses(self, identifier):
+        """
+        :param: identifier: a warehouse record id or name
+        :return: a list of the WarehouseRef matching the identifier, warehouse names
+        are only unique per entity
+        """
+        if identifier is None:
+            return []
+        refs = self._resolve('wh', str(identifier), self._warehouses_from_db)
+        return [WarehouseRef(*ref) for ref in refs or []]
+
+    def warehouse(self, identifier, ent_identifier=None):
+        """
+        Resolve a warehouse identifier, the entity is only required when several
+        warehouses have the same name.
+        :param: identifier: a warehouse record id or name
+        :param: ent_identifier: an entity record id or name
+        :return: a WarehouseRef or None, raise HoneyError if the warehouse name is
+        ambiguous and the entity doesn't exist or wasn't provided
+        """
+        refs = self.warehouses(identifier)
+        if len(refs) > 1 or (refs and ent_identifier and not str(identifier).isnumeric()):
+            if not ent_identifier:
+                raise HoneyError(f"You must provide an entity identifier to find the "
+                                 f"correct warehouse with name={identifier}")
+            entity_id = self.entity_id(ent_identifier)
+            if entity_id is None:
+                raise HoneyError('No Entity exists with the provided identifier')
+            refs = [ref for ref in refs if ref.entity_id == entity_id]
+        return refs[0] if refs else None
+
+    def invalidate(self):
+        """Clear the in-process entries and drop the shared redis hash."""
+        _invalidate(self.cache_key, self.redis)
+
+    def _resolve(self, kind, identifier, query):
+        field = f'{kind}:{identifier}'
+        value = _local.get((self.cache_key, field))
+        if value is not None:
+            return value
+        cached = self._shared_get(field)
+        if cached is not None:
+            value = json.loads(cached)
+        else:
+            value = query(identifier)
+            # misses are not cached so a new record resolves right away
+            if not value:
+                return None
+            self._shared_set(field, json.dumps(value))
+        _local.set((self.cache_key, field), value)
+        return value
+
+    def _shared_get(self, field):
+        # redis is only a second tier, the database answers when it is down
+        if self.redis is None:
+            return None
+        try:
+            return self.redis.hget(self.cache_key, field)
+        except RedisError:
+            return None
+
+    def _shared_set(self, field, value):
+        if self.redis is None:
+            return
+        try:
+            self.redis.hset(self.cache_key, field, value)
+            self.redis.expire(self.cache_key, RESOLVER_CACHE_SECONDS)
+        except RedisError:
+            pass
+
+    def _entity_from_db(self, identifier):
+        column = Entity.id if identifier.isnumeric() else Entity.name
+        row = self.app.session.query(Entity.id).filter(column == identifier).first()
+        return row and row[0]
+
+    def _warehouses_from_db(self, identifier):
+        column = Warehouse.id if identifier.isnumeric() else Warehouse.name
+        return [list(row) for row in self.app.session.query(
+            Warehouse.id, Warehouse.name, Warehouse.entity_id
+        ).filter(column == identifier).order_by(Warehouse.id)]
+
+
+def _invalidate(cache_key, redis):
+    _local.clear()
+    if redis is not None:
+        try:
+            redis.delete(cache_key)
+        except RedisError:
+            pass
+
+
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['resolver_stale'] = True
+
+
+def _invalidate_after_commit(session):
+    if session.info.pop('resolver_stale', False):
+        _local.clear()
+        for cache_key, redis in list(_shared_keys.items()):
+            _invalidate(cache_key, redis)
+
+
+def _forget_after_rollback(session, previous_transaction):
+    session.info.pop('resolver_stale', None)
+
+
+for _model in (Warehouse, Entity):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _mark_changed)
+event.listen(Session, 'after_commit', _invalidate_after_commit)
+event.listen(Session, 'after_soft_rollback', _forget_after_rollback)
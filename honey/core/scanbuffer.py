@@ -0,0 +1,174 @@
+"""
+Buffered, group-committed writes for the scan loop.
+
+Committing after every scanned unit costs a full transaction per beep, which
+makes the database the bottleneck when several scanner stations run at once.
+The ScanBuffer sums the quantity changes per (location_id, sku_id) in memory
+and writes them in one transaction every `flush_every` scans, every `flush_ms`
+milliseconds, or when the scan session exits.
+
+With a ScanJournal every scan is appended to the local journal before it is
+buffered and the journal checkpoint is advanced in the flush transaction. If the
+database connection drops the buffer goes offline, the scans keep going to the
+journal only, and `honey invact replay` applies them later.
+"""
+import threading
+import time
+from collections import namedtuple, defaultdict
+from sqlalchemy.exc import OperationalError, InterfaceError
+from honey.models.inventory import LocationSkuAssoc
+from honey.models.journal import ScanJournalCheckpoint
+
+FlushSummary = namedtuple(
+    'FlushSummary',
+    ['scans', 'skus', 'units_in', 'units_out', 'missing', 'elapsed_ms', 'offline'])
+
+
+class FlushTimer(threading.Thread):
+    """
+    A daemon thread which flushes the buffer when pending scans are older than
+    the buffer `flush_ms`, so scans are not held in memory while a station idles.
+    Modeled on the honey.ext.alarm AlarmManager thread.
+    """
+
+    def __init__(self, scan_buffer):
+        super(FlushTimer, self).__init__(daemon=True)
+        self.scan_buffer = scan_buffer
+        self.interval = scan_buffer.flush_ms / 1000
+        self.should_run = threading.Event()
+        self.should_run.set()
+
+    def stop(self):
+        """Stop the thread after the current sleep."""
+        self.should_run.clear()
+
+    def run(self):
+        while self.should_run.is_set():
+            time.sleep(self.interval)
+            if self.should_run.is_set() and self.scan_buffer.due():
+                self.scan_buffer.flush()
+
+
+class ScanBuffer:
+    """
+    Accumulate scan quantity deltas and write them in one transaction.
+
+    Usage::
+
+        scan_buffer = ScanBuffer(app.session, flush_every=50, flush_ms=2000)
+        scan_buffer.add(location_id, sku_id, 1)
+        ...
+        scan_buffer.close()
+
+    :param: session: the sqlalchemy session to write through
+    :param: flush_every: flush after this many scans, 1 commits every scan
+    :param: flush_ms: flush when the oldest pending scan is this many ms old
+    :param: on_flush: optional callable receiving a FlushSummary after each flush
+    :param: journal: optional ScanJournal to durably record scans before writing
+    :param: offline: only write to the journal, never to the database
+    """
+
+    def __init__(self, session, flush_every=1, flush_ms=None, on_flush=None,
+                 journal=None, offline=False):
+        self.session = session
+        self.journal = journal
+        self.offline = offline
+        self.position = None
+        self.flush_every = max(int(flush_every), 1)
+        self.flush_ms = flush_ms
+        self.on_flush = on_flush
+        self.deltas = defaultdict(int)
+        self.scans = 0
+        self.first_scan_at = None
+        self.lock = threading.RLock()
+        self.timer = None
+        if flush_ms:
+            self.timer = FlushTimer(self)
+            self.timer.start()
+
+    @property
+    def buffered(self):
+        """True if scans are grouped, rather than committed one at a time."""
+        return self.flush_every > 1 or bool(self.flush_ms)
+
+    def add(self, location_id, sku_id, delta):
+        """
+        Add a scanned quantity change and flush if the flush policy is met.
+        :param: location_id: the InventoryLocation id
+        :param: sku_id: the ProductSku id
+        :param: delta: the signed quantity change
+        :return: FlushSummary if the add caused a flush, else None
+        """
+        with self.lock:
+            if self.journal is not None:
+                self.position = self.journal.append(location_id, sku_id, delta)
+            if self.offline:
+                return None
+            if self.first_scan_at is None:
+                self.first_scan_at = time.monotonic()
+            self.deltas[(location_id, sku_id)] += delta
+            self.scans += 1
+            if self.scans >= self.flush_every:
+                return self.flush()
+        return None
+
+    def due(self):
+        """True if there are pending scans older than `flush_ms`."""
+        with self.lock:
+            if not self.scans or not self.flush_ms:
+                return False
+            return (time.monotonic() - self.first_scan_at) * 1000 >= self.flush_ms
+
+    def flush(self):
+        """
+        Write all the pending deltas in one transaction. If the write fails the
+        pending deltas are kept so the flush can be retried, unless the scans are
+        journaled and the database is unreachable, then the buffer goes offline.
+        :return: FlushSummary or None if nothing was pending
+        """
+        with self.lock:
+            if not self.scans:
+                return None
+            started = time.perf_counter()
+            deltas = dict(self.deltas)
+            offline = False
+            missing = []
+            try:
+                missing = LocationSkuAssoc.apply_deltas(self.session, deltas)
+                if self.journal is not None:
+                    ScanJournalCheckpoint.advance(
+                        self.session, self.journal.station, self.position)
+                self.session.commit()
+            except (OperationalError, InterfaceError):
+                self.session.rollback()
+                if self.journal is None:
+                    raise
+                # the scans are safe in the journal. stay offline for the rest of
+                # the session so the checkpoint never skips over them
+                self.offline = offline = True
+            except Exception:
+                self.session.rollback()
+                raise
+            summary = FlushSummary(
+                scans=self.scans,
+                skus=len(deltas),
+                units_in=sum(d for d in deltas.values() if d > 0),
+                units_out=-sum(d for d in deltas.values() if d < 0),
+                missing=missing,
+                elapsed_ms=(time.perf_counter() - started) * 1000,
+                offline=offline)
+            self.deltas.clear()
+            self.scans = 0
+            self.first_scan_at = None
+        if self.on_flush:
+            self.on_flush(summary)
+        return summary
+
+    def close(self):
+        """Stop the flush timer, write anything still pending and close the journal."""
+        if self.timer:
+            self.timer.stop()
+        summary = self.flush()
+        if self.journal is not None:
+            self.journal.close()
+        return summary
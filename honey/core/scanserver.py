@@ -0,0 +1,309 @@
+"""
+An asyncio scan ingestion server for many scanner stations.
+
+Instead of every station running its own `honey invact scan` process with its
+own database connection and startup cost, the stations send scan events to one
+`honey serve-scans` process over TCP or a Unix socket. The server resolves the
+barcodes with one shared UpcIndex, coalesces the quantity deltas per
+(location_id, sku_id) across all the stations and writes them with
+LocationSkuAssoc.apply_deltas through a small pool of worker threads, each with
+its own session and pooled connection.
+
+The protocol is newline delimited json. A station sends one event per line::
+
+    {"upc": "850016398017", "location_id": 4, "delta": 1}
+    {"sku_id": 12, "label": "HG-1", "warehouse_id": 2, "delta": -1}
+
+and gets one reply per line, `{"ok": true, "sku": "A1-W-L", "description": ...}`
+or `{"ok": false, "error": "..."}`. An ok reply means the scan was accepted into
+the current batch, it is written by the next flush. If a flush triggered by the
+scan fails, the reply also has a `"warning"`, the batch is kept and retried.
+An event naming a location or sku id which doesn't exist is rejected, and a key
+which still breaks a constraint when it is written, because its location or sku
+was deleted since, is logged and dropped so it can't hold up the later scans.
+
+Codes and labels the loaded index already holds resolve on the event loop. A
+miss needs a database query, which runs in a single lookup thread so the event
+loop keeps serving the other stations and the app session is only used by one
+thread.
+"""
+import asyncio
+import json
+import time
+from collections import namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from honey.models.inventory import InventoryLocation, LocationSkuAssoc
+from honey.models.skus import ProductSku
+from honey.core.barcode import InvalidBarcode, barcode_key
+from honey.core.ingest import normalize_code
+
+ServerFlushSummary = namedtuple(
+    'ServerFlushSummary', ['scans', 'skus', 'missing', 'elapsed_ms', 'rejected'],
+    defaults=((),))
+
+
+class ScanServer:
+    """
+    Accept scan events from many stations and write them in coalesced batches.
+
+    :param: session_factory: a callable returning a new sqlalchemy session, used
+    by the flush workers
+    :param: upc_index: a UpcIndex used to resolve `upc` events, its app session
+    resolves the location labels and its app logs the flush errors
+    :param: flush_every: flush once this many scans are pending
+    :param: flush_ms: flush pending scans at least this often
+    :param: pool_size: the number of flush worker threads
+    :param: on_flush: optional callable receiving a ServerFlushSummary
+    """
+
+    def __init__(self, session_factory, upc_index, flush_every=500, flush_ms=1000,
+                 pool_size=4, on_flush=None):
+        self.session_factory = session_factory
+        self.upc_index = upc_index
+        self.flush_every = flush_every
+        self.flush_ms = flush_ms
+        self.on_flush = on_flush
+        self.log = upc_index.app.log
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+        self.lookups = ThreadPoolExecutor(max_workers=1)
+        self.workers = asyncio.Semaphore(pool_size)
+        self.pending = defaultdict(int)
+        self.scans = 0
+        self.locations = {}
+        # the location and sku ids known to exist
+        self.location_ids = set()
+        self.sku_ids = set()
+        self.server = None
+        self.flusher = None
+
+    async def start(self, host=None, port=None, path=None):
+        """
+        Listen on a Unix socket `path`, or else on TCP `host`:`port`.
+        :return: the asyncio Server
+        """
+        if path:
+            self.server = await asyncio.start_unix_server(self.handle, path=path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        self.flusher = asyncio.ensure_future(self._flush_periodically())
+        return self.server
+
+    async def close(self):
+        """Stop listening and write everything still pending."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.flusher is not None:
+            self.flusher.cancel()
+        await self.flush()
+        self.executor.shutdown(wait=True)
+        self.lookups.shutdown(wait=True)
+
+    async def handle(self, reader, writer):
+        """Serve one station connection, one json event and reply per line."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = await self.submit(json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    reply = {'ok': False, 'error': f'bad scan event: {e}'}
+                if self.scans >= self.flush_every:
+                    try:
+                        await self.flush()
+                    except Exception as e:
+                        self.log.error(f'flushing the scan batch failed: {e}')
+                        reply['warning'] = f'the batch could not be written yet and ' \
+                                           f'is retried: {e}'
+                writer.write(json.dumps(reply).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def submit(self, event):
+        """
+        Resolve a scan event and add its delta to the pending batch.
+        :param: event: a decoded scan event dict
+        :return: the reply dict for the station
+        """
+        delta = int(event.get('delta', 1))
+        location_id = event.get('location_id')
+        if location_id is None:
+            key = (int(event['warehouse_id']), event['label'])
+            location_id = self.locations.get(key)
+            if location_id is None:
+                location_id = await self._lookup(self._location_id, *key)
+            if location_id is None:
+                return {'ok': False, 'error': f"unknown location label {event['label']}"}
+        elif not await self._exists(self.location_ids, InventoryLocation, int(location_id)):
+            return {'ok': False, 'error': f'unknown location {location_id}'}
+        if 'sku_id' in event:
+            sku_id = int(event['sku_id'])
+            if not await self._exists(self.sku_ids, ProductSku, sku_id):
+                return {'ok': False, 'error': f'unknown sku {sku_id}'}
+            self.pending[(int(location_id), sku_id)] += delta
+            self.scans += 1
+            return {'ok': True}
+        upc = normalize_code(event['upc'])
+        try:
+            entry = self._cached_entry(upc)
+            if entry is None:
+                entry = await self._lookup(self.upc_index.get, upc)
+        except InvalidBarcode as e:
+            return {'ok': False, 'error': e.args[0]}
+        if entry is None:
+            return {'ok': False, 'error': f"command {event['upc']} not recognized"}
+        self.sku_ids.add(entry.id)
+        self.pending[(int(location_id), entry.id)] += delta * entry.multiple
+        self.scans += 1
+        return {'ok': True, 'sku': entry.sku, 'description': entry.description,
+                'multiple': entry.multiple}
+
+    async def _lookup(self, function, *args):
+        """Run a lookup which may query the database in the lookup thread."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.lookups, function, *args)
+
+    async def _exists(self, known, model, id_):
+        """
+        :return: True if a `model` row with the id exists, the known ids are
+        remembered and only a new id is queried, in the lookup thread
+        """
+        if id_ not in known:
+            if not await self._lookup(self._query_exists, model, id_):
+                return False
+            known.add(id_)
+        return True
+
+    def _query_exists(self, model, id_):
+        return self.upc_index.app.session.query(model.id).filter(
+            model.id == id_).first() is not None
+
+    def _cached_entry(self, upc):
+        """
+        :return: the UpcEntry of a code the loaded index holds, or None when
+        resolving it needs the database, raise InvalidBarcode for a bad check digit
+        """
+        key = barcode_key(upc)
+        if self.upc_index.stale:
+            return None
+        entry = self.upc_index.entries.get(key)
+        if entry is not None:
+            self.upc_index.hits += 1
+        return entry
+
+    def _location_id(self, warehouse_id, label):
+        key = (warehouse_id, label)
+        if key not in self.locations:
+            row = self.upc_index.app.session.query(InventoryLocation.id).filter(
+                InventoryLocation.warehouse_id == key[0],
+                InventoryLocation.label == label).first()
+            if row is None:
+                return None
+            self.locations[key] = row[0]
+            self.location_ids.add(row[0])
+        return self.locations[key]
+
+    async def flush(self):
+        """
+        Write the pending batch in a worker thread. If the write fails the
+        deltas which weren't written are merged back into the pending batch to be
+        retried.
+        :return: ServerFlushSummary or None if nothing was pending
+        """
+        if not self.scans:
+            return None
+        deltas, scans = self.pending, self.scans
+        self.pending, self.scans = defaultdict(int), 0
+        # the keys written or dropped by the parts of a split batch
+        done = set()
+        async with self.workers:
+            loop = asyncio.get_event_loop()
+            try:
+                summary = await loop.run_in_executor(
+                    self.executor, self._write, deltas, scans, done)
+            except Exception:
+                for key, delta in deltas.items():
+                    if key not in done:
+                        self.pending[key] += delta
+                self.scans += scans
+                raise
+        if self.on_flush:
+            self.on_flush(summary)
+        return summary
+
+    def _write(self, deltas, scans, done):
+        started = time.perf_counter()
+        # write in key order so concurrent workers lock rows in the same order
+        missing, rejected = self._write_items(sorted(deltas.items()), done)
+        return ServerFlushSummary(scans, len(deltas), missing,
+                                  (time.perf_counter() - started) * 1000, rejected)
+
+    def _write_items(self, items, done):
+        """
+        Write (key, delta) items in one transaction. If a key breaks a constraint,
+        like a location or sku deleted after its scans were accepted, the halves
+        are written apart until only the failing keys are left, which are logged
+        and dropped instead of being retried with every later batch.
+        :param: done: a set receiving the keys written or dropped
+        :return: (the keys which could not be decreased, the dropped keys)
+        """
+        session = self.session_factory()
+        try:
+            missing = LocationSkuAssoc.apply_deltas(session, dict(items))
+            session.commit()
+            done.update(key for key, _ in items)
+            return missing, []
+        except IntegrityError as e:
+            session.rollback()
+            if len(items) == 1:
+                (location_id, sku_id), delta = items[0]
+                self.log.error(f'dropped the delta {delta} of sku {sku_id} in location '
+                               f'{location_id}: {e.orig}')
+                done.add(items[0][0])
+                return [], [items[0][0]]
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        half = len(items) // 2
+        missing, rejected = self._write_items(items[:half], done)
+        more_missing, more_rejected = self._write_items(items[half:], done)
+        return missing + more_missing, rejected + more_rejected
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_ms / 1000)
+            try:
+                # notice an invalidation of the shared index by another station,
+                # the cached lookups don't check it
+                await self._lookup(self.upc_index.check_version)
+                await self.flush()
+            except Exception as e:
+                # the batch was kept, the next tick retries it
+                self.log.error(f'flushing the scan batch failed, retrying: {e}')
+
+
+async def send_scans(events, host=None, port=None, path=None):
+    """
+    A loopback client for the scan server, used for testing and scripting.
+    :param: events: an iterable of scan event dicts
+    :return: the list of reply dicts
+    """
+    if path:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    replies = []
+    try:
+        for event in events:
+            writer.write(json.dumps(event).encode('utf-8') + b'\n')
+            await writer.drain()
+            replies.append(json.loads(await reader.readline()))
+    finally:
+        writer.close()
+    return replies
@@ -0,0 +1,279 @@
+"""
+Ranked prefix and fuzzy lookup of skus by their code or description.
+
+Operators often only know part of a sku code, or mistype it. `SkuSearch.find`
+ranks the skus by
+
+    an exact or prefix match of the code, 0.5 + 0.5 * len(text) / len(sku)
+    the trigram similarity of the code, like pg_trgm similarity()
+    0.8 times the trigram word similarity of the description, like pg_trgm
+        word_similarity()
+
+and returns the best scores above SIMILARITY_THRESHOLD. On postgres with the
+pg_trgm extension the ranking runs in the database on the GIN trigram indexes of
+lower(sku) and lower(description). Otherwise, on sqlite or without pg_trgm, an
+in-memory index is built once per process with one query: the lower cased codes
+in a sorted array for prefix lookups with bisect, which serves like a trie at a
+fraction of its memory, and trigram posting lists of the codes and descriptions.
+It is dropped after a committed ProductSku change.
+"""
+import bisect
+import heapq
+import math
+import re
+from array import array
+from collections import Counter, namedtuple
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, object_session
+from honey.models.skus import ProductSku
+
+SkuMatch = namedtuple('SkuMatch', ['id', 'sku', 'description', 'score'])
+
+# the lowest score returned, the pg_trgm default similarity threshold
+SIMILARITY_THRESHOLD = 0.3
+
+# the weight of a description match, a code match ranks first
+DESCRIPTION_WEIGHT = 0.8
+
+# the in-memory lookup tries these lowest scores in turn, see MemorySkuIndex.find
+SEARCH_THRESHOLDS = (0.6, 0.45, SIMILARITY_THRESHOLD)
+
+# prefix matches scored per lookup, the shortest codes are scored first
+PREFIX_CANDIDATES = 1000
+
+_words = re.compile(r'[^\W_]+')
+
+# the in-memory index per database url, and whether the database has pg_trgm
+_memory_indexes = {}
+_pg_trgm = {}
+
+
+def trigrams(value):
+    """
+    :return: the set of trigrams of a text like pg_trgm makes them, of each lower
+    cased word padded with two spaces in front and one behind
+    """
+    found = set()
+    for word in _words.findall((value or '').lower()):
+        padded = f'  {word} '
+        found.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return found
+
+
+def prefix_score(query, sku):
+    """:return: the score of a code which starts with the query, 0.5 to 1"""
+    return 0.5 + 0.5 * len(query) / len(sku)
+
+
+class SkuSearch:
+    """
+    Find skus by a partial or mistyped code or description.
+
+    Usage::
+
+        for match in SkuSearch(app.session).find('grapl wht', limit=10):
+            print(match.sku, match.score)
+
+    :param: session: the sqlalchemy session
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.bind = session.get_bind()
+        self.backend = 'pg_trgm' if self._has_pg_trgm() else 'memory'
+
+    def find(self, query, limit=10):
+        """
+        :param: query: a sku code or description, or part of one
+        :param: limit: the most matches returned
+        :return: a list of SkuMatch, the best first
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        if self.backend == 'pg_trgm':
+            return self._find_in_db(query, limit)
+        return self._memory_index().find(query, limit)
+
+    def _has_pg_trgm(self):
+        if self.bind.dialect.name != 'postgresql':
+            return False
+        key = str(self.bind.url)
+        if key not in _pg_trgm:
+            _pg_trgm[key] = bool(self.session.execute(text(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar())
+        return _pg_trgm[key]
+
+    def _find_in_db(self, query, limit):
+        prefix = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        # the % and <% operators filter by these settings, not by the score, set
+        # them for this transaction so the same skus clear the threshold as in
+        # MemorySkuIndex, the word_similarity default of 0.6 would drop some
+        self.session.execute(text("""
+            SELECT set_config('pg_trgm.similarity_threshold', :similarity, true),
+                   set_config('pg_trgm.word_similarity_threshold', :word_similarity, true)
+        """), {'similarity': str(SIMILARITY_THRESHOLD),
+               'word_similarity': str(SIMILARITY_THRESHOLD / DESCRIPTION_WEIGHT)})
+        rows = self.session.execute(text("""
+            SELECT id, sku, description, GREATEST(
+                CASE WHEN lower(sku) LIKE :prefix
+                     THEN 0.5 + 0.5 * length(:query) / length(sku) ELSE 0 END,
+                similarity(lower(sku), :query),
+                :weight * word_similarity(:query, lower(description))) AS score
+            FROM product_skus
+            WHERE lower(sku) LIKE :prefix OR lower(sku) % :query
+               OR :query <% lower(description)
+            ORDER BY score DESC, sku
+            LIMIT :limit
+        """), {'query': query, 'prefix': prefix, 'weight': DESCRIPTION_WEIGHT,
+               'limit': limit})
+        return [SkuMatch(*row[:3], round(float(row[3]), 3)) for row in rows
+                if row[3] >= SIMILARITY_THRESHOLD]
+
+    def _memory_index(self):
+        key = str(self.bind.url)
+        if key not in _memory_indexes:
+            _memory_indexes[key] = MemorySkuIndex(self.session.query(
+                ProductSku.id, ProductSku.sku, ProductSku.description).order_by(
+                ProductSku.id))
+        return _memory_indexes[key]
+
+
+class MemorySkuIndex:
+    """
+    The in-memory prefix and trigram index of the skus. The posting lists are id
+    sorted arrays, a lookup only gathers the candidates of the rarest query
+    trigrams, as many as a match above the threshold must share one of, and
+    counts their other shared trigrams by set intersection, or bisect for few
+    candidates.
+
+    :param: rows: an iterable of (id, sku, description) in id order
+    """
+
+    def __init__(self, rows):
+        self.skus = {}
+        self.sku_trigram_counts = {}
+        sku_postings = {}
+        description_postings = {}
+        codes = []
+        for sku_id, sku, description in rows:
+            self.skus[sku_id] = (sku, description)
+            codes.append((sku.lower(), sku_id))
+            sku_trigrams = trigrams(sku)
+            self.sku_trigram_counts[sku_id] = len(sku_trigrams)
+            for trigram in sku_trigrams:
+                sku_postings.setdefault(trigram, []).append(sku_id)
+            for trigram in trigrams(description):
+                description_postings.setdefault(trigram, []).append(sku_id)
+        codes.sort()
+        self.codes = [code for code, _ in codes]
+        self.code_ids = [sku_id for _, sku_id in codes]
+        self.sku_postings = {trigram: array('l', ids)
+                             for trigram, ids in sku_postings.items()}
+        self.description_postings = {trigram: array('l', ids)
+                                     for trigram, ids in description_postings.items()}
+
+    def __len__(self):
+        return len(self.skus)
+
+    def find(self, query, limit=10):
+        """
+        Every sku scoring at least a threshold is found at that threshold, so the
+        lookup starts at the highest of SEARCH_THRESHOLDS, where the fewest
+        candidates are gathered, and only lowers it while fewer than `limit`
+        skus clear it.
+        :param: query: the lower cased text
+        :return: a list of SkuMatch, the best first
+        """
+        for threshold in SEARCH_THRESHOLDS:
+            scores = self._scores(query, threshold)
+            if len(scores) >= limit:
+                break
+        best = heapq.nsmallest(limit, ((-score, self.skus[sku_id][0], sku_id)
+                                       for sku_id, score in scores.items()))
+        return [SkuMatch(sku_id, sku, self.skus[sku_id][1], round(-score, 3))
+                for score, sku, sku_id in best]
+
+    def _scores(self, query, threshold):
+        """:return: a dict of {sku_id: score} of the skus scoring at least threshold"""
+        scores = {}
+        start = bisect.bisect_left(self.codes, query)
+        end = bisect.bisect_left(self.codes, query + '\uffff', start)
+        prefixed = sorted(range(start, end), key=lambda i: len(self.codes[i]))
+        for i in prefixed[:PREFIX_CANDIDATES]:
+            scores[self.code_ids[i]] = prefix_score(query, self.codes[i])
+        wanted = trigrams(query)
+        if wanted:
+            # similarity = shared / (wanted + sku - shared) needs this many shared
+            for sku_id, shared in self._shared(
+                    wanted, self.sku_postings, threshold * len(wanted)):
+                similarity = shared / (
+                    len(wanted) + self.sku_trigram_counts[sku_id] - shared)
+                if similarity > scores.get(sku_id, 0):
+                    scores[sku_id] = similarity
+            # like word_similarity, the share of the query trigrams found
+            for sku_id, shared in self._shared(
+                    wanted, self.description_postings,
+                    threshold / DESCRIPTION_WEIGHT * len(wanted)):
+                similarity = DESCRIPTION_WEIGHT * shared / len(wanted)
+                if similarity > scores.get(sku_id, 0):
+                    scores[sku_id] = similarity
+        return {sku_id: score for sku_id, score in scores.items() if score >= threshold}
+
+    @staticmethod
+    def _shared(wanted, postings, minimum):
+        """
+        :return: a list of (sku_id, shared trigram count) of the skus sharing at
+        least `minimum` of the wanted trigrams
+        """
+        lists = sorted((postings.get(trigram, ()) for trigram in wanted), key=len)
+        minimum = max(1, math.ceil(minimum - 1e-9))
+        if minimum > len(lists):
+            return []
+        # a sku sharing `minimum` trigrams is in one of the rarest lists
+        rare, common = lists[:len(lists) - minimum + 1], lists[len(lists) - minimum + 1:]
+        counts = Counter()
+        for ids in rare:
+            counts.update(ids)
+        candidates = list(counts)
+        for ids in common:
+            if len(candidates) * 16 < len(ids):
+                # few candidates, look them up in the long list
+                for sku_id in candidates:
+                    i = bisect.bisect_left(ids, sku_id)
+                    if i < len(ids) and ids[i] == sku_id:
+                        counts[sku_id] += 1
+            else:
+                counts.update(counts.keys() & set(ids))
+        return [(sku_id, shared) for sku_id, shared in counts.items()
+                if shared >= minimum]
+
+
+def _mark_sku_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['sku_search_stale'] = True
+
+
+def _mark_sku_updated(mapper, connection, target):
+    # fires for relationship only changes too, only a new code or description counts
+    state = inspect(target)
+    if state.attrs.sku.history.has_changes() \
+            or state.attrs.description.history.has_changes():
+        _mark_sku_changed(mapper, connection, target)
+
+
+def _drop_after_commit(session):
+    if session.info.pop('sku_search_stale', False):
+        _memory_indexes.clear()
+
+
+def _forget_after_rollback(session, previous_transaction):
+    session.info.pop('sku_search_stale', None)
+
+
+event.listen(ProductSku, 'after_insert', _mark_sku_changed)
+event.listen(ProductSku, 'after_update', _mark_sku_updated)
+event.listen(ProductSku, 'after_delete', _mark_sku_changed)
+event.listen(Session, 'after_commit', _drop_after_commit)
+event.listen(Session, 'after_soft_rollback', _forget_after_rollback)
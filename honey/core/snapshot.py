@@ -0,0 +1,223 @@
+"""
+Full inventory snapshots through postgres COPY.
+
+`honey snapshot export <path>` streams every honey table with
+`COPY <table> TO STDOUT` into one zip archive, a deflated member per table and
+a `manifest.json` with the snapshot version, the alembic revision, and the
+columns and row count of each table. The tables are read in one REPEATABLE READ
+transaction so the snapshot is consistent while scanners keep working.
+
+`honey snapshot import <path>` restores an archive in one transaction. The
+tables are truncated, the secondary indexes dropped, each member is loaded with
+`COPY <table> FROM STDIN` in foreign key order, then the indexes are rebuilt,
+the id sequences reset past the restored ids and the tables analyzed. Neither
+direction holds more than a COPY buffer of rows in memory.
+"""
+import datetime
+import json
+import zipfile
+from collections import namedtuple
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from honey.core.database import ModelBase
+from honey.core.exc import HoneyError
+
+SNAPSHOT_VERSION = 1
+
+MANIFEST = 'manifest.json'
+
+# bytes read from an archive member per COPY FROM STDIN chunk
+COPY_BUFFER_SIZE = 1 << 20
+
+TableSummary = namedtuple('TableSummary', ['table', 'rows'])
+
+
+def snapshot_tables():
+    """
+    :return: the honey tables, referenced tables before the tables referencing them
+    """
+    return list(ModelBase.metadata.sorted_tables)
+
+
+def export_snapshot(engine, path, compresslevel=6):
+    """
+    Write a snapshot of every honey table to a zip archive.
+    :param: engine: a postgres engine
+    :param: path: the archive path
+    :param: compresslevel: the deflate level, 0 to 9
+    :return: the manifest dict
+    """
+    _require_postgres(engine)
+    tables = snapshot_tables()
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'tables': [],
+    }
+    with engine.connect().execution_options(
+            isolation_level='REPEATABLE READ') as connection:
+        with connection.begin():
+            connection.execute(text('SET TRANSACTION READ ONLY'))
+            manifest['revision'] = _alembic_revision(connection)
+            cursor = connection.connection.cursor()
+            with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED,
+                                 compresslevel=compresslevel) as archive:
+                for table in tables:
+                    columns = [column.name for column in table.columns]
+                    member = f'{table.name}.copy'
+                    with archive.open(member, 'w', force_zip64=True) as stream:
+                        cursor.copy_expert(
+                            f'COPY {_quoted(connection, table.name)} '
+                            f'({_column_list(connection, columns)}) TO STDOUT',
+                            stream)
+                    manifest['tables'].append({
+                        'name': table.name,
+                        'member': member,
+                        'columns': columns,
+                        'rows': cursor.rowcount,
+                    })
+                archive.writestr(MANIFEST, json.dumps(manifest, indent=2))
+            cursor.close()
+    return manifest
+
+
+def read_manifest(path):
+    """
+    :param: path: a snapshot archive
+    :return: the manifest dict, raise HoneyError if it isn't a snapshot of this version
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            manifest = json.loads(archive.read(MANIFEST))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise HoneyError(f'{path} is not a honey snapshot: {e}')
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise HoneyError(f"The snapshot version {manifest.get('version')} is not "
+                         f"supported, expected {SNAPSHOT_VERSION}.")
+    return manifest
+
+
+def import_snapshot(engine, path, replace=False):
+    """
+    Restore a snapshot archive into the database in one transaction.
+    :param: engine: a postgres engine
+    :param: path: the archive path
+    :param: replace: whether existing records are deleted, otherwise the tables
+    must be empty
+    :return: a list of TableSummary in load order
+    """
+    _require_postgres(engine)
+    manifest = read_manifest(path)
+    tables = {table.name: table for table in snapshot_tables()}
+    entries = _check_entries(manifest, tables)
+    summaries = []
+    with engine.connect() as connection:
+        with connection.begin():
+            revision = _alembic_revision(connection)
+            if manifest.get('revision') != revision:
+                raise HoneyError(f"The snapshot was taken at the schema revision "
+                                 f"{manifest.get('revision')}, the database is at "
+                                 f"{revision}, upgrade or downgrade it first.")
+            names = ', '.join(_quoted(connection, name) for name in tables)
+            if not replace and _has_rows(connection, tables):
+                raise HoneyError('The database holds inventory records, use '
+                                 '--replace to delete them before the restore.')
+            connection.execute(text(f'TRUNCATE {names} RESTART IDENTITY'))
+            indexes = _secondary_indexes(connection, list(tables))
+            for name, _ in indexes:
+                connection.execute(text(f'DROP INDEX {_quoted(connection, name)}'))
+            cursor = connection.connection.cursor()
+            with zipfile.ZipFile(path) as archive:
+                for entry in entries:
+                    with archive.open(entry['member']) as stream:
+                        cursor.copy_expert(
+                            f"COPY {_quoted(connection, entry['name'])} "
+                            f"({_column_list(connection, entry['columns'])}) FROM STDIN",
+                            stream, size=COPY_BUFFER_SIZE)
+                    summaries.append(TableSummary(entry['name'], cursor.rowcount))
+            cursor.close()
+            for _, definition in indexes:
+                connection.execute(text(definition))
+            for table in tables.values():
+                _reset_sequence(connection, table)
+            connection.execute(text(f'ANALYZE {names}'))
+    return summaries
+
+
+def _require_postgres(engine):
+    if engine.dialect.name != 'postgresql':
+        raise HoneyError(f'Snapshots use postgres COPY, the {engine.dialect.name} '
+                         f'database is not supported.')
+
+
+def _quoted(connection, name):
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def _column_list(connection, columns):
+    return ', '.join(_quoted(connection, column) for column in columns)
+
+
+def _alembic_revision(connection):
+    """:return: the alembic revision of the database, None if it isn't stamped"""
+    try:
+        with connection.begin_nested():
+            return connection.execute(
+                text('SELECT version_num FROM alembic_version')).scalar()
+    except ProgrammingError:
+        return None
+
+
+def _check_entries(manifest, tables):
+    """
+    :return: the manifest table entries in load order, raise HoneyError if the
+    archive doesn't fit the current schema
+    """
+    entries = {entry['name']: entry for entry in manifest['tables']}
+    unknown = set(entries) - set(tables)
+    if unknown:
+        raise HoneyError(f"The snapshot tables {', '.join(sorted(unknown))} don't "
+                         f"exist in the current schema.")
+    for name, entry in entries.items():
+        missing = set(entry['columns']) - set(tables[name].columns.keys())
+        if missing:
+            raise HoneyError(f"The snapshot columns {', '.join(sorted(missing))} of "
+                             f"{name} don't exist in the current schema.")
+    return [entries[name] for name in tables if name in entries]
+
+
+def _has_rows(connection, tables):
+    return any(connection.execute(
+        text(f'SELECT EXISTS (SELECT 1 FROM {_quoted(connection, name)})')).scalar()
+        for name in tables)
+
+
+def _secondary_indexes(connection, table_names):
+    """
+    :return: a list of (name, definition) of the indexes of the tables which don't
+    back a primary key, unique or exclusion constraint
+    """
+    return connection.execute(text("""
+        SELECT i.indexname, i.indexdef FROM pg_indexes i
+        WHERE i.schemaname = current_schema()
+          AND i.tablename = ANY(:tables)
+          AND NOT EXISTS (
+            SELECT 1 FROM pg_constraint c
+            WHERE c.conindid = format('%I.%I', i.schemaname, i.indexname)::regclass)
+        ORDER BY i.tablename, i.indexname
+    """), {'tables': table_names}).fetchall()
+
+
+def _reset_sequence(connection, table):
+    """
+    Move the sequence of a serial id past the highest restored id, setval is
+    strict so tables without a sequence are left alone.
+    """
+    if 'id' not in table.columns:
+        return
+    name = _quoted(connection, table.name)
+    connection.execute(text(f"""
+        SELECT setval(pg_get_serial_sequence(:table, 'id'),
+                      COALESCE(MAX(id), 1), MAX(id) IS NOT NULL)
+        FROM {name}
+    """), {'table': table.name})
@@ -0,0 +1,147 @@
+"""
+Fixed-memory latency histograms for the scan loop.
+
+Each scan is split into phases, like the upc lookup, the buffered write, the
+flush/commit and the console logging. Every phase records its latency into a
+LatencyHistogram with logarithmic buckets, so a session of millions of scans
+keeps a few kilobytes of counters and still reports p50/p95/p99 within about 5%.
+ScanStats.record() takes a lock, the flush/commit latency is recorded from the
+FlushTimer thread while the scan loop records the other phases.
+"""
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# bucket bounds grow by 2 ** (1 / 16), about 4.4%, from 1 microsecond
+MIN_SECONDS = 1e-6
+GROWTH = 2 ** (1 / 16)
+# 16 buckets per doubling, 34 doublings reach ~4.7 hours
+BUCKETS = 16 * 34
+
+
+class LatencyHistogram:
+    """
+    Count latencies in logarithmic buckets.
+
+    :param: name: the phase name, used in reports
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        """Add one latency in seconds."""
+        if seconds <= MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(int(math.log(seconds / MIN_SECONDS, GROWTH)) + 1, BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, percent):
+        """
+        :param: percent: like 50, 95 or 99
+        :return: the upper bound of the bucket holding the percentile, in seconds,
+        clamped to the recorded max, or None if nothing was recorded
+        """
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(MIN_SECONDS * GROWTH ** bucket, self.max)
+        return self.max
+
+    def summary(self):
+        """
+        :return: a dict of the count and the mean/p50/p95/p99/max in milliseconds
+        """
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 3)
+
+        return OrderedDict([
+            ('count', self.count),
+            ('mean_ms', ms(self.total / self.count if self.count else None)),
+            ('p50_ms', ms(self.percentile(50))),
+            ('p95_ms', ms(self.percentile(95))),
+            ('p99_ms', ms(self.percentile(99))),
+            ('max_ms', ms(self.max)),
+        ])
+
+
+class ScanStats:
+    """
+    Per-phase latency histograms and throughput of one scan session.
+
+    Usage::
+
+        stats = ScanStats()
+        with stats.timer('lookup'):
+            entry = upc_index.get(code)
+        stats.scanned()
+        ...
+        report = stats.report()
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.scans = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        """:return: the LatencyHistogram of a phase, created on first use"""
+        if name not in self.phases:
+            self.phases[name] = LatencyHistogram(name)
+        return self.phases[name]
+
+    def record(self, name, seconds):
+        """Add one latency in seconds to a phase, from any thread."""
+        with self._lock:
+            self.phase(name).record(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Record the latency of the `with` block into a phase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def scanned(self, scans=1):
+        """Count completed scans for the scans/sec rate."""
+        self.scans += scans
+
+    def report(self):
+        """
+        :return: a json serializable dict of the session throughput and phases
+        """
+        elapsed = time.perf_counter() - self.started
+        with self._lock:
+            phases = OrderedDict(
+                (name, histogram.summary()) for name, histogram in self.phases.items())
+        return OrderedDict([
+            ('scans', self.scans),
+            ('elapsed_s', round(elapsed, 3)),
+            ('scans_per_sec', round(self.scans / elapsed, 1) if elapsed else 0.0),
+            ('phases', phases),
+        ])
+
+    def write_json(self, path):
+        """Write the report to a json file."""
+        with open(path, 'w', encoding='utf-8') as stream:
+            json.dump(self.report(), stream, indent=2)
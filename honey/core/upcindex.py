@@ -0,0 +1,264 @@
+"""
+An in-memory UPC -> ProductSku lookup index for the scan loop.
+
+Resolving a scanned barcode with a database query costs a round trip per beep,
+which is the main latency when scanning over a slow network link. The index is
+loaded once at the start of a scan session with a single query (or from the
+redis cache when it is shared between scanner stations) and then answers every
+lookup from a dict.
+
+The index is invalidated whenever a ProductSku row is inserted, updated or
+deleted. The mapper events only mark the session as dirty, the live indexes are
+invalidated (and the shared redis copy deleted) after the session commits, so a
+rolled back change never evicts a good index. A shared index also writes a new
+version key to redis when it is invalidated, and the indexes of the other
+stations compare it with the version they loaded, at most once a second, so they
+reload too.
+
+Codes are indexed by their canonical GTIN-14 (see honey.core.barcode), so the
+UPC-A, EAN-13 and GTIN-14 forms of an item all resolve with an exact match on
+the indexed ProductSku.gtin column. Codes which aren't GTINs match the upc.
+
+A carton level barcode resolves to its retail unit sku with the unit `multiple`
+from the precomputed SkuPackCapacity table, so one scan of a master carton
+counts all of its units.
+"""
+import json
+import time
+import uuid
+import weakref
+from collections import namedtuple
+from sqlalchemy import event, func, or_
+from sqlalchemy.orm import Session, object_session, aliased
+from honey.models.skus import ProductSku, SkuPackCapacity
+from honey.core.barcode import barcode_key, InvalidBarcode
+from honey.utils import get_config
+
+# id and sku are the unit sku to count, description is of the scanned item
+UpcEntry = namedtuple('UpcEntry', ['id', 'sku', 'description', 'multiple'],
+                      defaults=(1,))
+
+# how many unknown codes get() and get_many() remember, to keep memory bounded
+UNKNOWN_LIMIT = 10000
+
+# how often a shared index checks the redis version key for an invalidation
+VERSION_CHECK_SECONDS = 1.0
+
+# every index which is alive in this process, used for invalidation
+_live_indexes = weakref.WeakSet()
+
+
+def match_keys(keys):
+    """
+    :return: a filter matching index keys, GTINs on the gtin column and other
+    codes on the upc column, so both use their unique index
+    """
+    gtins = [key for key in keys if len(key) == 14 and key.isdigit()]
+    codes = [key for key in keys if not (len(key) == 14 and key.isdigit())]
+    return or_(ProductSku.gtin.in_(gtins), ProductSku.upc.in_(codes))
+
+
+def entry_query(session):
+    """
+    :return: a query of (index key, unit sku id, unit sku, description, multiple),
+    carton skus are resolved through the SkuPackCapacity table
+    """
+    unit = aliased(ProductSku)
+    return session.query(
+        func.coalesce(ProductSku.gtin, ProductSku.upc),
+        func.coalesce(unit.id, ProductSku.id),
+        func.coalesce(unit.sku, ProductSku.sku),
+        ProductSku.description,
+        func.coalesce(SkuPackCapacity.multiple, 1)
+    ).outerjoin(SkuPackCapacity, SkuPackCapacity.pack_sku_id == ProductSku.id
+                ).outerjoin(unit, unit.id == SkuPackCapacity.unit_sku_id)
+
+
+class UpcIndex:
+    """
+    Map a ProductSku gtin, or upc if it isn't a GTIN, to an
+    `UpcEntry(id, sku, description, multiple)`.
+
+    Usage::
+
+        upc_index = UpcIndex(app, shared=True).load()
+        entry = upc_index.get('850016398017')
+
+    :param: app: the current app, used for the session and redis cache
+    :param: shared: if True, read and publish the index through `app.cache`
+    """
+
+    def __init__(self, app, shared=False):
+        self.app = app
+        self.shared = shared
+        self.cache_key = get_config(app, 'UPC_INDEX_CACHE_KEY', 'honey-upc-index')
+        self.version_key = f'{self.cache_key}-version'
+        self.version = None
+        self.checked_at = 0.0
+        self.entries = {}
+        self.unknown = set()
+        self.stale = True
+        self.hits = 0
+        self.misses = 0
+        _live_indexes.add(self)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, upc):
+        try:
+            return barcode_key(upc) in self.entries
+        except InvalidBarcode:
+            return False
+
+    def load(self):
+        """
+        Load the index from the shared cache if possible, else from the database.
+        :return: self, to allow `UpcIndex(app).load()`
+        """
+        entries = None
+        if self.shared:
+            # read the version first, an invalidation during the load is noticed
+            self.version = self.app.cache.get(self.version_key)
+            self.checked_at = time.monotonic()
+            entries = self._load_from_cache()
+        if entries is None:
+            entries = self._load_from_db()
+            if self.shared:
+                self._publish(entries)
+        self.entries = entries
+        self.unknown = set()
+        self.stale = False
+        return self
+
+    def get(self, upc):
+        """
+        Resolve a scanned upc to an UpcEntry. A miss falls back to a single
+        database query so a sku created after the index was loaded is still found,
+        an unknown code is remembered so it is only queried once.
+        :param: upc: the normalized scanned code
+        :return: UpcEntry or None, raise InvalidBarcode for a bad check digit
+        """
+        self._refresh()
+        key = barcode_key(upc)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        if key in self.unknown:
+            return None
+        self.misses += 1
+        row = self._query().filter(match_keys([key])).first()
+        if row is None:
+            if len(self.unknown) < UNKNOWN_LIMIT:
+                self.unknown.add(key)
+            return None
+        entry = UpcEntry(*row[1:])
+        self.entries[key] = entry
+        return entry
+
+    def get_many(self, upcs):
+        """
+        Resolve a chunk of scanned upcs. The index misses are resolved with one
+        `IN` query for the whole chunk, and unknown codes are remembered so a bad
+        code repeated in a scan dump is only queried once. Codes with a bad check
+        digit resolve to None.
+        :param: upcs: an iterable of normalized scanned codes
+        :return: a dict of upc to UpcEntry or None
+        """
+        self._refresh()
+        found, misses = {}, {}
+        for upc in upcs:
+            try:
+                key = barcode_key(upc)
+            except InvalidBarcode:
+                found[upc] = None
+                continue
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                found[upc] = entry
+            elif key in self.unknown:
+                found[upc] = None
+            else:
+                misses.setdefault(key, []).append(upc)
+        if misses:
+            self.misses += len(misses)
+            for key, *values in self._query().filter(match_keys(misses)):
+                self.entries[key] = UpcEntry(*values)
+            for key, codes in misses.items():
+                entry = self.entries.get(key)
+                for upc in codes:
+                    found[upc] = entry
+                if entry is None and len(self.unknown) < UNKNOWN_LIMIT:
+                    self.unknown.add(key)
+        return found
+
+    def invalidate(self):
+        """
+        Mark the index stale, drop the shared copy from the cache and write a new
+        version, so the indexes of the other stations reload.
+        """
+        self.stale = True
+        if self.shared:
+            self.app.cache.delete(self.cache_key)
+            self.app.cache.set(self.version_key, uuid.uuid4().hex)
+
+    def check_version(self):
+        """
+        Mark a shared index stale if the version in the cache changed since it was
+        loaded, because another station invalidated it.
+        :return: True if the index is stale
+        """
+        self.checked_at = time.monotonic()
+        if self.shared and not self.stale \
+                and self.app.cache.get(self.version_key) != self.version:
+            self.stale = True
+        return self.stale
+
+    def _refresh(self):
+        """Reload the index if it is stale, checking the shared version first."""
+        if self.shared and time.monotonic() - self.checked_at >= VERSION_CHECK_SECONDS:
+            self.check_version()
+        if self.stale:
+            self.load()
+
+    def _query(self):
+        return entry_query(self.app.session)
+
+    def _load_from_db(self):
+        rows = self._query().filter(ProductSku.upc.isnot(None))
+        return {upc: UpcEntry(*values) for upc, *values in rows}
+
+    def _load_from_cache(self):
+        cached = self.app.cache.get(self.cache_key)
+        if not cached:
+            return None
+        return {upc: UpcEntry(*values) for upc, values in json.loads(cached).items()}
+
+    def _publish(self, entries):
+        self.app.cache.set(
+            self.cache_key,
+            json.dumps({upc: list(entry) for upc, entry in entries.items()}))
+
+
+def _mark_sku_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['upc_index_stale'] = True
+
+
+def _invalidate_after_commit(session):
+    if session.info.pop('upc_index_stale', False):
+        for upc_index in list(_live_indexes):
+            upc_index.invalidate()
+
+
+def _forget_after_rollback(session, previous_transaction):
+    session.info.pop('upc_index_stale', None)
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(ProductSku, _event_name, _mark_sku_changed)
+event.listen(Session, 'after_commit', _invalidate_after_commit)
+event.listen(Session, 'after_soft_rollback', _forget_after_rollback)
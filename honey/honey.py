@@ -11,6 +11,12 @@ from honey.controllers.entity import EntityController
 from honey.controllers.warehouse import WarehouseController
 from honey.controllers.location import InventoryLocationController
 from honey.controllers.inventory import InventoryActionController
+from honey.controllers.scanserver import ScanServerController
+from honey.controllers.stock import StockController
+from honey.controllers.report import ReportController
+from honey.controllers.importer import ImportController
+from honey.controllers.snapshot import SnapshotController
+from honey.controllers.skus import SkuController
 from honey.ext.redis import HoneyRedisCacheHandler
 
 # match on ${ env variable } in the yaml file
@@ -80,7 +86,13 @@ class Honey(App):
             EntityController,
             WarehouseController,
             InventoryLocationController,
-            InventoryActionController
+            InventoryActionController,
+            ScanServerController,
+            StockController,
+            ReportController,
+            ImportController,
+            SnapshotController,
+            SkuController
         ]
 
         hooks = [
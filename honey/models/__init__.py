@@ -1,7 +1,10 @@
 """
 Imports all the models here.
 """
-from honey.models.skus import (productsku_skuattr_assoc, Container, ProductSku,
-                               SkuAttribute)
-from honey.models.inventory import (Warehouse, InventoryLocation, LocationSkuAssoc)
+from honey.models.skus import (productsku_skuattr_assoc, Container, ContainerClosure,
+                               ProductSku, SkuAttribute, SkuPackCapacity)
+from honey.models.inventory import (Warehouse, InventoryLocation, LocationSkuAssoc,
+                                    StockTotal)
 from honey.models.entities import Entity
+from honey.models.journal import ScanJournalCheckpoint
+from honey.models.movements import InventoryMovement, StockSnapshot, stock_snapshot_rows
@@ -31,13 +31,9 @@ class Entity(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
         :param: identifier: either a database record id or an Entity name
         :return: Entity object
         """
-        ent_obj = None
-        identifier = str(identifier)
-        if identifier is not None and identifier.isnumeric():
-            ent_obj = app.session.query(cls).filter_by(
-                id=identifier).first()
-        elif identifier is not None:
-            ent_obj = app.session.query(cls).filter_by(name=identifier).first()
+        from honey.core.resolver import IdentifierResolver
+        entity_id = IdentifierResolver(app).entity_id(identifier)
+        ent_obj = entity_id and app.session.get(cls, entity_id)
         if not ent_obj:
             raise HoneyError(
                 'No Entity exists with the provided identifier')
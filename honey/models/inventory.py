@@ -1,11 +1,20 @@
-from sqlalchemy import (Integer, Column, ForeignKey,
-                        Numeric, Unicode, UnicodeText, Table, UniqueConstraint)
-from sqlalchemy.orm import relationship, backref
+from collections import defaultdict, namedtuple
+from sqlalchemy import (Integer, Column, ForeignKey, Numeric, Unicode, UnicodeText,
+                        Table, UniqueConstraint, and_, bindparam, column, event, func,
+                        inspect, or_, select, values)
+from sqlalchemy.orm import relationship, backref, column_property
+from sqlalchemy.orm.attributes import get_history
 from honey.core.database import (ModelBase, CRUDMixin, SurrogatePK, AuditMixin,
-                                 reference_col, session)
+                                 reference_col, session, dialect_insert,
+                                 on_conflict_increment)
 from honey.models.entities import Entity
+from honey.models.movements import (InventoryMovement, StockSnapshot, SCAN, TRANSFER,
+                                    ADJUST)
 from honey.core.exc import HoneyError
 
+# what a LocationSkuAssoc.transfer moved
+TransferSummary = namedtuple('TransferSummary', ['records', 'skus', 'units'])
+
 
 class Warehouse(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
     """
@@ -37,13 +46,9 @@ class Warehouse(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
         :param: identifier: either a database record id or a Warehouse name
         :return: Warehouse object or raise HoneyError
         """
-        wh_obj = None
-        if identifier is not None and identifier.isnumeric():
-            wh_obj = app.session.query(cls).filter_by(
-                id=identifier).first()
-        elif identifier is not None:
-            wh_obj = app.session.query(cls).filter_by(
-                name=identifier).first()
+        from honey.core.resolver import IdentifierResolver
+        refs = IdentifierResolver(app).warehouses(identifier)
+        wh_obj = refs and app.session.get(cls, refs[0].id)
         if not wh_obj:
             raise HoneyError(
                 'No warehouse exists with the provided identifier')
@@ -55,30 +60,16 @@ class Warehouse(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
         Get the Warehouse object per the Warehouse identifier or raise HoneyError
         :param: app: the current app
         :param: wh_identifier: either a warehouse table record id or a Warehouse.name
-        :param: ent_identifier: either a entity table record id or Entity.name
+        :param: ent_identifier: either a entity table record id or Entity.name, only
+        required if several warehouses have the same name
         :return: Warehouse object or raise HoneyError if return_none == False.
         Warehouse object or None if return_none == True.
         """
-        wh_obj = None
-        wh_identifier = str(wh_identifier)
-        ent_identifier = str(ent_identifier)
+        from honey.core.resolver import IdentifierResolver
         if wh_identifier is None:
             raise HoneyError("You must provide a warehouse identifier")
-        if wh_identifier is not None and wh_identifier.isnumeric():
-            wh_obj = app.session.query(cls).filter_by(
-                id=wh_identifier).first()
-            return wh_obj
-        if wh_identifier is not None:
-            wh_obj = app.session.query(cls).filter_by(
-                name=wh_identifier).all()
-            if len(wh_obj) == 1:
-                return wh_obj[0]
-            if ent_identifier is None:
-                raise HoneyError(f"You must provide an entity identifier to find the "
-                                 f"correct warehouse with name={wh_identifier}")
-            ent_obj = Entity.get_obj(app, ent_identifier)
-            wh_obj = app.session.query(cls).filter_by(
-                    name=wh_identifier, entity_id=ent_obj.id).first()
+        ref = IdentifierResolver(app).warehouse(wh_identifier, ent_identifier)
+        wh_obj = ref and app.session.get(cls, ref.id)
         if not wh_obj and not return_none:
             raise HoneyError(
                 'No warehouse exists with the provided identifier')
@@ -91,17 +82,9 @@ class Warehouse(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
         param: app: the active app object
         returns: A class: <Warehouse> object or none
         """
-        wh_cache_key = None
-        try:
-            if app.__test__:
-                wh_cache_key = app.config.get('honeytest', 'WAREHOUSE_CACHE_KEY')
-        except AttributeError:
-            wh_cache_key = app.config.get('honey', 'WAREHOUSE_CACHE_KEY')
-        active_warehouse = app.cache.get(wh_cache_key)
-        if active_warehouse:
-            return session.query(cls).filter_by(name=active_warehouse).first()
-        else:
-            return None
+        from honey.core.context import get_active_context
+        context = get_active_context(app)
+        return context and app.session.get(cls, context.warehouse_id)
 
 
 class InventoryLocation(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
@@ -132,7 +115,7 @@ class InventoryLocation(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
     skus = relationship(
         "LocationSkuAssoc", back_populates="location",
         primaryjoin="sku_locations.c.location_id == InventoryLocation.id",
-        lazy="selectin", cascade="all, delete-orphan", passive_deletes=True)
+        lazy="select", cascade="all, delete-orphan", passive_deletes=True)
 
     def __init__(self, label, warehouse_id, **kwargs):
         self.label = label
@@ -141,8 +124,20 @@ class InventoryLocation(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
     def __repr__(self):
         return f'<InventoryLocation {self.label, self.warehouse.name}>'
 
+    @classmethod
+    def label_map(cls, session, warehouse_id):
+        """
+        Load every location label of a warehouse with one query, so a scan session
+        can switch locations by scanning a label without a query per switch.
+        :param: session: the sqlalchemy session
+        :param: warehouse_id: the Warehouse id
+        :return: a dict of {lowercase label: (id, label)}
+        """
+        rows = session.query(cls.id, cls.label).filter(cls.warehouse_id == warehouse_id)
+        return {label.lower().strip(): (id, label) for id, label in rows}
+
 
-class LocationSkuAssoc(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
+class LocationSkuAssoc(ModelBase, CRUDMixin, AuditMixin):
     """
     An association object for Locations and Skus. The left side of the relationship
     maps a InventoryLocation as a one-to-many to LocationSkuAssoc. Then,
@@ -154,6 +149,10 @@ class LocationSkuAssoc(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
     many-to-one to the ProductSku, so we can have mixed Skus in a single
     InventoryLocation. Finally, we can use association_proxy to work with the
     data in this table, as done in the models/skus.py file in the ProductSku class.
+    The primary key is (location_id, sku_id), so a location holds one record per sku
+    and quantity changes can be upserted against it.
+    The relationships here and on both sides load lazily by default, use a loading
+    profile from honey.models.profiles to fetch what a command renders.
     """
     # ideally this table should be named location_skus, I got it backwards here
     __tablename__ = 'sku_locations'
@@ -171,16 +170,19 @@ class LocationSkuAssoc(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
                                ondelete="CASCADE"),
                     primary_key=True)
 
-    quantity = Column('quantity', Integer, nullable=False)
+    # load the previous quantity of an expired record before a change, so the
+    # mapper events see the applied delta
+    quantity = column_property(Column('quantity', Integer, nullable=False),
+                               active_history=True)
 
     # parent
     location = relationship("InventoryLocation", back_populates="skus",
                             foreign_keys=[location_id],
-                            lazy="joined", cascade="save-update, merge")
+                            lazy="select", cascade="save-update, merge")
 
     # child
     sku = relationship("ProductSku", back_populates='locations',
-                       lazy="joined",
+                       lazy="select",
                        foreign_keys=[sku_id],
                        cascade="save-update, merge")
 
@@ -191,3 +193,380 @@ class LocationSkuAssoc(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
 
     def __repr__(self):
         return f'<LocationSkuAssoc {self.sku.sku, self.location.label}>'
+
+    @classmethod
+    def apply_deltas(cls, session, deltas, reason=SCAN, actor=None, occurred_on=None):
+        """
+        Apply summed quantity changes to the sku_locations table in the current
+        transaction. Increases are one `INSERT ... ON CONFLICT (location_id, sku_id)
+        DO UPDATE SET quantity = quantity + :delta`. Decreases are one conditional
+        `UPDATE ... WHERE quantity >= :n RETURNING` and one `DELETE ... RETURNING`
+        of the records which reached zero or hold less than their decrease, see
+        _decrease_returning(). Databases without UPDATE RETURNING lock the records
+        with `SELECT ... FOR UPDATE` instead, then `UPDATE ... SET quantity =
+        quantity - :delta` and a conditional delete of records which reached zero.
+        Concurrent scans into the same location can't lose updates. The StockTotal
+        aggregate is updated and the inventory_movements ledger appended with the
+        applied changes. The caller commits.
+        :param: session: the sqlalchemy session
+        :param: deltas: a dict like {(location_id, sku_id): signed quantity change}
+        :param: reason: why the quantities changed, for the ledger
+        :param: actor: who changed them, default the user and host
+        :param: occurred_on: when they changed, for the ledger, a time or a dict of
+        times per (location_id, sku_id), default now
+        :return: a list of (location_id, sku_id) keys which could not be
+        decreased because no quantity exists in the location
+        """
+        table = cls.__table__
+        increases = [{'location_id': location_id, 'sku_id': sku_id, 'quantity': delta}
+                     for (location_id, sku_id), delta in deltas.items() if delta > 0]
+        decreases = {key: delta for key, delta in deltas.items() if delta < 0}
+        # the quantity changes which were applied, for the stock totals
+        applied = {key: deltas[key] for key in deltas if deltas[key] > 0}
+        if increases:
+            upsert = on_conflict_increment(
+                dialect_insert(session, table), ['location_id', 'sku_id'], ['quantity'])
+            session.execute(upsert, increases)
+        missing = []
+        if decreases and session.get_bind().dialect.full_returning:
+            missing = cls._decrease_returning(session, decreases, applied)
+        elif decreases:
+            rows = session.execute(select(
+                [table.c.location_id, table.c.sku_id, table.c.quantity]).where(and_(
+                    table.c.location_id.in_({key[0] for key in decreases}),
+                    table.c.sku_id.in_({key[1] for key in decreases}))).with_for_update())
+            existing = {(location_id, sku_id): quantity
+                        for location_id, sku_id, quantity in rows}
+            params = []
+            for key, delta in decreases.items():
+                if key not in existing:
+                    missing.append(key)
+                    continue
+                # a location never goes below zero, so only that much leaves
+                applied[key] = -min(existing[key], -delta)
+                params.append({'loc_id': key[0], 'sku': key[1], 'delta': delta})
+            if params:
+                where = and_(table.c.location_id == bindparam('loc_id'),
+                             table.c.sku_id == bindparam('sku'))
+                session.execute(table.update().where(where).values(
+                    quantity=table.c.quantity + bindparam('delta')), params)
+                session.execute(table.delete().where(
+                    and_(where, table.c.quantity <= 0)), params)
+        StockTotal.apply_location_deltas(session, applied)
+        InventoryMovement.record(session, applied, reason, actor, occurred_on)
+        return missing
+
+    @classmethod
+    def _decrease_returning(cls, session, decreases, applied):
+        """
+        Decrease the records which hold enough with one `UPDATE ... FROM (VALUES
+        ...) WHERE quantity + delta >= 0 RETURNING`, the updated rows stay locked
+        until the commit. Then one `DELETE ... RETURNING quantity` removes the
+        records which reached zero and the records holding less than their
+        decrease, a location never goes below zero, so only what they held leaves.
+        A record changed by a concurrent writer between the two statements is tried
+        again, the keys which match no record are missing.
+        :param: decreases: a dict like {(location_id, sku_id): negative change}
+        :param: applied: a dict the applied changes are added to
+        :return: a list of the (location_id, sku_id) keys without a record
+        """
+        table = cls.__table__
+        remaining = dict(decreases)
+        while remaining:
+            changes = _delta_values(remaining)
+            decreased = {tuple(key) for key in session.execute(
+                table.update().where(and_(
+                    table.c.location_id == changes.c.location_id,
+                    table.c.sku_id == changes.c.sku_id,
+                    table.c.quantity + changes.c.delta >= 0)).values(
+                    quantity=table.c.quantity + changes.c.delta).returning(
+                    table.c.location_id, table.c.sku_id))}
+            # the decreased records are deleted at zero, the others if they hold
+            # less than their decrease
+            changes = _delta_values({key: 0 if key in decreased else delta
+                                     for key, delta in remaining.items()})
+            emptied = {(location_id, sku_id): quantity
+                       for location_id, sku_id, quantity in session.execute(
+                table.delete().where(and_(
+                    table.c.location_id == changes.c.location_id,
+                    table.c.sku_id == changes.c.sku_id,
+                    or_(table.c.quantity <= 0,
+                        table.c.quantity + changes.c.delta < 0))).returning(
+                    table.c.location_id, table.c.sku_id, table.c.quantity))}
+            for key in decreased:
+                applied[key] = remaining[key]
+            for key, quantity in emptied.items():
+                if key not in decreased:
+                    applied[key] = -quantity
+            done = decreased | emptied.keys()
+            if not done:
+                break
+            remaining = {key: delta for key, delta in remaining.items()
+                         if key not in done}
+        return list(remaining)
+
+    @classmethod
+    def transfer(cls, session, source_ids, target_id, sku_ids=None, actor=None):
+        """
+        Move the sku records of one or more locations into a target location in the
+        current transaction, merging quantities the target already holds. The
+        source records are locked with `SELECT ... FOR UPDATE`, merged with one
+        `INSERT INTO sku_locations ... SELECT ... GROUP BY sku_id ON CONFLICT
+        (location_id, sku_id) DO UPDATE SET quantity = quantity + excluded.quantity`
+        and removed with one DELETE, however many skus move. The StockTotal
+        aggregate follows transfers between warehouses and the ledger records the
+        moved quantities. The caller commits.
+        :param: session: the sqlalchemy session
+        :param: source_ids: the InventoryLocation ids to move from, the target is
+        ignored if it is one of them
+        :param: target_id: the InventoryLocation id to move to
+        :param: sku_ids: only move these ProductSku ids, default all
+        :param: actor: who moved them, default the user and host
+        :return: a TransferSummary(records, skus, units) of what moved
+        """
+        table = cls.__table__
+        source_ids = set(source_ids) - {target_id}
+        where = table.c.location_id.in_(source_ids)
+        if sku_ids is not None:
+            where = and_(where, table.c.sku_id.in_(set(sku_ids)))
+        rows = session.execute(select(
+            [table.c.location_id, table.c.sku_id, table.c.quantity]).where(
+            where).with_for_update()).fetchall() if source_ids else []
+        if not rows:
+            return TransferSummary(0, 0, 0)
+        merged = select([bindparam('target', target_id, type_=Integer),
+                         table.c.sku_id, func.sum(table.c.quantity)]).where(
+            where).group_by(table.c.sku_id)
+        upsert = dialect_insert(session, table).from_select(
+            ['location_id', 'sku_id', 'quantity'], merged)
+        session.execute(on_conflict_increment(
+            upsert, ['location_id', 'sku_id'], ['quantity']))
+        session.execute(table.delete().where(where))
+        deltas = defaultdict(int)
+        for location_id, sku_id, quantity in rows:
+            deltas[(location_id, sku_id)] -= quantity
+            deltas[(target_id, sku_id)] += quantity
+        StockTotal.apply_location_deltas(session, deltas)
+        InventoryMovement.record(session, deltas, TRANSFER, actor)
+        _forget_records(session, source_ids | {target_id})
+        return TransferSummary(len(rows), len({sku_id for _, sku_id, _ in rows}),
+                               sum(quantity for _, _, quantity in rows))
+
+    @classmethod
+    def rebuild(cls, session):
+        """
+        Project the sku_locations table from the inventory_movements ledger in the
+        current transaction, for the locations and skus which still exist. The
+        StockTotal aggregate must be rebuilt after. The caller commits.
+        :param: session: the sqlalchemy session
+        :return: the number of sku records
+        """
+        from honey.models.skus import ProductSku
+        table = cls.__table__
+        ledger = InventoryMovement.quantities().alias('ledger')
+        locations = InventoryLocation.__table__
+        skus = ProductSku.__table__
+        session.execute(table.delete())
+        projected = select([ledger.c.location_id, ledger.c.sku_id, ledger.c.quantity]
+                           ).select_from(ledger.join(
+                               locations, locations.c.id == ledger.c.location_id).join(
+                               skus, skus.c.id == ledger.c.sku_id))
+        session.execute(table.insert().from_select(
+            ['location_id', 'sku_id', 'quantity'], projected))
+        _forget_records(session, set(
+            session.execute(select([locations.c.id])).scalars()))
+        return session.query(func.count()).select_from(table).scalar()
+
+
+class StockTotal(ModelBase, AuditMixin):
+    """
+    The stock on hand of a sku per warehouse, the sum of the sku_locations quantity
+    over the locations of the warehouse. It is maintained incrementally in the same
+    transaction as every quantity change, by LocationSkuAssoc.apply_deltas for the
+    scan paths and by mapper events for ORM changes, so a total is one primary key
+    read. Changes made outside of both, like a database level cascade delete, are
+    repaired by `honey stock rebuild`.
+
+    NOTE for changes: this model is imported in alembic/env.py for migrations.
+    """
+    __tablename__ = 'stock_totals'
+    sku_id = Column('sku_id', Integer,
+                    ForeignKey('product_skus.id', ondelete='CASCADE'),
+                    primary_key=True)
+    warehouse_id = Column('warehouse_id', Integer,
+                          ForeignKey('warehouses.id', ondelete='CASCADE'),
+                          primary_key=True)
+    quantity = Column('quantity', Integer, nullable=False)
+
+    def __init__(self, sku_id, warehouse_id, quantity):
+        self.sku_id = sku_id
+        self.warehouse_id = warehouse_id
+        self.quantity = quantity
+
+    def __repr__(self):
+        return f'<StockTotal {self.sku_id, self.warehouse_id, self.quantity}>'
+
+    @classmethod
+    def apply_location_deltas(cls, bind, deltas):
+        """
+        Add location quantity changes to the warehouse totals.
+        :param: bind: the session or connection of the current transaction
+        :param: deltas: a dict like {(location_id, sku_id): signed quantity change}
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        locations = InventoryLocation.__table__
+        rows = bind.execute(select([locations.c.id, locations.c.warehouse_id]).where(
+            locations.c.id.in_({location_id for location_id, _ in deltas})))
+        warehouses = {location_id: warehouse_id for location_id, warehouse_id in rows}
+        totals = defaultdict(int)
+        for (location_id, sku_id), delta in deltas.items():
+            if location_id in warehouses:
+                totals[(sku_id, warehouses[location_id])] += delta
+        cls.apply(bind, totals)
+
+    @classmethod
+    def apply(cls, bind, totals):
+        """
+        Add changes to the totals with one upsert, totals which reach zero are deleted.
+        :param: bind: the session or connection of the current transaction
+        :param: totals: a dict like {(sku_id, warehouse_id): signed quantity change}
+        """
+        params = [{'sku_id': sku_id, 'warehouse_id': warehouse_id, 'quantity': delta}
+                  for (sku_id, warehouse_id), delta in sorted(totals.items()) if delta]
+        if not params:
+            return
+        table = cls.__table__
+        bind.execute(on_conflict_increment(
+            dialect_insert(bind, table), ['sku_id', 'warehouse_id'], ['quantity']),
+            params)
+        bind.execute(table.delete().where(and_(
+            table.c.sku_id == bindparam('sku'),
+            table.c.warehouse_id == bindparam('wh'),
+            table.c.quantity <= 0)),
+            [{'sku': p['sku_id'], 'wh': p['warehouse_id']} for p in params])
+
+    @classmethod
+    def rebuild(cls, session):
+        """
+        Recompute every total from sku_locations with one GROUP BY, in the current
+        transaction. The caller commits.
+        :param: session: the sqlalchemy session
+        :return: the number of totals
+        """
+        table = cls.__table__
+        sku_locations = LocationSkuAssoc.__table__
+        locations = InventoryLocation.__table__
+        session.execute(table.delete())
+        grouped = select([
+            sku_locations.c.sku_id, locations.c.warehouse_id,
+            func.sum(sku_locations.c.quantity)
+        ]).select_from(sku_locations.join(
+            locations, locations.c.id == sku_locations.c.location_id)).group_by(
+            sku_locations.c.sku_id, locations.c.warehouse_id).having(
+            func.sum(sku_locations.c.quantity) > 0)
+        session.execute(table.insert().from_select(
+            ['sku_id', 'warehouse_id', 'quantity'], grouped))
+        return session.query(func.count()).select_from(table).scalar()
+
+    @classmethod
+    def as_of(cls, session, at):
+        """
+        :param: session: the sqlalchemy session
+        :param: at: a past time
+        :return: a select of (sku_id, warehouse_id, quantity) like the totals at the
+        time, from the nearest StockSnapshot and the movements since
+        """
+        quantities = StockSnapshot.as_of(session, at).alias('quantities')
+        locations = InventoryLocation.__table__
+        return select([
+            quantities.c.sku_id, locations.c.warehouse_id,
+            func.sum(quantities.c.quantity).label('quantity')
+        ]).select_from(quantities.join(
+            locations, locations.c.id == quantities.c.location_id)).group_by(
+            quantities.c.sku_id, locations.c.warehouse_id)
+
+    @classmethod
+    def total(cls, session, sku_id, warehouse_id=None):
+        """
+        :return: the stock on hand of a sku in a warehouse, or in all warehouses
+        """
+        query = session.query(func.coalesce(func.sum(cls.quantity), 0)).filter(
+            cls.sku_id == sku_id)
+        if warehouse_id is not None:
+            query = query.filter(cls.warehouse_id == warehouse_id)
+        return query.scalar()
+
+
+def _delta_values(deltas):
+    """
+    :param: deltas: a dict like {(location_id, sku_id): signed quantity change}
+    :return: a `VALUES` clause of (location_id, sku_id, delta) rows to join on
+    """
+    return values(column('location_id', Integer), column('sku_id', Integer),
+                  column('delta', Integer), name='changes').data(
+        [(location_id, sku_id, delta)
+         for (location_id, sku_id), delta in deltas.items()])
+
+
+def _forget_records(session, location_ids):
+    """
+    Drop the sku records of locations changed by a bulk statement from the session,
+    so the ORM reloads them instead of flushing stale rows.
+    """
+    for obj in list(session.identity_map.values()):
+        state = inspect(obj)
+        if isinstance(obj, LocationSkuAssoc) \
+                and state.dict.get('location_id') in location_ids:
+            session.expunge(obj)
+        elif isinstance(obj, InventoryLocation) and state.dict.get('id') in location_ids:
+            session.expire(obj, ['skus'])
+
+
+def _previous(target, key):
+    """:return: the value of an attribute before the pending change"""
+    history = get_history(target, key)
+    return history.deleted[0] if history.deleted else getattr(target, key)
+
+
+def _stock_after_insert(mapper, connection, target):
+    deltas = {(target.location_id, target.sku_id): target.quantity}
+    StockTotal.apply_location_deltas(connection, deltas)
+    InventoryMovement.record(connection, deltas, ADJUST)
+
+
+def _stock_after_update(mapper, connection, target):
+    deltas = defaultdict(int)
+    deltas[(_previous(target, 'location_id'), _previous(target, 'sku_id'))] -= \
+        _previous(target, 'quantity')
+    deltas[(target.location_id, target.sku_id)] += target.quantity
+    StockTotal.apply_location_deltas(connection, deltas)
+    InventoryMovement.record(connection, deltas, ADJUST)
+
+
+def _stock_before_delete(mapper, connection, target):
+    deltas = {(target.location_id, target.sku_id): -target.quantity}
+    StockTotal.apply_location_deltas(connection, deltas)
+    InventoryMovement.record(connection, deltas, ADJUST)
+
+
+def _stock_location_moved(mapper, connection, target):
+    """Move the stock of a location when it moves to another warehouse."""
+    old_warehouse_id = _previous(target, 'warehouse_id')
+    if old_warehouse_id == target.warehouse_id:
+        return
+    sku_locations = LocationSkuAssoc.__table__
+    totals = defaultdict(int)
+    for sku_id, quantity in connection.execute(
+            select([sku_locations.c.sku_id, sku_locations.c.quantity]).where(
+                sku_locations.c.location_id == target.id)):
+        totals[(sku_id, old_warehouse_id)] -= quantity
+        totals[(sku_id, target.warehouse_id)] += quantity
+    StockTotal.apply(connection, totals)
+
+
+event.listen(LocationSkuAssoc, 'after_insert', _stock_after_insert)
+event.listen(LocationSkuAssoc, 'after_update', _stock_after_update)
+event.listen(LocationSkuAssoc, 'before_delete', _stock_before_delete)
+event.listen(InventoryLocation, 'after_update', _stock_location_moved)
@@ -0,0 +1,51 @@
+from sqlalchemy import Column, Integer, Unicode
+from honey.core.database import (ModelBase, AuditMixin, dialect_insert,
+                                 on_conflict_update)
+
+
+class ScanJournalCheckpoint(ModelBase, AuditMixin):
+    """
+    How far a scanner station's local scan journal has been applied to the
+    database, as a (segment, offset) position in the journal files. The checkpoint
+    is written in the same transaction as the scanned quantities it covers, so a
+    journal can be replayed any number of times without counting a scan twice.
+
+    NOTE for changes: this model is imported in alembic/env.py for migrations.
+    """
+    __tablename__ = 'scan_journal_checkpoints'
+    station = Column('station', Unicode(), primary_key=True)
+    segment = Column('segment', Integer, nullable=False)
+    offset = Column('offset', Integer, nullable=False)
+
+    def __init__(self, station, segment, offset):
+        self.station = station
+        self.segment = segment
+        self.offset = offset
+
+    def __repr__(self):
+        return f'<ScanJournalCheckpoint {self.station, self.segment, self.offset}>'
+
+    @classmethod
+    def position(cls, session, station):
+        """
+        Get the applied journal position for a station.
+        :param: session: the sqlalchemy session
+        :param: station: the scanner station name
+        :return: a (segment, offset) tuple, (0, 0) if nothing was applied yet
+        """
+        row = session.query(cls.segment, cls.offset).filter(
+            cls.station == station).first()
+        return tuple(row) if row else (0, 0)
+
+    @classmethod
+    def advance(cls, session, station, position):
+        """
+        Record the applied journal position for a station in the current transaction.
+        :param: session: the sqlalchemy session
+        :param: station: the scanner station name
+        :param: position: the (segment, offset) just past the last applied scan
+        """
+        segment, offset = position
+        stmt = on_conflict_update(dialect_insert(session, cls), ['station'],
+                                  {'segment': segment, 'offset': offset})
+        session.execute(stmt, {'station': station, 'segment': segment, 'offset': offset})
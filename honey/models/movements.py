@@ -0,0 +1,247 @@
+import functools
+import getpass
+import socket
+from sqlalchemy import (BigInteger, Column, ForeignKey, Index, Integer, Table,
+                        Unicode, and_, bindparam, func, literal, select, union_all)
+from honey.core.database import (ModelBase, SurrogatePK, UTCDateTime, time_utcnow)
+from honey.core.exc import HoneyError
+
+# why a quantity changed
+OPENING = 'opening'
+SCAN = 'scan'
+TRANSFER = 'transfer'
+ADJUST = 'adjust'
+COMPACTED = 'compacted'
+REASONS = (OPENING, SCAN, TRANSFER, ADJUST, COMPACTED)
+
+
+@functools.lru_cache(maxsize=1)
+def default_actor():
+    """:return: who changes stock from this process, like `bob@station-1`"""
+    try:
+        user = getpass.getuser()
+    except (KeyError, OSError):
+        user = 'unknown'
+    return f'{user}@{socket.gethostname()}'
+
+
+class InventoryMovement(ModelBase):
+    """
+    The append-only ledger of sku quantity changes per location. Every change of
+    sku_locations appends one row per (location_id, sku_id) with the signed delta
+    which was applied, why and by whom, in the same transaction as the change, so
+    the sum of the deltas of a location and sku is its quantity and the ledger
+    answers what happened when.
+
+    The ids are not foreign keys, the history of deleted locations and skus is
+    kept. Old movements are folded into one row per location and sku by
+    `honey stock compact`, and sku_locations can be projected from the ledger
+    again by `honey stock rebuild --locations`. The StockSnapshot answers what was
+    in stock at a past time from the ledger.
+
+    NOTE for changes: this model is imported in alembic/env.py for migrations.
+    """
+    __tablename__ = 'inventory_movements'
+    __table_args__ = (
+        Index('ix_inventory_movements_sku_id_occurred_on', 'sku_id', 'occurred_on'),
+        Index('ix_inventory_movements_location_id_occurred_on',
+              'location_id', 'occurred_on'),
+    )
+    # sqlite only autoincrements an INTEGER primary key
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True,
+                autoincrement=True)
+    occurred_on = Column('occurred_on', UTCDateTime(timezone=True), nullable=False,
+                         default=time_utcnow, index=True)
+    location_id = Column('location_id', Integer, nullable=False)
+    sku_id = Column('sku_id', Integer, nullable=False)
+    delta = Column('delta', Integer, nullable=False)
+    reason = Column('reason', Unicode(), nullable=False)
+    actor = Column('actor', Unicode())
+
+    def __init__(self, location_id, sku_id, delta, reason, actor=None):
+        self.location_id = location_id
+        self.sku_id = sku_id
+        self.delta = delta
+        self.reason = reason
+        self.actor = actor
+
+    def __repr__(self):
+        return f'<InventoryMovement {self.location_id, self.sku_id, self.delta, self.reason}>'
+
+    @classmethod
+    def record(cls, bind, deltas, reason, actor=None, occurred_on=None):
+        """
+        Append the applied quantity changes with one executemany INSERT.
+        :param: bind: the session or connection of the current transaction
+        :param: deltas: a dict like {(location_id, sku_id): signed quantity change}
+        :param: reason: one of REASONS
+        :param: actor: who made the change, default the user and host
+        :param: occurred_on: when the changes happened, a time or a dict of times
+        per (location_id, sku_id), default now
+        """
+        now = time_utcnow()
+        times = occurred_on if isinstance(occurred_on, dict) else {}
+        default = now if isinstance(occurred_on, dict) else occurred_on or now
+        actor = actor or default_actor()
+        params = [{'location_id': location_id, 'sku_id': sku_id, 'delta': delta,
+                   'reason': reason, 'actor': actor,
+                   'occurred_on': times.get((location_id, sku_id), default)}
+                  for (location_id, sku_id), delta in sorted(deltas.items()) if delta]
+        if params:
+            bind.execute(cls.__table__.insert(), params)
+
+    @classmethod
+    def quantities(cls, until=None):
+        """
+        :param: until: only sum the movements which occurred at or before this time
+        :return: a select of (location_id, sku_id, quantity) summed from the
+        ledger, for the keys with a quantity left
+        """
+        table = cls.__table__
+        query = select([table.c.location_id, table.c.sku_id,
+                        func.sum(table.c.delta).label('quantity')])
+        if until is not None:
+            query = query.where(table.c.occurred_on <= until)
+        return query.group_by(table.c.location_id, table.c.sku_id).having(
+            func.sum(table.c.delta) > 0)
+
+    @classmethod
+    def compact(cls, session, before):
+        """
+        Fold the movements which occurred before a time into one movement per
+        (location_id, sku_id) and period between StockSnapshots, holding their sum
+        and stamped with the end of the period, the next snapshot time or the
+        horizon. Quantities at the snapshot times and from the horizon on are
+        unchanged, in between the detail is dropped and stock as of an earlier time
+        is answered at the nearest earlier snapshot. The caller commits.
+        :param: session: the sqlalchemy session
+        :param: before: the compaction horizon
+        :return: a (removed, kept) tuple of movement counts
+        """
+        table = cls.__table__
+        last_id = session.execute(select([func.max(table.c.id)]).where(
+            table.c.occurred_on < before)).scalar()
+        if last_id is None:
+            return 0, 0
+        ends = [taken_at for taken_at, in session.query(StockSnapshot.taken_at).filter(
+            StockSnapshot.taken_at < before).order_by(StockSnapshot.taken_at)]
+        removed = kept = 0
+        start = None
+        for end in ends + [before]:
+            period = and_(table.c.id <= last_id, table.c.occurred_on < before,
+                          table.c.occurred_on <= end)
+            if start is not None:
+                period = and_(period, table.c.occurred_on > start)
+            folded = select([
+                table.c.location_id, table.c.sku_id, func.sum(table.c.delta),
+                literal(COMPACTED),
+                bindparam('end', end, type_=UTCDateTime(timezone=True))
+            ]).where(period).group_by(table.c.location_id, table.c.sku_id).having(
+                func.sum(table.c.delta) != 0)
+            kept += session.execute(table.insert().from_select(
+                ['location_id', 'sku_id', 'delta', 'reason', 'occurred_on'],
+                folded)).rowcount
+            removed += session.execute(table.delete().where(period)).rowcount
+            start = end
+        return removed, kept
+
+
+# the quantity of every location and sku at the time of a StockSnapshot
+stock_snapshot_rows = Table(
+    'stock_snapshot_rows', ModelBase.metadata,
+    Column('snapshot_id', Integer, ForeignKey('stock_snapshots.id', ondelete='CASCADE'),
+           primary_key=True),
+    Column('location_id', Integer, primary_key=True),
+    Column('sku_id', Integer, primary_key=True),
+    Column('quantity', Integer, nullable=False)
+)
+
+
+class StockSnapshot(ModelBase, SurrogatePK):
+    """
+    A compact copy of the sku_locations quantities at a time, one
+    stock_snapshot_rows row per location and sku in stock. Stock as of a past
+    time is the nearest earlier snapshot plus the movements after it, so a query
+    reads one snapshot and at most the movements between two snapshots, however
+    many years of history the ledger holds. Take one periodically, like at every
+    month-end close, with `honey stock snapshot`.
+
+    The locations are reported in the warehouse they are in now.
+
+    NOTE for changes: this model is imported in alembic/env.py for migrations.
+    """
+    __tablename__ = 'stock_snapshots'
+    taken_at = Column('taken_at', UTCDateTime(timezone=True), nullable=False,
+                      unique=True)
+    records = Column('records', Integer, nullable=False, default=0)
+
+    def __init__(self, taken_at, records=0):
+        self.taken_at = taken_at
+        self.records = records
+
+    def __repr__(self):
+        return f'<StockSnapshot {self.taken_at}>'
+
+    @classmethod
+    def nearest(cls, session, at):
+        """:return: the latest StockSnapshot taken at or before a time, or None"""
+        return session.query(cls).filter(cls.taken_at <= at).order_by(
+            cls.taken_at.desc()).first()
+
+    @classmethod
+    def take(cls, session, at=None):
+        """
+        Store the quantities as of a time with one INSERT ... SELECT, computed from
+        the nearest earlier snapshot and the movements since. The caller commits.
+        :param: session: the sqlalchemy session
+        :param: at: the snapshot time, default now
+        :return: the StockSnapshot, raise HoneyError if the time is in the future
+        or a snapshot of that time exists
+        """
+        now = time_utcnow()
+        at = at or now
+        if at > now:
+            raise HoneyError('A snapshot of the future can not be taken.')
+        if session.query(cls.id).filter(cls.taken_at == at).first():
+            raise HoneyError(f'A snapshot of {at} exists.')
+        quantities = cls.as_of(session, at).alias('quantities')
+        snapshot = cls(at)
+        session.add(snapshot)
+        session.flush()
+        snapshot.records = session.execute(stock_snapshot_rows.insert().from_select(
+            ['snapshot_id', 'location_id', 'sku_id', 'quantity'],
+            select([bindparam('snapshot', snapshot.id, type_=Integer),
+                    quantities.c.location_id, quantities.c.sku_id,
+                    quantities.c.quantity]))).rowcount
+        return snapshot
+
+    @classmethod
+    def as_of(cls, session, at, location_ids=None):
+        """
+        :param: session: the sqlalchemy session
+        :param: at: the time, movements at that time are included
+        :param: location_ids: only these InventoryLocation ids, default all
+        :return: a select of (location_id, sku_id, quantity) in stock at the time
+        """
+        movements = InventoryMovement.__table__
+        parts = []
+        changes = select([movements.c.location_id, movements.c.sku_id,
+                          movements.c.delta.label('quantity')]).where(
+            movements.c.occurred_on <= at)
+        snapshot = cls.nearest(session, at)
+        if snapshot is not None:
+            rows = stock_snapshot_rows
+            stored = select([rows.c.location_id, rows.c.sku_id, rows.c.quantity]).where(
+                rows.c.snapshot_id == snapshot.id)
+            if location_ids is not None:
+                stored = stored.where(rows.c.location_id.in_(location_ids))
+            parts.append(stored)
+            changes = changes.where(movements.c.occurred_on > snapshot.taken_at)
+        if location_ids is not None:
+            changes = changes.where(movements.c.location_id.in_(location_ids))
+        parts.append(changes)
+        combined = union_all(*parts).alias('combined')
+        return select([combined.c.location_id, combined.c.sku_id,
+                       func.sum(combined.c.quantity).label('quantity')]).group_by(
+            combined.c.location_id, combined.c.sku_id).having(
+            func.sum(combined.c.quantity) > 0)
@@ -0,0 +1,43 @@
+"""
+Named loading profiles for the inventory relationships.
+
+The relationships between InventoryLocation, LocationSkuAssoc and ProductSku
+load lazily by default. A command which renders related rows applies the
+profile for its use case as query options, which loads exactly the columns and
+relationships it renders in a fixed number of queries and raises on any other
+relationship access instead of silently emitting a query per row::
+
+    session.query(InventoryLocation).options(*profile('contents'))
+
+Profiles:
+    contents: an InventoryLocation with its sku records, skus and quantities
+"""
+from sqlalchemy.orm import load_only, selectinload, raiseload
+from honey.core.exc import HoneyError
+from honey.models.inventory import InventoryLocation, LocationSkuAssoc
+from honey.models.skus import ProductSku
+
+
+def _contents():
+    return (
+        load_only(InventoryLocation.id, InventoryLocation.label),
+        selectinload(InventoryLocation.skus).load_only(
+            LocationSkuAssoc.quantity).joinedload(LocationSkuAssoc.sku).load_only(
+            ProductSku.sku, ProductSku.description).raiseload('*'),
+        raiseload('*'),
+    )
+
+
+PROFILES = {
+    'contents': _contents,
+}
+
+
+def profile(name):
+    """
+    :param: name: the loading profile name, like 'contents'
+    :return: a tuple of query options
+    """
+    if name not in PROFILES:
+        raise HoneyError(f'The loading profile {name} does not exist.')
+    return PROFILES[name]()
@@ -1,9 +1,12 @@
-from sqlalchemy import (Integer, Column, ForeignKey,
-                        Numeric, Unicode, UnicodeText, Table, UniqueConstraint)
-from sqlalchemy.orm import sessionmaker, relationship, backref
+from sqlalchemy import (Integer, Column, ForeignKey, Numeric, Unicode, UnicodeText,
+                        Table, UniqueConstraint, and_, bindparam, event, inspect, or_,
+                        select)
+from sqlalchemy.orm import sessionmaker, relationship, backref, validates
 from sqlalchemy.ext.associationproxy import association_proxy
 from honey.core.database import (ModelBase, CRUDMixin, SurrogatePK, AuditMixin,
                                  reference_col)
+from honey.core.exc import HoneyError
+from honey.core.barcode import to_gtin14
 
 # one ProductSku can have many different SkuAttributes.
 # one SkuAttribute can have stock in many ProductSku's.
@@ -21,6 +24,8 @@ class Container(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
     properly identified. To init the table, it should be created top down starting
     with the master carton, which will reference itself as its own parent.  Then,
     create new container types starting with PARENT and then CHILD.
+
+    Every change is mirrored into the ContainerClosure in the same flush.
     """
     __tablename__ = 'containers'
     # retail-package, inner-box, inner-master-ctn, outer-master-ctn
@@ -29,17 +34,160 @@ class Container(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
     # self-referential id
     parent_id = reference_col('containers')
     parent = relationship('Container', remote_side='Container.id', backref='children')
+    # how many of this container its parent holds, like 4 retail packages per
+    # inner box, none for the top level container or when it varies by sku
+    units_per_parent = Column('units_per_parent', Integer)
     # backref: skus
 
-    def __init__(self, name, description, parent_id, **kwargs):
+    def __init__(self, name, description, parent_id, units_per_parent=None, **kwargs):
         self.name = name
         self.description = description
         self.parent_id = parent_id
+        self.units_per_parent = units_per_parent
 
     def __repr__(self):
         return f'<Container {self.name}>'
 
 
+class ContainerClosure(ModelBase):
+    """
+    Every (ancestor, descendant) pair of the container hierarchy with the number
+    of levels between them and how many descendants one ancestor holds, including
+    the (container, container) pair at depth 0 with a multiple of 1. A unit
+    conversion or a rollup to carton counts is then one join on this table
+    instead of a walk up the parents one query at a time.
+
+    A new container adds its pairs from the pairs of its parent in the same flush,
+    any other hierarchy change rebuilds the table from the containers. The top
+    level container is its own parent, the walk up stops there, any other cycle
+    is refused with a HoneyError.
+
+    NOTE for changes: this model is imported in alembic/env.py for migrations.
+    """
+    __tablename__ = 'container_closure'
+    ancestor_id = Column(ForeignKey('containers.id', ondelete='CASCADE'),
+                         primary_key=True)
+    descendant_id = Column(ForeignKey('containers.id', ondelete='CASCADE'),
+                           primary_key=True, index=True)
+    depth = Column('depth', Integer, nullable=False)
+    # the descendants per ancestor, none if a units_per_parent on the way is unknown
+    multiple = Column('multiple', Integer)
+
+    def __init__(self, ancestor_id, descendant_id, depth, multiple):
+        self.ancestor_id = ancestor_id
+        self.descendant_id = descendant_id
+        self.depth = depth
+        self.multiple = multiple
+
+    def __repr__(self):
+        return (f'<ContainerClosure '
+                f'{self.ancestor_id, self.descendant_id, self.depth, self.multiple}>')
+
+    @staticmethod
+    def compute(containers):
+        """
+        Walk up from every container once.
+        :param: containers: an iterable of (id, name, parent_id, units_per_parent)
+        :return: a list of row dicts, or raise HoneyError for a cycle
+        """
+        parents = {}
+        names = {}
+        for id, name, parent_id, units_per_parent in containers:
+            # the top level container is its own parent
+            parents[id] = (None if parent_id == id else parent_id, units_per_parent)
+            names[id] = name
+        rows = []
+        for descendant_id in parents:
+            ancestor_id, depth, multiple = descendant_id, 0, 1
+            seen = set()
+            while ancestor_id is not None:
+                if ancestor_id in seen:
+                    raise HoneyError(f'The container hierarchy of '
+                                     f'{names[descendant_id]} is a cycle.')
+                seen.add(ancestor_id)
+                rows.append({'ancestor_id': ancestor_id, 'descendant_id': descendant_id,
+                             'depth': depth, 'multiple': multiple})
+                parent_id, units_per_parent = parents[ancestor_id]
+                if parent_id not in parents:
+                    break
+                if multiple is not None and units_per_parent is not None:
+                    multiple *= units_per_parent
+                else:
+                    multiple = None
+                ancestor_id, depth = parent_id, depth + 1
+        return rows
+
+    @classmethod
+    def rebuild(cls, bind):
+        """
+        Recompute the whole table in the current transaction, the caller commits.
+        :param: bind: the session or connection of the current transaction
+        :return: the number of pairs
+        """
+        table = Container.__table__
+        rows = cls.compute(bind.execute(select([
+            table.c.id, table.c.name, table.c.parent_id, table.c.units_per_parent])))
+        bind.execute(cls.__table__.delete())
+        if rows:
+            bind.execute(cls.__table__.insert(), rows)
+        return len(rows)
+
+    @classmethod
+    def add(cls, bind, container_id, parent_id, units_per_parent):
+        """
+        Add the pairs of a new container in the current transaction, its own pair
+        and one `INSERT ... SELECT` of the ancestors of its parent one level
+        deeper, instead of a rebuild. The caller commits.
+        :param: bind: the session or connection of the current transaction
+        :param: container_id: the new Container id
+        :param: parent_id: its parent id, the id itself for a top level container
+        :param: units_per_parent: how many of it the parent holds, or None
+        :return: the number of pairs added
+        """
+        table = cls.__table__
+        bind.execute(table.insert(), {'ancestor_id': container_id,
+                                      'descendant_id': container_id,
+                                      'depth': 0, 'multiple': 1})
+        if parent_id is None or parent_id == container_id:
+            return 1
+        ancestors = select([
+            table.c.ancestor_id, bindparam('descendant', container_id, type_=Integer),
+            table.c.depth + 1,
+            table.c.multiple * bindparam('units', units_per_parent, type_=Integer)
+        ]).where(table.c.descendant_id == parent_id)
+        added = bind.execute(table.insert().from_select(
+            ['ancestor_id', 'descendant_id', 'depth', 'multiple'], ancestors)).rowcount
+        if not added:
+            # the parent has no pairs to derive from, recompute everything
+            return cls.rebuild(bind)
+        return added + 1
+
+    @classmethod
+    def convert(cls, session, quantity, from_container_id, to_container_id):
+        """
+        Convert a quantity between two levels of the hierarchy with one read, like
+        130 retail packages to 5 master cartons of 24 and 10 loose packages.
+        :param: session: the sqlalchemy session
+        :param: quantity: the number of `from` containers
+        :return: a (quantity, remainder) tuple of `to` containers and the `from`
+        containers which don't fill one, or raise HoneyError if the containers are
+        not in one line of the hierarchy or a units_per_parent is unknown
+        """
+        table = cls.__table__
+        pair = session.execute(select([table.c.ancestor_id, table.c.multiple]).where(
+            or_(and_(table.c.ancestor_id == to_container_id,
+                     table.c.descendant_id == from_container_id),
+                and_(table.c.ancestor_id == from_container_id,
+                     table.c.descendant_id == to_container_id)))).first()
+        if pair is None:
+            raise HoneyError('The containers are not in one line of the hierarchy.')
+        if pair.multiple is None:
+            raise HoneyError('A container between them has no units_per_parent.')
+        if pair.ancestor_id == to_container_id:
+            return divmod(quantity, pair.multiple)
+        return quantity * pair.multiple, 0
+
+
 class ProductSku(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
     """
     The base model for Product Skus.
@@ -51,12 +199,18 @@ class ProductSku(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
     # skus should be unique in combination with owner_id
     sku = Column('sku', Unicode(), nullable=False)
     upc = Column('upc', Unicode(), unique=True)
+    # the upc as a canonical GTIN-14, set from the upc, null if it isn't a GTIN
+    gtin = Column('gtin', Unicode(14), unique=True, index=True)
     description = Column('description', UnicodeText())
 
     entity_id = reference_col('entities')
     entity = relationship('Entity', backref='skus')
     container_id = reference_col('containers')
     container = relationship('Container', backref='skus')
+    # a carton level sku, like a master carton with its own GTIN-14, references
+    # the sku of the container one level down. see SkuPackCapacity
+    unit_sku_id = reference_col('product_skus', col_kwargs={'nullable': True})
+    unit_sku = relationship('ProductSku', remote_side='ProductSku.id')
 
     sku_attrs = relationship(
         "SkuAttribute",
@@ -73,18 +227,26 @@ class ProductSku(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
 
     # proxies to the LocationSkuAssoc -> [<LocationSkuAssoc ('C2-W-L', 'hg-1')>, ]
     locations = relationship("LocationSkuAssoc", back_populates="sku",
-                 lazy="selectin", passive_deletes=True)
+                 lazy="select", passive_deletes=True)
 
-    def __init__(self, sku, upc, description, entity_id, container_id, **kwargs):
+    def __init__(self, sku, upc, description, entity_id, container_id,
+                 unit_sku_id=None, **kwargs):
         self.sku = sku
         self.description = description
         self.upc = upc
         self.entity_id = entity_id
         self.container_id = container_id
+        self.unit_sku_id = unit_sku_id
 
     def __repr__(self):
         return f'<ProductSku {self.sku, self.entity}>'
 
+    @validates('upc')
+    def validate_upc(self, key, upc):
+        """Keep the gtin in sync, raise InvalidBarcode for a bad check digit."""
+        self.gtin = to_gtin14(upc)
+        return upc
+
 
 class SkuAttribute(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
     """
@@ -119,3 +281,129 @@ class SkuAttribute(ModelBase, CRUDMixin, SurrogatePK, AuditMixin):
     def __repr__(self):
         return f'<SkuAttribute {self.key}={self.value}>'
 
+
+class SkuPackCapacity(ModelBase, AuditMixin):
+    """
+    The precomputed unit multiple of every carton level ProductSku, so a scan of a
+    master carton barcode is resolved to its retail unit sku and quantity without
+    walking the container hierarchy on every scan.
+
+    A carton level sku references the sku one container level down with
+    `unit_sku_id`, retail package <- inner box <- master carton. The multiple of
+    a level is its 'retail-capacity' SkuAttribute when it has one, else its
+    'child-capacity', or else the ContainerClosure multiple of its container over
+    the container of the level below, times the multiple of the level below. Run
+    `rebuild()`, or `honey invact packs --rebuild`, after changing those skus,
+    attributes or containers.
+
+    NOTE for changes: this model is imported in alembic/env.py for migrations.
+    """
+    __tablename__ = 'sku_pack_capacities'
+    pack_sku_id = Column(ForeignKey('product_skus.id', ondelete='CASCADE'),
+                         primary_key=True)
+    unit_sku_id = Column(ForeignKey('product_skus.id', ondelete='CASCADE'),
+                         nullable=False)
+    multiple = Column('multiple', Integer, nullable=False)
+
+    def __init__(self, pack_sku_id, unit_sku_id, multiple):
+        self.pack_sku_id = pack_sku_id
+        self.unit_sku_id = unit_sku_id
+        self.multiple = multiple
+
+    def __repr__(self):
+        return f'<SkuPackCapacity {self.pack_sku_id, self.unit_sku_id, self.multiple}>'
+
+    @classmethod
+    def compute(cls, session):
+        """
+        Walk the carton hierarchy of every sku once.
+        :param: session: the sqlalchemy session
+        :return: a dict of {pack_sku_id: (unit_sku_id, multiple)} for every sku with
+        a unit_sku_id, or raise HoneyError for a missing capacity or a cycle
+        """
+        skus = dict(session.query(ProductSku.id, ProductSku.unit_sku_id))
+        names = dict(session.query(ProductSku.id, ProductSku.sku))
+        containers = dict(session.query(ProductSku.id, ProductSku.container_id))
+        container_multiples = {
+            (ancestor_id, descendant_id): multiple
+            for ancestor_id, descendant_id, multiple in session.query(
+                ContainerClosure.ancestor_id, ContainerClosure.descendant_id,
+                ContainerClosure.multiple).filter(ContainerClosure.multiple.isnot(None))}
+        capacities = {}
+        rows = session.query(
+            productsku_skuattr_assoc.c.sku_id, SkuAttribute.key, SkuAttribute.value
+        ).join(SkuAttribute, SkuAttribute.id == productsku_skuattr_assoc.c.skuattr_id
+               ).filter(SkuAttribute.key.in_(('retail-capacity', 'child-capacity')))
+        for sku_id, key, value in rows:
+            try:
+                capacities[(sku_id, key)] = int(value)
+            except ValueError:
+                raise HoneyError(f'The {key} of {names[sku_id]} is not an integer: {value}')
+        resolved = {}
+
+        def resolve(sku_id, seen):
+            if skus[sku_id] is None:
+                return sku_id, 1
+            if sku_id in resolved:
+                return resolved[sku_id]
+            if sku_id in seen:
+                raise HoneyError(f'The carton hierarchy of {names[sku_id]} is a cycle.')
+            unit_sku_id, multiple = resolve(skus[sku_id], seen | {sku_id})
+            if (sku_id, 'retail-capacity') in capacities:
+                multiple = capacities[(sku_id, 'retail-capacity')]
+            elif (sku_id, 'child-capacity') in capacities:
+                multiple *= capacities[(sku_id, 'child-capacity')]
+            elif (containers[sku_id], containers[skus[sku_id]]) in container_multiples:
+                multiple *= container_multiples[(containers[sku_id],
+                                                 containers[skus[sku_id]])]
+            else:
+                raise HoneyError(f'The carton sku {names[sku_id]} needs a '
+                                 f'retail-capacity or child-capacity attribute, or '
+                                 f'the units_per_parent of its containers.')
+            resolved[sku_id] = unit_sku_id, multiple
+            return resolved[sku_id]
+
+        for sku_id, unit_sku_id in skus.items():
+            if unit_sku_id is not None:
+                resolve(sku_id, frozenset())
+        return resolved
+
+    @classmethod
+    def rebuild(cls, session):
+        """
+        Recompute the whole capacity table in the current transaction. The caller
+        commits, which also invalidates the loaded UPC indexes.
+        :param: session: the sqlalchemy session
+        :return: the number of carton skus
+        """
+        resolved = cls.compute(session)
+        session.execute(cls.__table__.delete())
+        if resolved:
+            session.execute(cls.__table__.insert(), [
+                {'pack_sku_id': pack_sku_id, 'unit_sku_id': unit_sku_id,
+                 'multiple': multiple}
+                for pack_sku_id, (unit_sku_id, multiple) in resolved.items()])
+        session.info['upc_index_stale'] = True
+        return len(resolved)
+
+
+def _container_inserted(mapper, connection, target):
+    ContainerClosure.add(connection, target.id, target.parent_id,
+                         target.units_per_parent)
+
+
+def _container_deleted(mapper, connection, target):
+    ContainerClosure.rebuild(connection)
+
+
+def _container_updated(mapper, connection, target):
+    # a new name or description leaves the hierarchy as it is
+    state = inspect(target)
+    if state.attrs.parent_id.history.has_changes() \
+            or state.attrs.units_per_parent.history.has_changes():
+        ContainerClosure.rebuild(connection)
+
+
+event.listen(Container, 'after_insert', _container_inserted)
+event.listen(Container, 'after_update', _container_updated)
+event.listen(Container, 'after_delete', _container_deleted)
@@ -0,0 +1,41 @@
+"""
+Small helpers shared across the honey controllers and core modules.
+"""
+from configparser import Error as ConfigError
+import pendulum
+from honey.core.exc import HoneyError
+
+
+def get_config(app, key, fallback=None):
+    """
+    Get a honey config setting from the `honeytest` section when the app is
+    under test, otherwise from the `honey` section.
+    :param: app: the current app
+    :param: key: the config setting name, like 'WAREHOUSE_CACHE_KEY'
+    :param: fallback: returned if the setting is missing from the config
+    :return: the config setting value
+    """
+    section = 'honey'
+    try:
+        if app.__test__:
+            section = 'honeytest'
+    except AttributeError:
+        pass
+    try:
+        value = app.config.get(section, key)
+    except ConfigError:
+        return fallback
+    return fallback if value is None else value
+
+
+def parse_time(value):
+    """
+    Parse a date or time given on the command line, like `2026-09-30` or
+    `2026-09-30T18:00`, times without a timezone are UTC.
+    :param: value: the text to parse
+    :return: a timezone aware datetime, raise HoneyError if it isn't a date
+    """
+    try:
+        return pendulum.parse(value, tz='UTC')
+    except ValueError:
+        raise HoneyError(f'{value} is not a date or time like 2026-09-30T18:00')
@@ -0,0 +1,74 @@
+import asyncio
+import os
+from pytest import raises
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from honey.core.asyncdb import (AsyncDatabase, apply_scans, async_url, get_entity,
+                                get_location, get_warehouse, location_contents)
+from honey.core.database import ModelBase
+from honey.core.exc import HoneyError
+from honey.models.entities import Entity
+from honey.models.inventory import InventoryLocation, StockTotal, Warehouse
+from honey.models.skus import Container, ProductSku
+
+
+class TestAsyncDatabase:
+    """
+    Async data access layer tests, on sqlite with aiosqlite.
+    """
+
+    def test_async_url(self):
+        """
+        Test the asyncio driver replaces the driver of the configured url
+        """
+        assert str(async_url('postgresql+psycopg2://bob@localhost/honey')) == \
+            'postgresql+asyncpg://bob@localhost/honey'
+        assert str(async_url('sqlite:///honey.db')) == 'sqlite+aiosqlite:///honey.db'
+        with raises(HoneyError):
+            async_url('mysql://bob@localhost/honey')
+
+    def test_async_scans(self, tmp):
+        """
+        Test the awaitable lookups and scans with two sessions on one event loop
+        """
+        url = f"sqlite:///{os.path.join(tmp.dir, 'async.db')}"
+        engine = create_engine(url)
+        ModelBase.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        entity = Entity('honeygear')
+        session.add(entity)
+        session.flush()
+        warehouse = Warehouse('Garage', entity.id)
+        # a top level container is its own parent
+        container = Container('retail', 'a retail package', 1)
+        container.id = 1
+        session.add_all([warehouse, container])
+        session.flush()
+        session.add_all([
+            InventoryLocation('HG-1', warehouse.id),
+            ProductSku('A1-W-L', '111', 'a white grapple', entity.id, container.id)])
+        session.commit()
+        session.close()
+
+        async def scan_and_read():
+            db = AsyncDatabase(url)
+            async with db.session() as first, db.session() as second:
+                wh_obj, ent_obj = await asyncio.gather(
+                    get_warehouse(first, 'Garage', 'honeygear'),
+                    get_entity(second, 'honeygear'))
+                assert wh_obj.entity_id == ent_obj.id
+                with raises(HoneyError):
+                    await get_warehouse(second, 'Attic')
+                location = await get_location(first, wh_obj.id, 'HG-1')
+                result = await apply_scans(first, location.id, ['111', '111', 'nope'])
+                await first.commit()
+                contents = await location_contents(second, location.id)
+            await db.dispose()
+            return result, contents
+
+        result, contents = asyncio.run(scan_and_read())
+        assert (result.scans, result.skus, result.unknown) == (2, 1, ['nope'])
+        assert contents == [('A1-W-L', 'a white grapple', 2)]
+        session = sessionmaker(bind=engine)()
+        assert session.query(StockTotal.quantity).scalar() == 2
+        session.close()
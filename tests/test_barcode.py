@@ -0,0 +1,42 @@
+from pytest import raises
+from honey.core.barcode import (gtin_check_digit, to_gtin14, barcode_key,
+                                InvalidBarcode)
+from honey.core.upcindex import UpcIndex
+from honey.models.skus import ProductSku
+
+
+class TestBarcode:
+    """
+    GTIN normalization tests.
+    """
+
+    def test_gtin_forms_normalize_to_gtin14(self):
+        """
+        Test UPC-A, EAN-13 and GTIN-14 forms of an item have one GTIN-14
+        """
+        assert gtin_check_digit('03600029145') == 2
+        assert to_gtin14('036000291452') == '00036000291452'
+        assert to_gtin14('0036000291452') == '00036000291452'
+        assert to_gtin14(' 00036000291452 ') == '00036000291452'
+        assert to_gtin14('upccode1') is None
+        assert barcode_key('upccode1') == 'upccode1'
+        with raises(InvalidBarcode):
+            to_gtin14('036000291453')
+
+    def test_upc_index_matches_any_gtin_form(self, HoneyApp, hooks, db, sku):
+        """
+        Test the index resolves every GTIN form of a sku upc and rejects bad reads
+        """
+        gtin_sku = ProductSku('G1-W-L', '036000291452', 'a gtin sku', sku.entity_id,
+                              sku.container_id)
+        db.add(gtin_sku)
+        db.commit()
+        assert gtin_sku.gtin == '00036000291452'
+        with HoneyApp(hooks=hooks) as app:
+            upc_index = UpcIndex(app).load()
+            assert upc_index.get('0036000291452').id == gtin_sku.id
+            assert upc_index.get('00036000291452').id == gtin_sku.id
+            assert upc_index.get(sku.upc).id == sku.id
+            with raises(InvalidBarcode):
+                upc_index.get('036000291453')
+            assert upc_index.get_many(['036000291453']) == {'036000291453': None}
@@ -0,0 +1,49 @@
+from honey.core.facets import FacetIndex, parse_term
+from honey.models.skus import ProductSku, SkuAttribute
+
+
+class TestFacetIndex:
+    """
+    SKU attribute facet index tests.
+    """
+
+    def test_facet_search(self, HoneyApp, hooks, db, sku):
+        """
+        Test AND, OR and NOT queries and the refresh of a changed sku
+        """
+        family = SkuAttribute('family', 'Grapple', sku.entity_id)
+        white = SkuAttribute('color', 'White', sku.entity_id)
+        black = SkuAttribute('color', 'Black', sku.entity_id)
+        other = ProductSku('Z9-B-L', 'upc-z9', 'a black grapple', sku.entity_id,
+                           sku.container_id)
+        sku.sku_attrs = [family, white]
+        other.sku_attrs = [family, black]
+        db.add(other)
+        db.commit()
+        sku_id, other_id = sku.id, other.id
+        with HoneyApp(hooks=hooks) as app:
+            facets = FacetIndex(app).load()
+            assert facets.search([parse_term('family=grapple')]) == [sku_id, other_id]
+            assert facets.search([parse_term('family=Grapple'),
+                                  parse_term('color=white')]) == [sku_id]
+            assert facets.search([parse_term('color=white,black')],
+                                 exclude=parse_term('color=black')) == [sku_id]
+            other = app.session.get(ProductSku, other_id)
+            other.sku_attrs = [black]
+            app.session.commit()
+            assert facets.pending == {other_id}
+            assert facets.search([], exclude=parse_term('family=grapple')) == [other_id]
+            assert facets.counts('color') == [('color', 'black', 1), ('color', 'white', 1)]
+
+    def test_sku_search_command(self, HoneyApp, hooks, db, sku):
+        """
+        Test `honey sku search --attr key=value`
+        """
+        sku.sku_attrs = [SkuAttribute('family', 'Grapple', sku.entity_id)]
+        db.commit()
+        sku_code = sku.sku
+        argv = ['sku', 'search', '--attr', 'family=Grapple']
+        with HoneyApp(argv=argv, hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            data, output = app.last_rendered
+            assert sku_code in output
@@ -0,0 +1,55 @@
+import os
+from pytest import raises
+from honey.core.exc import HoneyError
+from honey.models.inventory import Warehouse
+from honey.models.skus import ProductSku, Container
+
+
+def write_template(directory, table, text):
+    with open(os.path.join(directory, f'{table}.csv'), 'w', newline='') as stream:
+        stream.write(text)
+
+
+class TestImport:
+    """
+    Template importer tests.
+    """
+
+    def test_import_templates(self, HoneyApp, hooks, db, entity, tmp):
+        """
+        Test `honey import <dir>` resolves the names and skips existing records
+        """
+        write_template(tmp.dir, 'containers',
+                       'name,description,parent\nmaster,Master carton,\n'
+                       'retail,Retail package,master\n')
+        write_template(tmp.dir, 'warehouses', 'name,entity\nDock,honeygear\n')
+        write_template(tmp.dir, 'sku_attrs', 'key,value,entity\nfamily,Grapple,honeygear\n')
+        write_template(tmp.dir, 'product_skus',
+                       'sku,upc,description,entity,container,attributes\n'
+                       'G1,850016398017,grapple,honeygear,retail,family=Grapple\n')
+        argv = ['import', tmp.dir]
+        with HoneyApp(argv=argv, hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            sku = app.session.query(ProductSku).filter_by(sku='G1').one()
+            assert sku.gtin == '00850016398017'
+            assert [(attr.key, attr.value) for attr in sku.sku_attrs] == \
+                [('family', 'Grapple')]
+            assert sku.container.name == 'retail'
+            master = app.session.query(Container).filter_by(name='master').one()
+            assert master.parent_id == master.id
+            assert app.session.query(Warehouse).filter_by(name='Dock').count() == 1
+        with HoneyApp(argv=argv, hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            assert app.session.query(ProductSku).count() == 1
+
+    def test_import_invalid_rows_roll_back(self, HoneyApp, hooks, db, entity, tmp):
+        """
+        Test an invalid row rolls back the whole import
+        """
+        write_template(tmp.dir, 'warehouses',
+                       'name,entity\nDock,honeygear\nYard,nobody\n')
+        argv = ['import', tmp.dir]
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            with raises(HoneyError):
+                app.run()
+            assert app.session.query(Warehouse).count() == 0
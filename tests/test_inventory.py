@@ -0,0 +1,233 @@
+from honey.models.inventory import LocationSkuAssoc, InventoryLocation, StockTotal
+from honey.models.skus import (Container, ContainerClosure, ProductSku, SkuAttribute,
+                               SkuPackCapacity)
+from honey.core.exc import HoneyError
+from honey.core.scanbuffer import ScanBuffer
+from honey.core.context import ActiveContext, set_active_context, clear_active_context
+from pytest import raises
+
+
+def scan_inputs(monkeypatch, *codes):
+    """Feed barcodes to the `input()` prompt of `honey invact scan`."""
+    codes = iter(codes)
+    monkeypatch.setattr('builtins.input', lambda prompt='': next(codes))
+
+
+class TestInventoryAction:
+    """
+    Inventory action tests.
+    """
+
+    def test_invact_scan_increase(self, HoneyApp, hooks, db, inventory_location,
+                                  sku, monkeypatch):
+        """
+        Test `honey invact scan HG-1 -a increase -w testGarage`
+        """
+        scan_inputs(monkeypatch, sku.upc, sku.upc, 'exit')
+        argv = ['invact', 'scan', 'HG-1', '-a', 'increase', '-w', 'testGarage']
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+            record = app.session.query(LocationSkuAssoc).filter_by(
+                location_id=inventory_location.id, sku_id=sku.id).one()
+            assert record.quantity == 3
+
+    def test_invact_scan_decrease_deletes_empty(self, HoneyApp, hooks, db,
+                                                inventory_location, sku,
+                                                monkeypatch):
+        """
+        Test a decrease to zero deletes the sku from the location
+        """
+        scan_inputs(monkeypatch, sku.upc, 'exit')
+        argv = ['invact', 'scan', 'HG-1', '-a', 'decrease', '-w', 'testGarage']
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+            assert app.session.query(LocationSkuAssoc).filter_by(
+                location_id=inventory_location.id).count() == 0
+
+    def test_invact_scan_from_file(self, HoneyApp, hooks, db, inventory_location,
+                                   sku, tmp):
+        """
+        Test `honey invact scan HG-1 -a increase -w testGarage -f <scan dump>`
+        """
+        with open(tmp.file, 'w') as stream:
+            stream.write(f'{sku.upc}\n\n {sku.upc.upper()}\t\nnot-a-upc\n')
+        argv = ['invact', 'scan', 'HG-1', '-a', 'increase', '-w', 'testGarage',
+                '-f', tmp.file]
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+            record = app.session.query(LocationSkuAssoc).filter_by(
+                location_id=inventory_location.id, sku_id=sku.id).one()
+            assert record.quantity == 3
+
+    def test_invact_scan_from_file_switches_location(self, HoneyApp, hooks, db,
+                                                     inventory_location, sku, tmp):
+        """
+        Test `LOC:` codes and bare labels in a scan dump switch the location, also a
+        numeric label which isn't a valid barcode
+        """
+        other = InventoryLocation('HG-2', inventory_location.warehouse_id)
+        numeric = InventoryLocation('850016398010', inventory_location.warehouse_id)
+        db.add_all([other, numeric])
+        db.commit()
+        with open(tmp.file, 'w') as stream:
+            stream.write(f'{sku.upc}\nLOC:HG-2\n{sku.upc}\n{sku.upc}\n'
+                         f'850016398010\n{sku.upc}\nLOC:nowhere\n{sku.upc}\n')
+        argv = ['invact', 'scan', 'HG-1', '-a', 'increase', '-w', 'testGarage',
+                '-f', tmp.file]
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+            quantities = dict(app.session.query(
+                LocationSkuAssoc.location_id, LocationSkuAssoc.quantity).filter_by(
+                sku_id=sku.id))
+            assert quantities == {inventory_location.id: 2, other.id: 2, numeric.id: 2}
+
+    def test_invact_scan_bad_action_raises(self, HoneyApp, hooks, db,
+                                           inventory_location):
+        """
+        Test `honey invact scan` raises for an unknown action
+        """
+        argv = ['invact', 'scan', 'HG-1', '-a', 'sideways', '-w', 'testGarage']
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            with raises(HoneyError):
+                app.run()
+
+    def test_scan_buffer_flush_every(self, db, inventory_location, sku):
+        """
+        Test the ScanBuffer groups scans into one flush per `flush_every` scans
+        """
+        summaries = []
+        scan_buffer = ScanBuffer(db, flush_every=3, on_flush=summaries.append)
+        assert scan_buffer.add(inventory_location.id, sku.id, 1) is None
+        assert scan_buffer.add(inventory_location.id, sku.id, 1) is None
+        summary = scan_buffer.add(inventory_location.id, sku.id, 1)
+        assert summary.scans == 3
+        assert summary.units_in == 3
+        assert summaries == [summary]
+        assert scan_buffer.close() is None
+        record = db.query(LocationSkuAssoc).filter_by(
+            location_id=inventory_location.id, sku_id=sku.id).one()
+        assert record.quantity == 4
+
+    def test_apply_deltas_upsert(self, db, inventory_location, sku):
+        """
+        Test LocationSkuAssoc.apply_deltas increments, decrements and deletes
+        records in place and reports decreases of a sku that isn't in the location
+        """
+        key = (inventory_location.id, sku.id)
+        assert LocationSkuAssoc.apply_deltas(db, {key: 4}) == []
+        db.commit()
+        record = db.query(LocationSkuAssoc).filter_by(
+            location_id=inventory_location.id, sku_id=sku.id).one()
+        assert record.quantity == 5
+        assert LocationSkuAssoc.apply_deltas(db, {key: -5}) == []
+        db.commit()
+        assert db.query(LocationSkuAssoc).filter_by(
+            location_id=inventory_location.id, sku_id=sku.id).first() is None
+        assert LocationSkuAssoc.apply_deltas(db, {key: -1}) == [key]
+        db.commit()
+        # a decrease larger than the quantity only takes what the location holds
+        LocationSkuAssoc.apply_deltas(db, {key: 2})
+        db.commit()
+        assert LocationSkuAssoc.apply_deltas(db, {key: -3}) == []
+        db.commit()
+        assert db.query(LocationSkuAssoc).filter_by(
+            location_id=inventory_location.id, sku_id=sku.id).first() is None
+        assert StockTotal.total(db, sku.id) == 0
+
+    def test_invact_scan_carton_multiple(self, HoneyApp, hooks, db,
+                                         inventory_location, sku, monkeypatch):
+        """
+        Test a master carton scan counts its retail units from the capacity table
+        """
+        inner = ProductSku('INNER-6', 'inner-upc', 'an inner box', sku.entity_id,
+                           sku.container_id, unit_sku_id=sku.id)
+        inner.sku_attrs = [SkuAttribute('child-capacity', '6', sku.entity_id)]
+        db.add(inner)
+        db.flush()
+        master = ProductSku('MASTER-4', 'master-upc', 'a master carton',
+                            sku.entity_id, sku.container_id, unit_sku_id=inner.id)
+        master.sku_attrs = [SkuAttribute('child-capacity', '4', sku.entity_id)]
+        db.add(master)
+        db.flush()
+        assert SkuPackCapacity.rebuild(db) == 2
+        db.commit()
+        assert SkuPackCapacity.compute(db)[master.id] == (sku.id, 24)
+        scan_inputs(monkeypatch, 'master-upc', 'inner-upc', 'exit')
+        argv = ['invact', 'scan', 'HG-1', '-a', 'increase', '-w', 'testGarage']
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+            record = app.session.query(LocationSkuAssoc).filter_by(
+                location_id=inventory_location.id, sku_id=sku.id).one()
+            assert record.quantity == 31
+
+    def test_container_closure(self, db, sku):
+        """
+        Test the closure follows container changes and converts between levels
+        """
+        inner = Container('inner', 'an inner box', sku.container_id, units_per_parent=4)
+        db.add(inner)
+        db.flush()
+        retail = Container('retail', 'a retail package', inner.id, units_per_parent=6)
+        db.add(retail)
+        db.commit()
+        root_id = sku.container_id
+        pair = db.query(ContainerClosure).filter_by(
+            ancestor_id=root_id, descendant_id=retail.id).one()
+        assert (pair.depth, pair.multiple) == (2, 24)
+        # the pairs added per insert are the pairs of a full rebuild
+        pairs = sorted(map(tuple, db.execute(ContainerClosure.__table__.select())))
+        ContainerClosure.rebuild(db)
+        assert sorted(map(tuple, db.execute(ContainerClosure.__table__.select()))) == pairs
+        assert ContainerClosure.convert(db, 130, retail.id, root_id) == (5, 10)
+        assert ContainerClosure.convert(db, 2, root_id, retail.id) == (48, 0)
+        # a master carton sku without capacity attributes uses the containers
+        sku.container_id = retail.id
+        master = ProductSku('MASTER-24', 'master-upc', 'a master carton',
+                            sku.entity_id, root_id, unit_sku_id=sku.id)
+        db.add(master)
+        db.commit()
+        assert SkuPackCapacity.compute(db)[master.id] == (sku.id, 24)
+        root = db.get(Container, root_id)
+        root.parent_id = retail.id
+        with raises(HoneyError):
+            db.commit()
+        db.rollback()
+
+    def test_invact_scan_default_location(self, HoneyApp, hooks, db,
+                                          inventory_location, sku, monkeypatch):
+        """
+        Test `invact scan` without a warehouse or label uses the active context
+        """
+        location_id = inventory_location.id
+        context = ActiveContext(inventory_location.warehouse_id, 'testGarage',
+                                None, location_id, 'HG-1')
+        scan_inputs(monkeypatch, sku.upc, 'exit')
+        argv = ['invact', 'scan', '-a', 'increase']
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            set_active_context(app, context, 'user')
+            try:
+                app.run()
+            finally:
+                clear_active_context(app, 'user')
+            record = app.session.query(LocationSkuAssoc).filter_by(
+                location_id=location_id).one()
+            assert record.quantity == 2
+
+    def test_invact_scan_switches_location(self, HoneyApp, hooks, db,
+                                           inventory_location, sku, monkeypatch):
+        """
+        Test scanning location labels switches the location within one session
+        """
+        other = InventoryLocation('HG-2', inventory_location.warehouse_id)
+        numeric = InventoryLocation('850016398010', inventory_location.warehouse_id)
+        db.add_all([other, numeric])
+        db.commit()
+        scan_inputs(monkeypatch, sku.upc, 'LOC:HG-2', sku.upc, sku.upc, 'hg-1',
+                    sku.upc, 'LOC:nowhere', sku.upc, '850016398010', sku.upc, 'exit')
+        argv = ['invact', 'scan', '-a', 'increase', '-w', 'testGarage']
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+            quantities = dict(app.session.query(
+                LocationSkuAssoc.location_id, LocationSkuAssoc.quantity).filter_by(
+                sku_id=sku.id))
+            assert quantities == {inventory_location.id: 3, other.id: 2, numeric.id: 1}
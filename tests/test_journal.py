@@ -0,0 +1,84 @@
+import os
+import pendulum
+from honey.core.journal import ScanJournal, replay
+from honey.models.inventory import LocationSkuAssoc
+from honey.models.journal import ScanJournalCheckpoint
+from honey.models.movements import InventoryMovement
+
+
+class TestScanJournal:
+    """
+    Scan journal tests.
+    """
+
+    def test_journal_append_and_read(self, tmp):
+        """
+        Test events are read back in order with their positions
+        """
+        journal = ScanJournal(tmp.dir, 'station-1', fsync=False)
+        first = journal.append(1, 2, 1)
+        second = journal.append(1, 3, -1)
+        journal.close()
+        events = list(journal.read())
+        assert [e['sku_id'] for e, _ in events] == [2, 3]
+        assert [p for _, p in events] == [first, second]
+        assert [e['sku_id'] for e, _ in journal.read(first)] == [3]
+
+    def test_journal_rotates_segments(self, tmp):
+        """
+        Test the journal rotates to a new segment past segment_bytes
+        """
+        journal = ScanJournal(tmp.dir, 'station-1', segment_bytes=1, fsync=False)
+        journal.append(1, 2, 1)
+        journal.append(1, 2, 1)
+        journal.close()
+        assert [number for number, _ in journal.segments()] == [1, 2]
+        assert len(list(journal.read())) == 2
+        assert journal.prune((2, 0)) == 1
+
+    def test_journal_skips_torn_line(self, tmp):
+        """
+        Test a partially written last event is not replayed
+        """
+        journal = ScanJournal(tmp.dir, 'station-1', fsync=False)
+        journal.append(1, 2, 1)
+        journal.close()
+        with open(journal.segment_path(1), 'ab') as stream:
+            stream.write(b'{"ts": "2020-06-01T10:22:01+00:00", "loca')
+        assert len(list(journal.read())) == 1
+        journal.append(1, 3, 1)
+        journal.close()
+        assert [e['sku_id'] for e, _ in journal.read()] == [2, 3]
+
+    def test_journal_skips_undecodable_line(self, tmp):
+        """
+        Test a corrupt event doesn't block the events after it
+        """
+        journal = ScanJournal(tmp.dir, 'station-1', fsync=False)
+        journal.append(1, 2, 1)
+        journal.close()
+        with open(journal.segment_path(1), 'ab') as stream:
+            stream.write(b'{"ts": \x00garbage\n')
+        journal.append(1, 3, 1)
+        journal.close()
+        assert [e['sku_id'] for e, _ in journal.read()] == [2, 3]
+
+    def test_replay_is_idempotent(self, tmp, db, inventory_location, sku):
+        """
+        Test replaying a journal twice applies every scan once
+        """
+        journal = ScanJournal(os.path.join(tmp.dir, 'journal'), 'station-1',
+                              fsync=False)
+        for _ in range(3):
+            journal.append(inventory_location.id, sku.id, 1)
+        journal.close()
+        assert replay(db, journal, batch_size=2).scans == 3
+        assert replay(db, journal).scans == 0
+        record = db.query(LocationSkuAssoc).filter_by(
+            location_id=inventory_location.id, sku_id=sku.id).one()
+        assert record.quantity == 4
+        assert ScanJournalCheckpoint.position(db, 'station-1')[0] == 1
+        scanned_on = [pendulum.parse(event['ts']) for event, _ in journal.read()]
+        occurred_on = [movement.occurred_on for movement in db.query(
+            InventoryMovement).filter_by(actor='station-1').order_by(InventoryMovement.id)]
+        assert occurred_on == [scanned_on[1], scanned_on[2]]
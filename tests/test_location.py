@@ -1,5 +1,7 @@
-from honey.models.inventory import InventoryLocation
+from honey.models.inventory import InventoryLocation, LocationSkuAssoc, StockTotal
 from honey.core.exc import HoneyError
+from honey.models.profiles import profile
+from sqlalchemy.exc import InvalidRequestError
 from pytest import raises
 
 class TestInventoryLocation:
@@ -17,6 +19,22 @@ class TestInventoryLocation:
             data, output = app.last_rendered
             assert 'HG-1' in output
 
+    def test_invloc_list_warehouse_filter(self, HoneyApp, hooks, db,
+                                          inventory_location):
+        """
+        Test `honey invloc list -w <warehouse>` only lists that warehouse
+        """
+        argv = ['invloc', 'list', '-w', 'testGarage2']
+        with HoneyApp(argv=argv, hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            data, output = app.last_rendered
+            assert 'HG-1' not in output
+        argv = ['invloc', 'list', '-w', 'testGarage']
+        with HoneyApp(argv=argv, hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            data, output = app.last_rendered
+            assert 'HG-1' in output
+
     def test_invloc_create(self, HoneyApp, hooks, db, inventory_location):
         """
         Test `honey warehouse create`
@@ -49,4 +67,42 @@ class TestInventoryLocation:
         with HoneyApp(argv=argv, hooks=hooks) as app:
             app.run()
             assert 'HG-1a' in \
-                   [x.label for x in app.session.query(InventoryLocation).all()]
\ No newline at end of file
+                   [x.label for x in app.session.query(InventoryLocation).all()]
+
+    def test_invloc_contents_profile(self, db, inventory_location, sku):
+        """
+        Test the contents loading profile loads the sku records and raises on
+        relationships the contents output doesn't render
+        """
+        location_id, sku_name = inventory_location.id, sku.sku
+        db.expunge_all()
+        invloc_obj = db.query(InventoryLocation).options(*profile('contents')).filter_by(
+            id=location_id).one()
+        assert [(record.sku.sku, record.quantity) for record in invloc_obj.skus] == \
+               [(sku_name, 1)]
+        with raises(InvalidRequestError):
+            invloc_obj.warehouse
+
+    def test_invloc_transfer(self, HoneyApp, hooks, db, inventory_location, sku):
+        """
+        Test `honey invloc transfer HG-1 HG-2 -t HG-3 --create --delete` merges the
+        quantities into the target and deletes the emptied sources
+        """
+        location_id, warehouse_id, sku_id = \
+            inventory_location.id, inventory_location.warehouse_id, sku.id
+        other = InventoryLocation('HG-2', warehouse_id)
+        db.add(other)
+        db.commit()
+        LocationSkuAssoc.apply_deltas(db, {(other.id, sku_id): 4})
+        db.commit()
+        argv = ['invloc', 'transfer', 'HG-1', 'hg-2', '-t', 'HG-3', '-w', 'testGarage',
+                '--create', '--delete']
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+            records = app.session.query(
+                InventoryLocation.label, LocationSkuAssoc.quantity).join(
+                LocationSkuAssoc, LocationSkuAssoc.location_id == InventoryLocation.id
+            ).all()
+            assert records == [('HG-3', 5)]
+            assert app.session.query(InventoryLocation).count() == 1
+            assert StockTotal.total(app.session, sku_id, warehouse_id) == 5
@@ -0,0 +1,57 @@
+import csv
+import json
+from honey.models.skus import Container
+
+
+class TestReport:
+    """
+    Stock on hand report tests.
+    """
+
+    def test_report_warehouse(self, HoneyApp, hooks, db, inventory_location):
+        """
+        Test `honey report warehouse`. This is returned as a tabulate table.
+        """
+        argv = ['report', 'warehouse']
+        with HoneyApp(argv=argv, hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            data, output = app.last_rendered
+            assert 'testGarage' in output
+            assert data[0][-2:] == [1, 1]
+
+    def test_report_sku_export(self, HoneyApp, hooks, db, inventory_location, sku,
+                               tmp):
+        """
+        Test `honey report sku` streams csv and jsonl rows to a file
+        """
+        sku_code = sku.sku
+        argv = ['report', 'sku', '-f', 'csv', '-o', tmp.file]
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+        with open(tmp.file, newline='') as stream:
+            rows = list(csv.reader(stream))
+        assert rows[0] == ['sku', 'description', 'owner', 'warehouses', 'quantity']
+        assert rows[1][0] == sku_code and rows[1][-1] == '1'
+        argv = ['report', 'sku', '-f', 'jsonl', '-o', tmp.file]
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+        with open(tmp.file) as stream:
+            rows = [json.loads(line) for line in stream]
+        assert rows == [dict(rows[0], sku=sku_code, quantity=1)]
+
+    def test_report_cartons(self, HoneyApp, hooks, db, inventory_location, sku):
+        """
+        Test `honey report cartons` rolls the stock up to the top level container
+        """
+        inner = Container('inner', 'an inner box', sku.container_id, units_per_parent=4)
+        db.add(inner)
+        db.flush()
+        sku.container_id = inner.id
+        db.commit()
+        sku_code = sku.sku
+        argv = ['report', 'cartons']
+        with HoneyApp(argv=argv, hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            data, output = app.last_rendered
+            assert data[0][0] == sku_code
+            assert data[0][-4:] == [4, 1, 0, 1]
@@ -0,0 +1,50 @@
+import pytest
+from honey.core.exc import HoneyError
+from honey.core.resolver import IdentifierResolver, _local
+from honey.models.inventory import Warehouse
+from honey.models.entities import Entity
+
+
+class TestIdentifierResolver:
+    """
+    Warehouse and entity identifier resolver tests.
+    """
+
+    def test_resolver_warehouse(self, HoneyApp, hooks, db, warehouse, entity):
+        """
+        Test a name or id resolves to the warehouse and is then answered from the LRU
+        :return:
+        """
+        warehouse_id, entity_id = warehouse.id, entity.id
+        with HoneyApp(hooks=hooks) as app:
+            resolver = IdentifierResolver(app)
+            ref = resolver.warehouse('testGarage')
+            assert (ref.id, ref.name, ref.entity_id) == (warehouse_id, 'testGarage',
+                                                         entity_id)
+            assert resolver.warehouse(str(warehouse_id)) == ref
+            assert resolver.entity_id('honeygear') == entity_id
+            assert (app.config.get('honeytest', 'RESOLVER_CACHE_KEY'),
+                    'wh:testGarage') in _local.entries
+            assert resolver.warehouse('testKitchen') is None
+
+    def test_resolver_invalidated_on_commit(self, HoneyApp, hooks, db, warehouse,
+                                            entity):
+        """
+        Test a committed warehouse change is resolved right away and a duplicate
+        warehouse name then requires the entity
+        :return:
+        """
+        entity_id = entity.id
+        with HoneyApp(hooks=hooks) as app:
+            resolver = IdentifierResolver(app)
+            assert resolver.warehouse('testGarage') is not None
+            other = Entity('other-owner')
+            app.session.add(other)
+            app.session.commit()
+            assert len(_local) == 0
+            app.session.add(Warehouse('testGarage', other.id))
+            app.session.commit()
+            with pytest.raises(HoneyError):
+                resolver.warehouse('testGarage')
+            assert resolver.warehouse('testGarage', 'honeygear').entity_id == entity_id
+            assert resolver.warehouse('testGarage', 'other-owner').entity_id == other.id
@@ -0,0 +1,86 @@
+import asyncio
+from sqlalchemy.orm import sessionmaker
+from honey.core.scanserver import ScanServer, send_scans
+from honey.core.upcindex import UpcIndex
+from honey.models.inventory import LocationSkuAssoc
+from .factories import engine
+
+
+class TestScanServer:
+    """
+    Scan ingestion server tests.
+    """
+
+    def test_scan_server_coalesces_stations(self, HoneyApp, hooks, db,
+                                            inventory_location, sku):
+        """
+        Test scans from two loopback stations are written as one coalesced delta
+        """
+        with HoneyApp(hooks=hooks) as app:
+            flushes = []
+            server = ScanServer(sessionmaker(bind=engine), UpcIndex(app).load(),
+                                flush_every=1000, flush_ms=60000,
+                                on_flush=flushes.append)
+            by_upc = {'upc': sku.upc, 'location_id': inventory_location.id}
+            by_label = {'sku_id': sku.id, 'warehouse_id': inventory_location.warehouse_id,
+                        'label': inventory_location.label, 'delta': 2}
+
+            async def stations():
+                await server.start(host='127.0.0.1', port=0)
+                port = server.server.sockets[0].getsockname()[1]
+                replies = await asyncio.gather(
+                    send_scans([by_upc, by_upc, {'upc': 'nope', 'location_id': 1}],
+                               host='127.0.0.1', port=port),
+                    send_scans([by_label], host='127.0.0.1', port=port))
+                await server.close()
+                return replies
+
+            first, second = asyncio.run(stations())
+            assert [r['ok'] for r in first] == [True, True, False]
+            assert first[0]['sku'] == sku.sku
+            assert second == [{'ok': True}]
+            assert len(flushes) == 1
+            assert flushes[0].scans == 3 and flushes[0].skus == 1
+            db.expire_all()
+            record = db.query(LocationSkuAssoc).filter_by(
+                location_id=inventory_location.id, sku_id=sku.id).one()
+            assert record.quantity == 5
+
+    def test_scan_server_drops_unknown_ids(self, HoneyApp, hooks, db,
+                                           inventory_location, sku):
+        """
+        Test an unknown sku id is rejected, and a key failing its write is dropped
+        without holding up the valid scans
+        """
+        with HoneyApp(hooks=hooks) as app:
+            flushes = []
+            server = ScanServer(sessionmaker(bind=engine), UpcIndex(app).load(),
+                                flush_every=1000, flush_ms=60000,
+                                on_flush=flushes.append)
+            location_id = inventory_location.id
+            unknown = {'sku_id': sku.id + 1000, 'location_id': location_id}
+            by_upc = {'upc': sku.upc, 'location_id': location_id}
+
+            async def station():
+                await server.start(host='127.0.0.1', port=0)
+                port = server.server.sockets[0].getsockname()[1]
+                replies = await send_scans(
+                    [unknown, {'upc': sku.upc, 'location_id': location_id + 1000},
+                     by_upc], host='127.0.0.1', port=port)
+                # like a sku deleted after its scan was accepted
+                server.pending[(location_id, sku.id + 1000)] += 1
+                server.scans += 1
+                await server.flush()
+                replies += await send_scans([by_upc], host='127.0.0.1', port=port)
+                await server.close()
+                return replies
+
+            replies = asyncio.run(station())
+            assert [r['ok'] for r in replies] == [False, False, True, True]
+            assert replies[0]['error'] == f'unknown sku {sku.id + 1000}'
+            assert flushes[0].rejected == [(location_id, sku.id + 1000)]
+            assert not server.pending
+            db.expire_all()
+            record = db.query(LocationSkuAssoc).filter_by(
+                location_id=location_id, sku_id=sku.id).one()
+            assert record.quantity == 3
@@ -0,0 +1,48 @@
+from honey.core.skusearch import MemorySkuIndex, SkuSearch, trigrams
+from honey.models.skus import ProductSku
+
+
+class TestSkuSearch:
+    """
+    SKU prefix and fuzzy lookup tests.
+    """
+
+    def test_memory_index(self):
+        """
+        Test the prefix, mistyped code and description matches of the in-memory index
+        """
+        index = MemorySkuIndex([
+            (1, 'HG-GRP-W-L', 'a white grapple, iphone'),
+            (2, 'HG-GRP-B-L', 'a black grapple, iphone'),
+            (3, 'HG-FLX-W-M', 'a white flux mount'),
+        ])
+        assert trigrams('ab') == {'  a', ' ab', 'ab '}
+        assert [match.id for match in index.find('hg-grp')] == [2, 1]
+        assert index.find('hg-grp-w-l')[0].score == 1
+        assert index.find('hg-grp-w-k')[0].sku == 'HG-GRP-W-L'
+        assert index.find('grapl black')[0].id == 2
+        assert [match.id for match in index.find('hg', limit=1)] == [3]
+        assert index.find('zzz') == []
+
+    def test_find_after_commit(self, HoneyApp, hooks, db, sku):
+        """
+        Test the lookup finds a sku added after the index was built
+        """
+        sku_code = sku.sku
+        with HoneyApp(hooks=hooks) as app:
+            assert SkuSearch(app.session).find(sku_code)[0].sku == sku_code
+            app.session.add(ProductSku('QX-FLUX-9', 'upc-qx9', 'a flux mount',
+                                       sku.entity_id, sku.container_id))
+            app.session.commit()
+            assert SkuSearch(app.session).find('qx-flux')[0].sku == 'QX-FLUX-9'
+
+    def test_sku_find_command(self, HoneyApp, hooks, db, sku):
+        """
+        Test `honey sku find <text>` with a mistyped code
+        """
+        sku_code = sku.sku
+        argv = ['sku', 'find', sku_code.lower().replace('-w-', '-x-')]
+        with HoneyApp(argv=argv, hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            data, output = app.last_rendered
+            assert sku_code in output
@@ -0,0 +1,49 @@
+import os
+from pytest import raises
+from honey.core.exc import HoneyError
+from honey.models.inventory import InventoryLocation, LocationSkuAssoc, Warehouse
+
+
+class TestSnapshot:
+    """
+    Snapshot export and restore tests.
+    """
+
+    def test_snapshot_round_trip(self, HoneyApp, hooks, db, sku, inventory_location,
+                                 tmp):
+        """
+        Test `honey snapshot import --replace` restores what was exported and the
+        id sequences continue after the restored ids
+        """
+        path = os.path.join(tmp.dir, 'snapshot.zip')
+        with HoneyApp(argv=['snapshot', 'export', path], hooks=hooks,
+                      output_handler='tabulate') as app:
+            app.run()
+        sku_id = sku.id
+        db.query(LocationSkuAssoc).delete()
+        db.query(InventoryLocation).delete()
+        db.commit()
+        with HoneyApp(argv=['snapshot', 'import', path, '--replace'],
+                      hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            location = app.session.query(InventoryLocation).filter_by(label='HG-1').one()
+            assert [(assoc.sku_id, assoc.quantity) for assoc in location.skus] == \
+                [(sku_id, 1)]
+            warehouse = Warehouse(name='Dock', entity_id=location.warehouse.entity_id)
+            app.session.add(warehouse)
+            app.session.commit()
+            assert warehouse.id > location.warehouse_id
+
+    def test_snapshot_import_needs_replace(self, HoneyApp, hooks, db,
+                                           inventory_location, tmp):
+        """
+        Test a snapshot isn't restored over existing records without --replace
+        """
+        path = os.path.join(tmp.dir, 'snapshot.zip')
+        with HoneyApp(argv=['snapshot', 'export', path], hooks=hooks,
+                      output_handler='tabulate') as app:
+            app.run()
+        with HoneyApp(argv=['snapshot', 'import', path], hooks=hooks,
+                      output_handler='tabulate') as app:
+            with raises(HoneyError):
+                app.run()
@@ -0,0 +1,39 @@
+import json
+from honey.core.stats import LatencyHistogram, BUCKETS
+
+
+class TestScanStats:
+    """
+    Scan latency instrumentation tests.
+    """
+
+    def test_histogram_percentiles(self):
+        """
+        Test percentiles are within the bucket growth of the exact values
+        """
+        histogram = LatencyHistogram('lookup')
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000)
+        assert len(histogram.counts) == BUCKETS
+        assert histogram.count == 1000
+        assert 0.5 <= histogram.percentile(50) <= 0.5 * 1.05
+        assert 0.99 <= histogram.percentile(99) <= 1.0
+        assert histogram.summary()['max_ms'] == 1000.0
+
+    def test_invact_scan_stats_json(self, HoneyApp, hooks, db, inventory_location,
+                                    sku, monkeypatch, tmp):
+        """
+        Test `honey invact scan ... --stats-json <file>` writes the phase report
+        """
+        codes = iter([sku.upc, sku.upc, 'exit'])
+        monkeypatch.setattr('builtins.input', lambda prompt='': next(codes))
+        argv = ['invact', 'scan', 'HG-1', '-a', 'increase', '-w', 'testGarage',
+                '--stats-json', tmp.file]
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+        with open(tmp.file) as stream:
+            report = json.load(stream)
+        assert report['scans'] == 2
+        assert report['phases']['scan']['count'] == 2
+        assert report['phases']['commit']['count'] == 2
+        assert set(report['phases']) >= {'lookup', 'log', 'write'}
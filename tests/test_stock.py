@@ -0,0 +1,139 @@
+import pendulum
+from honey.models.inventory import InventoryLocation, LocationSkuAssoc, StockTotal
+from honey.models.movements import InventoryMovement, StockSnapshot
+
+
+class TestStockTotal:
+    """
+    Stock on hand aggregate tests.
+    """
+
+    def test_stock_total_follows_quantity_changes(self, db, inventory_location, sku):
+        """
+        Test scans and ORM changes update the stock total in the same transaction
+        """
+        warehouse_id = inventory_location.warehouse_id
+        assert StockTotal.total(db, sku.id, warehouse_id) == 1
+        key = (inventory_location.id, sku.id)
+        LocationSkuAssoc.apply_deltas(db, {key: 4})
+        db.commit()
+        assert StockTotal.total(db, sku.id, warehouse_id) == 5
+        # a decrease past zero only removes what the location held
+        LocationSkuAssoc.apply_deltas(db, {key: -9})
+        db.commit()
+        assert StockTotal.total(db, sku.id) == 0
+        record = LocationSkuAssoc(sku.id, inventory_location.id, 3)
+        db.add(record)
+        db.commit()
+        record.quantity = 7
+        db.commit()
+        assert StockTotal.total(db, sku.id, warehouse_id) == 7
+
+    def test_stock_rebuild(self, HoneyApp, hooks, db, inventory_location, sku):
+        """
+        Test `honey stock rebuild` recomputes the totals from the locations
+        """
+        db.query(StockTotal).delete()
+        db.commit()
+        argv = ['stock', 'rebuild']
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+        assert StockTotal.total(db, sku.id, inventory_location.warehouse_id) == 1
+        argv = ['stock', 'show', sku.sku]
+        with HoneyApp(argv=argv, hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            data, output = app.last_rendered
+            assert 'testGarage' in output
+
+
+class TestInventoryMovement:
+    """
+    Movement ledger tests.
+    """
+
+    def test_ledger_follows_quantity_changes(self, db, inventory_location, sku):
+        """
+        Test scans, transfers and ORM changes append the applied deltas
+        """
+        target = InventoryLocation('HG-2', inventory_location.warehouse_id)
+        db.add(target)
+        db.commit()
+        LocationSkuAssoc.apply_deltas(db, {(inventory_location.id, sku.id): 4},
+                                      actor='station-1')
+        db.commit()
+        LocationSkuAssoc.transfer(db, [inventory_location.id], target.id)
+        db.commit()
+        record = db.query(LocationSkuAssoc).filter_by(location_id=target.id).one()
+        record.quantity = 2
+        db.commit()
+        movements = db.query(
+            InventoryMovement.location_id, InventoryMovement.delta,
+            InventoryMovement.reason).order_by(InventoryMovement.id).all()
+        assert movements == [
+            (inventory_location.id, 1, 'adjust'), (inventory_location.id, 4, 'scan'),
+            (inventory_location.id, -5, 'transfer'), (target.id, 5, 'transfer'),
+            (target.id, -3, 'adjust')]
+        assert db.query(InventoryMovement.actor).filter_by(reason='scan').scalar() == \
+            'station-1'
+
+    def test_compact_and_project(self, HoneyApp, hooks, db, inventory_location, sku):
+        """
+        Test `honey stock compact` keeps the quantities and `honey stock rebuild
+        --locations` projects sku_locations from the ledger
+        """
+        LocationSkuAssoc.apply_deltas(db, {(inventory_location.id, sku.id): 4})
+        db.commit()
+        tomorrow = pendulum.tomorrow('UTC').to_date_string()
+        with HoneyApp(argv=['stock', 'compact', tomorrow], hooks=hooks) as app:
+            app.run()
+        assert db.query(InventoryMovement.delta, InventoryMovement.reason).all() == \
+            [(5, 'compacted')]
+        db.query(LocationSkuAssoc).delete()
+        db.commit()
+        with HoneyApp(argv=['stock', 'rebuild', '--locations'], hooks=hooks) as app:
+            app.run()
+        assert db.query(LocationSkuAssoc.quantity).scalar() == 5
+        assert StockTotal.total(db, sku.id) == 5
+        with HoneyApp(argv=['stock', 'history', sku.sku], hooks=hooks,
+                      output_handler='tabulate') as app:
+            app.run()
+            data, output = app.last_rendered
+            assert 'compacted' in output and 'HG-1' in output
+
+
+class TestStockSnapshot:
+    """
+    As of stock query tests.
+    """
+
+    def test_stock_as_of(self, HoneyApp, hooks, db, inventory_location, sku):
+        """
+        Test the stock as of a past time from a snapshot and the later movements,
+        and that compacting keeps the quantities at the snapshot times
+        """
+        movements = InventoryMovement.__table__
+        db.query(InventoryMovement).delete()
+        db.execute(movements.insert(), [
+            {'occurred_on': pendulum.datetime(2026, 1, day), 'delta': delta,
+             'location_id': inventory_location.id, 'sku_id': sku.id, 'reason': 'scan'}
+            for day, delta in ((5, 10), (20, -4), (25, 2))])
+        db.commit()
+        with HoneyApp(argv=['stock', 'snapshot', '--at', '2026-01-10'],
+                      hooks=hooks) as app:
+            app.run()
+        assert db.query(StockSnapshot).one().records == 1
+
+        def quantity(day):
+            rows = db.execute(StockSnapshot.as_of(
+                db, pendulum.datetime(2026, 1, day), [inventory_location.id]))
+            return [row.quantity for row in rows]
+
+        assert [quantity(day) for day in (1, 10, 20, 31)] == [[], [10], [6], [8]]
+        InventoryMovement.compact(db, pendulum.datetime(2026, 1, 25))
+        db.commit()
+        assert [quantity(day) for day in (10, 20, 25)] == [[10], [10], [8]]
+        argv = ['report', 'warehouse', '--as-of', '2026-01-10']
+        with HoneyApp(argv=argv, hooks=hooks, output_handler='tabulate') as app:
+            app.run()
+            data, output = app.last_rendered
+            assert data[0][-1] == 10
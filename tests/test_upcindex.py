@@ -0,0 +1,58 @@
+from honey.core.upcindex import UpcIndex
+from honey.models.skus import ProductSku
+
+
+class TestUpcIndex:
+    """
+    UPC lookup index tests.
+    """
+
+    def test_upc_index_get(self, HoneyApp, hooks, db, sku):
+        """
+        Test the index resolves a upc without hitting the database
+        :return:
+        """
+        with HoneyApp(hooks=hooks) as app:
+            upc_index = UpcIndex(app).load()
+            entry = upc_index.get(sku.upc)
+            assert entry.id == sku.id
+            assert entry.sku == sku.sku
+            assert upc_index.hits == 1
+            assert upc_index.misses == 0
+            assert upc_index.get('not-a-upc') is None
+            assert upc_index.get('not-a-upc') is None
+            assert upc_index.misses == 1
+
+    def test_upc_index_invalidated_on_commit(self, HoneyApp, hooks, db, sku):
+        """
+        Test a committed ProductSku insert invalidates the index
+        :return:
+        """
+        with HoneyApp(hooks=hooks) as app:
+            upc_index = UpcIndex(app).load()
+            assert not upc_index.stale
+            new_sku = ProductSku('Z9-W-L', 'upc-z9', 'a new sku', sku.entity_id,
+                                 sku.container_id)
+            app.session.add(new_sku)
+            app.session.commit()
+            assert upc_index.stale
+            assert upc_index.get('upc-z9').sku == 'Z9-W-L'
+            assert 'upc-z9' in upc_index
+
+    def test_upc_index_version_invalidates_stations(self, HoneyApp, hooks, db, sku):
+        """
+        Test a shared index reloads when another station writes a new version
+        :return:
+        """
+        with HoneyApp(hooks=hooks) as app:
+            upc_index = UpcIndex(app, shared=True).load()
+            try:
+                assert not upc_index.check_version()
+                # another station invalidated the shared index
+                app.cache.set(upc_index.version_key, 'another-version')
+                assert upc_index.check_version()
+                assert upc_index.get(sku.upc).id == sku.id
+                assert upc_index.version == 'another-version'
+            finally:
+                app.cache.delete(upc_index.cache_key)
+                app.cache.delete(upc_index.version_key)
@@ -1,5 +1,6 @@
 
 from honey.models.inventory import Warehouse
+from honey.core.context import get_active_context, context_key, clear_active_context
 
 
 class TestWarehouse:
@@ -88,4 +89,22 @@ class TestWarehouse:
             assert 'testGarage' in app.cache.get(wh_cache_key)
             app.run()
             # the cache key is unset in redis
-            assert app.cache.get(wh_cache_key) is None
\ No newline at end of file
+            assert app.cache.get(wh_cache_key) is None
+
+    def test_warehouse_activate_context(self, HoneyApp, hooks, db, inventory_location):
+        """
+        Test `honey warehouse activate -l HG-1 -s station` stores the context record
+        :return:
+        """
+        location_id = inventory_location.id
+        argv = ['warehouse', 'activate', 'testGarage', '-l', 'hg-1', '-s', 'station']
+        with HoneyApp(argv=argv, hooks=hooks) as app:
+            app.run()
+            context = get_active_context(app)
+            assert context.warehouse == 'testGarage'
+            assert (context.location_id, context.location) == (location_id, 'HG-1')
+            assert app.cache.get(context_key(app, 'global')) is None
+            assert Warehouse.get_active_warehouse(app).name == 'testGarage'
+            # teardown
+            assert clear_active_context(app, 'station') == context
+            assert get_active_context(app) is None